@@ -3,16 +3,26 @@ from flask_cors import CORS # 1. 导入CORS
 # 注册蓝图
 from .api.analysis_routes import analysis_bp
 from .api.agent_routes import agent_bp
+from .api.metrics_routes import metrics_bp
+from .toolkit.prompt_compiler import compile_static_sections
+from .utils.logging_config import setup_logging
 def create_app():
     """创建并配置Flask应用实例。"""
+    # 日志在后台线程中异步输出，请求处理线程不等待日志 I/O
+    setup_logging()
     app = Flask(__name__)
     
     # 从config模块加载配置
     app.config.from_object('app.config')
     
     
-    CORS(app) 
+    # 暴露二进制波形接口的解码信息响应头，供浏览器端读取
+    CORS(app, expose_headers=['X-Waveform-Dtype', 'X-Waveform-Scale', 'X-Waveform-Length', 'X-Sample-Rate'])
     app.register_blueprint(analysis_bp)
     app.register_blueprint(agent_bp)
+    app.register_blueprint(metrics_bp)
+
+    # 预编译提示词中的静态部分（知识库、工具定义）
+    compile_static_sections()
     
     return app
\ No newline at end of file
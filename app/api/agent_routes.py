@@ -1,137 +1,286 @@
 from flask import Blueprint, request, jsonify
-from app.services.zhipuai_client import get_glm_response
+from app.services.zhipuai_client import get_glm_response, stream_glm_response
 from app.toolkit.metric_tools import AVAILABLE_TOOLS
 from app.state import SESSIONS
 import json
-from app.config import ZHIPU_API_TOKEN, GLM_API_URL, GLM_MODEL_NAME
-import requests
-from app.toolkit.knowledge import get_knowledge_for_prompt
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.config import INTENT_ROUTER_ENABLED, AGENT_WARMUP_ENABLED, AGENT_WARMUP_QUESTIONS
+from app.services.answer_cache import answer_cache
+from app.services.report_scheduler import report_scheduler
+from app.toolkit.intent_router import intent_router
+from app.utils.metrics import STAGE_SECONDS, stage_timer
+from app.utils.request_controller import PRIORITY_IDLE, PRIORITY_INTERACTIVE, RateLimitExceeded
+from app.toolkit.prompt_compiler import AGENT_TOOLS_SCHEMA, agent_planning_messages, chat_messages
+from app.utils.sse import sse_event, sse_response
 agent_bp = Blueprint('agent', __name__)
+logger = logging.getLogger(__name__)
 
+# 会改变会话状态的工具：预热常见问题时不能执行，它们的结果也不进入回答缓存
+_SESSION_MUTATING_TOOLS = ('tool_reset_session',)
 
-@agent_bp.route('/agent', methods=['POST'])
-def agent_endpoint():
-    data = request.get_json()
+# 报告生成后预先回答常见问题的线程（单线程，不与报告生成争抢调度器的工作线程）
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='agent-warmup')
+
+
+def _check_agent_request(data):
+    """校验请求体，返回 (session_id, user_prompt, 错误)；错误为 (响应体, 状态码) 或 None。"""
+    data = data or {}
     session_id, user_prompt = data.get('session_id'), data.get('prompt')
 
-    if not all([session_id, user_prompt]): return jsonify({"error": "请求中缺少 session_id 或 prompt"}), 400
-    if session_id not in SESSIONS: return jsonify({"error": "无效的 session_id"}), 400
+    if not all([session_id, user_prompt]): return session_id, user_prompt, ({"error": "请求中缺少 session_id 或 prompt"}, 400)
     session = SESSIONS.get(session_id)
+    if session is None: return session_id, user_prompt, ({"error": "无效的 session_id"}, 400)
     if session['status'] != 'ready':
-        return jsonify({
+        return session_id, user_prompt, ({
             "error": "报告仍在生成中，请稍等片刻后再进行问答。",
             "status": session['status']
-        }), 422 # 422 Unprocessable Entity, 表示请求格式正确但服务器无法处理
-    # 【修改】将工具定义回归到简单版本
-    tools_schema = [
-        {"type": "function", "function": {"name": "tool_get_full_analysis_report", "description": "当用户想要一份完整、详细的文本格式健康分析报告时调用。"}},
-        {"type": "function", "function": {"name": "tool_reset_session", "description": "当用户想要清除数据并重新开始时调用。"}},
-        {
-            "type": "function",
-            "function": {
-                "name": "tool_get_specific_metric",
-                "description": "在理解用户问题后，用于查询单个标准化健康指标的数值。",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "metric_name": {
-                            "type": "string",
-                            "description": "从下面的知识库中选择的最匹配用户问题的、标准化的指标键名，例如 'HR', 'HRV'。"
-                        }
-                    },
-                    "required": ["metric_name"]
-                }
-            }
-        }
-    ]
-
-    # 【修改】构建包含知识库的、更强大的System Prompt
-    knowledge_str = get_knowledge_for_prompt()
-    system_prompt = (
-        "你是一个顶级的健康数据分析助手。你的任务是：\n"
-        "1. 理解用户的自然语言提问。\n"
-        "2. 参考下面提供的“可用指标知识库”，分析出用户问题涉及到哪些具体的指标。\n"
-        "3. 决定是否需要以及如何调用一个或多个工具来回答问题。\n"
-        "4. 如果一个模糊问题（如“心脏稳定吗”）关联到多个指标，你应该为每个相关指标都发起一次独立的工具调用。\n\n"
-        f"--- 可用指标知识库 ---\n{knowledge_str}\n"
-        "--- End of Knowledge Base ---"
-    )
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ]
+        }, 422) # 422 Unprocessable Entity, 表示请求格式正确但服务器无法处理
+    return session_id, user_prompt, None
+
+
+def _validate_agent_request(data):
+    """校验请求体，返回 (session_id, user_prompt, 错误响应)。"""
+    session_id, user_prompt, error = _check_agent_request(data)
+    return session_id, user_prompt, (jsonify(error[0]), error[1]) if error else None
+
+
+def _query_metrics(session_id, metric_names):
+    """批量查询指标，拼成与工具调用结果一致的回答文本。"""
+    results = []
+    for metric_name in metric_names:
+        # 直接调用工具函数，因为它已经包含了查询单项指标的逻辑
+        results.append(AVAILABLE_TOOLS['tool_get_specific_metric'](
+            session_id=session_id,
+            metric_name=metric_name
+        ))
+    return "根据您的提问，查询到以下最相关的指标信息：\n" + "\n".join(results)
+
+
+def _route_locally(session_id, user_prompt):
+    """单纯的指标查询和报告请求在本地直接回答，不占用GLM的速率配额。识别不了时返回 None。"""
+    with stage_timer('intent_route'):
+        intent = intent_router.route(user_prompt) if INTENT_ROUTER_ENABLED else None
+    if not intent:
+        return None
+    logger.info("Intent routed locally", extra={'session_id': session_id, 'intent': intent})
+    kind, target = intent
+    if kind == 'metrics':
+        return _query_metrics(session_id, target)
+    return AVAILABLE_TOOLS[target](session_id=session_id)
+
+
+def _record_glm_plan(seconds: float):
+    intent_router.record_glm_plan(seconds)
+    STAGE_SECONDS.observe(seconds, stage='glm_plan')
+
+
+def _plan_agent_reply(session_id, user_prompt, priority=PRIORITY_INTERACTIVE):
+    """
+    决定是调用工具还是直接闲聊：先尝试本地意图路由，识别不了再由第一次LLM调用决定。
+    预热（priority=PRIORITY_IDLE）时不执行会改变会话状态的工具。
+
+    Returns:
+        ('tool_result', 文本)：工具已执行完毕，文本即为最终回答；
+        ('chat', messages)：需要用 messages 再发起一次不带工具的对话调用；
+        ('skipped', 工具名)：仅预热时出现，GLM选择了会改变会话状态的工具，没有执行。
+    """
+    routed = _route_locally(session_id, user_prompt)
+    if routed is not None:
+        return 'tool_result', routed
+
+    plan_start = time.time()
+    glm_response = get_glm_response(messages=agent_planning_messages(user_prompt), tools=AGENT_TOOLS_SCHEMA,
+                                    priority=priority)
+    _record_glm_plan(time.time() - plan_start)
+    return _plan_from_glm_response(session_id, user_prompt, glm_response,
+                                   allow_session_changes=priority != PRIORITY_IDLE)
+
+
+def _plan_from_glm_response(session_id, user_prompt, glm_response, allow_session_changes=True):
+    """根据第一次（带工具的）LLM调用的结果执行工具，或准备闲聊所需的 messages。返回值同 _plan_agent_reply。"""
+    choice = glm_response['choices'][0]
+
+    if choice['finish_reason'] == 'tool_calls':
+        tool_calls = choice['message']['tool_calls']
+
+        # 1. 收集所有需要查询的指标名称，并自动去重
+        metrics_to_query = set()
+        for tool_call in tool_calls:
+            if tool_call['function']['name'] == 'tool_get_specific_metric':
+                arguments = json.loads(tool_call['function']['arguments'])
+                metric_name = arguments.get('metric_name')
+                if metric_name:
+                    metrics_to_query.add(metric_name)
+
+        # 2. 如果识别出需要查询的指标，则统一调用一次查询逻辑
+        if metrics_to_query:
+            return 'tool_result', _query_metrics(session_id, sorted(metrics_to_query)) # 排序使输出稳定
+
+        # 其他不带参数的工具（完整报告、重置会话）直接按名称调用
+        tool_name = tool_calls[0]['function']['name']
+        if tool_name in _SESSION_MUTATING_TOOLS and not allow_session_changes:
+            return 'skipped', tool_name
+        if tool_name in AVAILABLE_TOOLS:
+            return 'tool_result', AVAILABLE_TOOLS[tool_name](session_id=session_id)
+
+    # 【修改】情况B: 上下文感知闲聊
+    logger.info("No tool called, performing context-aware chat", extra={'session_id': session_id})
+
+    # 1. 构建包含健康数据的系统提示（紧凑表格，受 token 预算限制）
+    session_data = SESSIONS.get(session_id, {})
+    full_analysis = session_data.get('full_analysis', {})
+
+    # 2. 第二次、不带工具的LLM调用由调用方发起（普通或流式）
+    return 'chat', chat_messages(full_analysis, user_prompt)
+
+
+def _answer_prompt(session_id, user_prompt, priority=PRIORITY_INTERACTIVE):
+    """完整地回答一个问题（闲聊时再发起第二次不带工具的调用），返回 (回答类型, 回答文本)。"""
+    kind, result = _plan_agent_reply(session_id, user_prompt, priority)
+    if kind != 'chat':
+        return kind, result
+    # 与第一次调用共享同一个速率配额
+    chat_data = get_glm_response(messages=result, priority=priority)
+    return 'text', chat_data['choices'][0]['message']['content']
+
+
+def _lookup_answer(session_id, user_prompt):
+    """查询回答缓存，返回 (缓存键, 命中的 (回答类型, 回答文本) 或 None)；会话不存在时键为 None。"""
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return None, None
+    key = answer_cache.key_for(session_id, session, user_prompt)
+    return key, answer_cache.get(key)
+
+
+def _remember_answer(key, session_id, kind, text, warmup=False):
+    """缓存一次完整的回答。会话已不存在（例如刚被重置）时不缓存。"""
+    if key is not None and session_id in SESSIONS:
+        answer_cache.put(key, kind, text, warmup=warmup)
+
+
+def _cached_answer_events(kind, text):
+    """/agent/stream 命中缓存时的事件：工具结果为一个 message 事件，闲聊回答为一个 delta 事件加 done 事件。"""
+    if kind == 'tool_result':
+        return [sse_event('message', {"response": text, "type": kind, "cached": True})]
+    return [sse_event('delta', {"text": text}), sse_event('done', {"response": text, "type": kind, "cached": True})]
+
+
+def _warm_up_answers(session_id):
+    """
+    预先回答 AGENT_WARMUP_QUESTIONS 中的常见问题并放入回答缓存。
+    只使用GLM速率配额中空闲的令牌：有报告任务在排队、配额不空闲或会话已不存在时立即停止。
+    """
+    warmed = 0
+    for question in AGENT_WARMUP_QUESTIONS:
+        session = SESSIONS.get(session_id)
+        if session is None or session['status'] != 'ready' or report_scheduler.stats()['queued']:
+            break
+        key = answer_cache.key_for(session_id, session, question)
+        if key in answer_cache:
+            continue
+        try:
+            kind, answer = _answer_prompt(session_id, question, priority=PRIORITY_IDLE)
+        except RateLimitExceeded:
+            break
+        except Exception as e:
+            logger.warning("预热常见问题失败: %s", e, extra={'session_id': session_id})
+            break
+        if kind != 'skipped':
+            _remember_answer(key, session_id, kind, answer, warmup=True)
+            warmed += 1
+    logger.info("常见问题预热结束", extra={'session_id': session_id, 'warmed': warmed,
+                                         'questions': len(AGENT_WARMUP_QUESTIONS)})
+
+
+def _schedule_answer_warmup(session_id):
+    """会话就绪（报告已生成）后调用：启用了预热时，在后台预先回答常见问题。"""
+    if AGENT_WARMUP_ENABLED and AGENT_WARMUP_QUESTIONS:
+        _warmup_executor.submit(_warm_up_answers, session_id)
+
+
+def _rate_limit_error(e):
+    """速率限制错误的响应体与 Retry-After 秒数。"""
+    return {"error": str(e), "retry_after": round(e.retry_after, 1)}, max(1, int(e.retry_after + 0.999))
+
+
+def _rate_limited_response(e):
+    body, retry_after = _rate_limit_error(e)
+    response = jsonify(body)
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+@agent_bp.route('/agent', methods=['POST'])
+def agent_endpoint():
+    session_id, user_prompt, error = _validate_agent_request(request.get_json())
+    if error: return error
+
+    # 同一会话中重复的问题直接返回缓存的回答，不占用GLM配额
+    key, cached = _lookup_answer(session_id, user_prompt)
+    if cached:
+        return jsonify({"response": cached[1], "type": cached[0], "cached": True})
 
     try:
-        glm_response = get_glm_response(messages=messages, tools=tools_schema)
-        choice = glm_response['choices'][0]
-
-        if choice['finish_reason'] == 'tool_calls':
-            tool_calls = choice['message']['tool_calls']
-            
-            # --- 【新增】优化逻辑开始 ---
-            
-            # 1. 收集所有需要查询的指标名称，并自动去重
-            metrics_to_query = set()
-            for tool_call in tool_calls:
-                if tool_call['function']['name'] == 'tool_get_specific_metric':
-                    arguments = json.loads(tool_call['function']['arguments'])
-                    metric_name = arguments.get('metric_name')
-                    if metric_name:
-                        metrics_to_query.add(metric_name)
-
-            # 2. 如果识别出需要查询的指标，则统一调用一次查询逻辑
-            if metrics_to_query:
-                # 调用一个辅助函数来批量获取结果 (或者直接在此处实现)
-                # 这里我们直接实现
-                session_id = request.get_json().get('session_id')
-                results = []
-                for metric_name in sorted(list(metrics_to_query)): # 排序使输出稳定
-                    # 直接调用工具函数，因为它已经包含了查询单项指标的逻辑
-                    result_str = AVAILABLE_TOOLS['tool_get_specific_metric'](
-                        session_id=session_id, 
-                        metric_name=metric_name
-                    )
-                    results.append(result_str)
-                
-                final_response = f"根据您的提问，查询到以下最相关的指标信息：\n" + "\n".join(results)
-                return jsonify({"response": final_response, "type": "tool_result"})
-
-            # (可选) 处理其他类型的工具调用，例如报告生成
-            elif tool_calls[0]['function']['name'] == 'tool_get_full_analysis_report':
-                 result = AVAILABLE_TOOLS['tool_get_full_analysis_report'](session_id=session_id)
-                 return jsonify({"response": result, "type": "tool_result"})
-            
-            # --- 优化逻辑结束 ---
-        
-        else:
-            # 【修改】情况B: 上下文感知闲聊
-            print("--- No tool called. Performing context-aware chat. ---")
-            
-            # 1. 构建包含健康数据的系统提示
-            session_data = SESSIONS.get(session_id, {})
-            full_analysis = session_data.get('full_analysis', {})
-            # 为了简洁，我们只提取部分核心数据作为上下文
-            health_index = full_analysis.get('HealthIndex', {})
-            features = full_analysis.get('Features', {})
-            context_summary = {**features, **health_index}
-            
-            system_prompt = f"你是一名专业的健康顾问。请根据以下用户的已知健康数据摘要，来回答用户的问题。摘要：{context_summary}"
-            
-            # 2. 发起第二次、不带工具的LLM调用
-            contextual_messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            chat_payload = {"model": GLM_MODEL_NAME, "messages": contextual_messages}
-            
-            chat_response = requests.post(GLM_API_URL, headers={'Authorization': f'Bearer {ZHIPU_API_TOKEN}'}, json=chat_payload)
-            chat_response.raise_for_status()
-            chat_data = chat_response.json()
-            
-            direct_answer = chat_data['choices'][0]['message']['content']
-            return jsonify({"response": direct_answer, "type": "text"})
+        kind, answer = _answer_prompt(session_id, user_prompt)
+        _remember_answer(key, session_id, kind, answer)
+        return jsonify({"response": answer, "type": kind})
+
+    except RateLimitExceeded as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.exception("Agent-GLM交互出错: %s", e)
+        return jsonify({"error": f"与AI代理交互时出错: {e}"}), 500
+
 
+@agent_bp.route('/agent/router-stats', methods=['GET'])
+def router_stats_endpoint():
+    """本地意图路由的命中率与节省的GLM请求/时间。"""
+    return jsonify(intent_router.stats())
+
+
+@agent_bp.route('/agent/stream', methods=['POST'])
+def agent_stream_endpoint():
+    """
+    /agent 的 SSE 版本：闲聊回答以 delta 事件逐段推送，结束时发送 done 事件（含完整文本）；
+    工具调用的结果一次性以 message 事件返回。出错时发送 error 事件。
+    """
+    session_id, user_prompt, error = _validate_agent_request(request.get_json())
+    if error: return error
+
+    key, cached = _lookup_answer(session_id, user_prompt)
+    if cached:
+        return sse_response(iter(_cached_answer_events(*cached)))
+
+    # 工具决策在建立事件流之前完成，这样速率限制仍然可以返回普通的 429
+    try:
+        kind, result = _plan_agent_reply(session_id, user_prompt)
+    except RateLimitExceeded as e:
+        return _rate_limited_response(e)
     except Exception as e:
-        print(f"Agent-GLM交互出错: {e}")
-        return jsonify({"error": f"与AI代理交互时出错: {e}"}), 500
\ No newline at end of file
+        logger.exception("Agent-GLM交互出错: %s", e)
+        return jsonify({"error": f"与AI代理交互时出错: {e}"}), 500
+
+    def events():
+        if kind == 'tool_result':
+            _remember_answer(key, session_id, kind, result)
+            yield sse_event('message', {"response": result, "type": "tool_result"})
+            return
+        chunks = []
+        try:
+            for delta in stream_glm_response(messages=result):
+                chunks.append(delta)
+                yield sse_event('delta', {"text": delta})
+        except RateLimitExceeded as e:
+            yield sse_event('error', _rate_limit_error(e)[0])
+            return
+        except Exception as e:
+            logger.exception("Agent-GLM交互出错: %s", e)
+            yield sse_event('error', {"error": f"与AI代理交互时出错: {e}"})
+            return
+        _remember_answer(key, session_id, 'text', ''.join(chunks))
+        yield sse_event('done', {"response": ''.join(chunks), "type": "text"})
+
+    return sse_response(events())
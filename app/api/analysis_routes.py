@@ -1,126 +1,679 @@
 import uuid
+import logging
+import math
+import os
 import time
-import threading
+from flask import Blueprint, Response, request, jsonify
+import numpy as np
 import requests
-from flask import Blueprint, request, jsonify
-import json
 # 从我们自己的模块中导入所需的内容
-from app.utils.data_processor import process_ecg_signal_from_file
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.data_processor import (
+    check_signal_quality,
+    playback_from_resampled,
+    process_ecg_signal_from_file,
+    should_stream
+)
+from app.utils.ecg_features import InsufficientBeatsError, compute_ecg_features
+from app.utils.leads import DERIVED_LEADS, LeadSelectionError, lead_index, parse_lead
+from app.utils.metrics import stage_timer
+from app.utils.signal_quality import SignalQualityError
+from app.utils.waveform_pyramid import WaveformPyramid
+from app.utils.waveform_codec import WAVEFORM_DTYPES, WAVEFORM_ENCODINGS, encode_waveform, waveform_to_bytes
 from app.state import SESSIONS
-from app.config import HEARTVOICE_API_URL, TARGET_SAMPLING_RATE
-from app.services.zhipuai_client import get_glm_response
+from app.config import (
+    HEARTVOICE_METHOD,
+    ANALYSIS_MODE,
+    HEARTVOICE_SYNC_TIMEOUT_S,
+    HEARTVOICE_ENRICH_WORKERS,
+    BATCH_MAX_FILES,
+    BATCH_HEARTVOICE_CONCURRENCY,
+    BATCH_STREAM_WORKERS,
+    LIVE_STREAM_BUFFER_SECONDS,
+    ORIGINAL_SAMPLING_RATE,
+    TARGET_SAMPLING_RATE,
+    WAVEFORM_PYRAMID_FACTOR,
+    WAVEFORM_DEFAULT_MAX_POINTS,
+    WAVEFORM_MAX_POINTS_LIMIT,
+    SSE_POLL_INTERVAL_S,
+    SSE_MAX_DURATION_S,
+    SSE_MAX_CONNECTIONS
+)
+from app.api.agent_routes import _schedule_answer_warmup
+from app.services.zhipuai_client import stream_glm_response
+from app.services.report_stream import report_stream_hub
+from app.utils.sse import ConnectionLimiter, sse_event, sse_response
+from app.utils.request_controller import PRIORITY_BACKGROUND
+from app.services.heartvoice import HeartVoiceError, analyze_with_heartvoice
+from app.services.live_stream import LiveStreamClosedError, LiveStreamLimitError, live_streams
+from app.services.processing_pool import get_processing_pool, process_ecg_file, reset_processing_pool, spool_upload
+from app.services.report_scheduler import QueueFullError, report_scheduler
+from app.services.result_cache import analysis_cache, make_analysis_key
+from app.services.report_cache import report_cache
+from app.toolkit.prompt_compiler import report_messages
+from app.toolkit.metric_tools import reset_session
 
 # 创建一个名为 'analysis' 的蓝图
 analysis_bp = Blueprint('analysis', __name__)
+logger = logging.getLogger(__name__)
+
+# 实时流：允许的最高原始采样率、二进制上传每次读取的字节数，以及结束时至少需要的时长（秒）
+_LIVE_MAX_SAMPLE_RATE = 2000
+_LIVE_READ_BYTES = 64 * 1024
+_LIVE_MIN_SECONDS = 10
+
+# 事件流在这么多秒内没有推送任何内容时发送一条注释行，防止代理因空闲断开连接
+_SSE_KEEPALIVE_S = 15
+# 本进程中由 Flask 处理的事件流（异步服务模式下这些接口原生异步处理，不经过这里）
+_sse_connections = ConnectionLimiter(SSE_MAX_CONNECTIONS)
+
+# 请求内等待HeartVoice的总时长上限：同步分析模式下超时即回退本地特征引擎，不让上传请求卡上一分多钟；
+# 异步模式只有本地引擎无法分析时才在请求内调用HeartVoice，此时没有可回退的结果，使用上游的默认上限
+_INLINE_HEARTVOICE_MAX_ELAPSED = HEARTVOICE_SYNC_TIMEOUT_S if ANALYSIS_MODE == 'sync' else None
+
+# 异步分析模式下，在后台调用HeartVoice补全本地分析结果的线程池
+_enrich_executor = ThreadPoolExecutor(max_workers=HEARTVOICE_ENRICH_WORKERS, thread_name_prefix='heartvoice-enrich')
+
+# 批量分析中超过流式阈值的大文件在本进程中流式处理（落盘 + memmap）的线程池，
+# 与HeartVoice请求的线程池分开，大文件的读取不会占用上游请求的并发名额
+_stream_ingest_executor = ThreadPoolExecutor(max_workers=BATCH_STREAM_WORKERS, thread_name_prefix='batch-stream')
 
 
 def _generate_report_and_update_status(session_id: str):
     """
-    这是一个在后台线程中运行的函数。
+    这是一个由报告调度器在工作线程中运行的函数。
     它负责调用LLM生成报告，并在完成后更新会话状态。
     """
-    print(f"[{time.strftime('%H:%M:%S')}] 后台报告生成任务已启动，会话ID: {session_id}")
+    logger.info("后台报告生成任务已启动", extra={'session_id': session_id})
     
-    # 使用 with 语句确保即使发生错误，也能安全地访问会话
     session = SESSIONS.get(session_id)
     if not session:
-        print(f"[{time.strftime('%H:%M:%S')}] 错误：后台任务无法找到会话 {session_id}")
+        logger.error("后台任务无法找到会话", extra={'session_id': session_id})
         return
 
     try:
-        # 1. 准备用于生成报告的数据和Prompt
-        full_api_data = session['full_analysis']
-        # 在这里可以构建一个更详细的prompt，利用我们之前创建的知识库
-        prompt = (
-            "你是一名专业的心脏健康数据分析师HeartTalk。请根据以下提供的心电图（ECG）详细分析数据，"
-            "为用户生成一份专业、简洁且通俗易懂的健康总结报告。"
-            "报告应分点阐述，并给出一个总体的健康建议。请使用Markdown格式化你的回答。\n\n"
-            f"--- 分析数据摘要 ---\n{json.dumps(full_api_data, indent=2, ensure_ascii=False)}"
-        )
+        # 1. 准备用于生成报告的数据和Prompt（紧凑表格，受 token 预算限制）
+        messages = report_messages(session['full_analysis'])
         
-        # 2. 调用LLM服务
-        report_data = get_glm_response(messages=[{"role": "user", "content": prompt}])
-        report_text = report_data['choices'][0]['message']['content']
+        # 2. 以流式方式调用LLM服务，边生成边推送给订阅了状态事件流的前端
+        def generate():
+            report_stream_hub.open(session_id)
+            chunks = []
+            for delta in stream_glm_response(messages=messages, priority=PRIORITY_BACKGROUND):
+                chunks.append(delta)
+                report_stream_hub.publish(session_id, delta)
+            return ''.join(chunks)
+
+        # 相同分析数据的报告只生成一次：已有报告直接复用，正在生成时等待同一次生成的结果
+        with stage_timer('report_generation'):
+            report_text = report_cache.get_or_generate(report_cache.key_for(session_id, session), generate)
         
-        # 3. 【关键】报告生成成功后，更新会话状态
-        session['report'] = report_text
-        session['status'] = 'ready' # 将状态更新为“已就绪”
+        # 3. 【关键】报告生成成功后，原子地把状态更新为“已就绪”（会话可能已被重置）
+        if not SESSIONS.transition(session_id, 'generating_report', 'ready', report=report_text):
+            logger.info("会话已被重置或状态已变化，丢弃生成的报告", extra={'session_id': session_id})
+            return
         
-        print(f"[{time.strftime('%H:%M:%S')}] 报告已生成，会话 {session_id} 状态更新为 'ready'")
+        logger.info("报告已生成，会话状态更新为 'ready'", extra={'session_id': session_id})
+        # 报告生成占用的GLM配额已经归还调度，趁空闲预先回答常见问题
+        _schedule_answer_warmup(session_id)
 
     except Exception as e:
-        print(f"[{time.strftime('%H:%M:%S')}] 后台报告生成失败 for session {session_id}: {e}")
+        logger.exception("后台报告生成失败: %s", e, extra={'session_id': session_id})
         # 如果发生错误，也更新状态，方便前端处理
-        session['status'] = 'error'
-        session['report'] = f"AI报告生成失败，错误信息: {e}"
+        SESSIONS.transition(session_id, 'generating_report', 'error', report=f"AI报告生成失败，错误信息: {e}")
+    finally:
+        # 必须在状态更新之后关闭，订阅者被唤醒时才能读到最终报告
+        report_stream_hub.close(session_id)
+
+
+def _schedule_report(session_id: str) -> dict:
+    """提交报告任务并记录预计完成时间，返回排队信息。队列已满时抛出 QueueFullError。"""
+    queue_info = report_scheduler.submit(session_id, _generate_report_and_update_status)
+    SESSIONS.update(session_id, report_eta_at=time.time() + queue_info['eta_seconds'])
+    return queue_info
+
+
+def _enrich_and_schedule_report(session_id: str, resampled_signal, analysis_key: str):
+    """
+    异步分析模式的后台任务：调用HeartVoice替换会话中的本地分析结果，然后提交报告任务。
+    HeartVoice失败时保留本地结果，报告基于本地结果生成。
+    """
+    try:
+        full_api_data = analyze_with_heartvoice(resampled_signal)
+        analysis_cache.put(analysis_key, full_api_data)
+        if not SESSIONS.update(session_id, full_analysis=full_api_data, analysis_source='heartvoice', analysis_key=analysis_key):
+            return  # 会话已被重置
+        logger.info("会话已用HeartVoice结果补全", extra={'session_id': session_id})
+    except Exception as e:
+        logger.warning("HeartVoice补全失败（%s），会话保留本地分析结果", e, extra={'session_id': session_id})
+
+    if session_id not in SESSIONS:
+        return
+    try:
+        _schedule_report(session_id)
+    except QueueFullError as e:
+        SESSIONS.transition(session_id, 'generating_report', 'error', report=f"AI报告生成失败，错误信息: {e}")
+
+
+def _dashboard_metrics(full_api_data: dict) -> dict:
+    """提取仪表盘所需指标。"""
+    health_index = full_api_data.get('HealthIndex', {})
+    dashboard_metrics = {
+        'HR': full_api_data.get('Features', {}).get('HR'),
+        'Pressure': health_index.get('Pressure'),
+        'HRV': health_index.get('HRV'),
+        'Emotion': health_index.get('Emotion'),
+        'Fatigue': health_index.get('Fatigue'),
+        'Vitality': health_index.get('Vitality')
+    }
+    return {k: (float(v) if v is not None and not isinstance(v, str) else v) for k, v in dashboard_metrics.items()}
+
+
+def _lookup_analysis(resampled_signal) -> dict:
+    """
+    步骤2的本地部分：查分析缓存；异步分析模式下先用本地特征引擎给出结果。
+
+    Returns:
+        dict: key、data（None 表示还需要调用HeartVoice）、report（缓存中的报告）、source、enrich。
+    """
+    with stage_timer('analysis_cache_lookup'):
+        analysis_key = make_analysis_key(resampled_signal, TARGET_SAMPLING_RATE, HEARTVOICE_METHOD)
+        cached = analysis_cache.get(analysis_key)
+    if cached:
+        return {'key': analysis_key, 'data': cached['data'], 'report': cached['report'], 'source': 'heartvoice', 'enrich': False}
+
+    analysis = {'key': analysis_key, 'data': None, 'report': None, 'source': 'heartvoice', 'enrich': False}
+    if ANALYSIS_MODE == 'async':
+        # 快速路径：本地特征引擎立即给出心率/HRV，HeartVoice在后台补全后再生成报告
+        try:
+            with stage_timer('local_features'):
+                analysis['data'] = compute_ecg_features(resampled_signal)
+            analysis.update(source='local', enrich=True)
+        except InsufficientBeatsError as e:
+            logger.info("本地特征引擎无法分析该记录（%s），等待HeartVoice结果", e)
+    return analysis
+
+
+class AnalysisUnavailableError(RuntimeError):
+    """HeartVoice不可用，而本地特征引擎也无法分析这条记录（如心率超出本地引擎支持的范围）。"""
+
+
+def _fall_back_to_local(analysis: dict, resampled_signal, error):
+    """
+    上游超时或不可用时回退到本地特征引擎（结果不进入缓存，下次仍会尝试HeartVoice）。
+
+    Raises:
+        AnalysisUnavailableError: 本地特征引擎也无法分析该记录。
+    """
+    logger.warning("HeartVoice不可用（%s），改用本地特征引擎", error)
+    try:
+        with stage_timer('local_features'):
+            analysis['data'] = compute_ecg_features(resampled_signal)
+    except InsufficientBeatsError as e:
+        logger.warning("本地特征引擎也无法分析该记录（%s）", e)
+        raise AnalysisUnavailableError(f"HeartVoice分析服务暂不可用，且本地特征引擎无法分析该记录（{e}），请稍后重试") from e
+    analysis['source'] = 'local'
+
+
+def _resolve_analysis(resampled_signal) -> dict:
+    """步骤2: 调用外部HeartVoice API获取专业分析数据（相同的信号直接命中缓存，跳过网络请求）。"""
+    analysis = _lookup_analysis(resampled_signal)
+    if analysis['data'] is None:
+        try:
+            analysis['data'] = analyze_with_heartvoice(resampled_signal, max_elapsed=_INLINE_HEARTVOICE_MAX_ELAPSED)
+            analysis_cache.put(analysis['key'], analysis['data'])
+        except (requests.exceptions.RequestException, HeartVoiceError) as e:
+            _fall_back_to_local(analysis, resampled_signal, e)
+    return analysis
+
+
+def _create_analysis_session(resampled_signal, playback_waveform, quality_report=None, analysis=None, leads=None) -> dict:
+    """
+    对一条已经重采样的信号完成分析并创建会话（/analyze 与 /analyze/batch 共用）。
+    analysis 为已经得到的 _resolve_analysis 结果（异步服务模式在事件循环中获取），省略时在这里同步获取。
+    leads 为 process_ecg_signal_from_file 返回的多导联信息，逐导联播放波形随会话保存，供 /waveform?lead= 查询。
+
+    Returns:
+        dict: session_id、status、queue、analysis_source、signal_quality 与仪表盘指标 initialAnalysis；
+        多导联记录另有 leads（导联数、名称、用于分析的导联及其权重）。
+
+    Raises:
+        QueueFullError: 报告队列已满（会话不会被保留）。
+        AnalysisUnavailableError: HeartVoice不可用且本地特征引擎无法分析（不会创建会话）。
+    """
+    if analysis is None:
+        analysis = _resolve_analysis(resampled_signal)
+    analysis_key, full_api_data, cached_report = analysis['key'], analysis['data'], analysis['report']
+    analysis_source, enrich = analysis['source'], analysis['enrich']
+    
+    # 步骤3: 创建会话并设置初始状态（缓存中已有报告时直接就绪）
+    session_id = str(uuid.uuid4())
+    status = 'ready' if cached_report else 'generating_report'
+    lead_summary = {k: v for k, v in leads.items() if k != 'playback'} if leads else None
+    fields = {
+        'status': status,  # 【关键点】初始状态
+        'full_analysis': full_api_data,
+        'analysis_source': analysis_source,
+        'signal_quality': quality_report,
+        # 本地结果的报告单独缓存，不与HeartVoice结果的报告混用
+        'analysis_key': analysis_key if analysis_source == 'heartvoice' else f"{analysis_key}:local",
+        'report': cached_report
+    }
+    artifacts = {
+        'playback_waveform': playback_waveform,
+        # 基于完整信号（不截断）构建的缩放金字塔，供 /waveform 范围查询使用
+        'waveform_pyramid': WaveformPyramid(resampled_signal, TARGET_SAMPLING_RATE, factor=WAVEFORM_PYRAMID_FACTOR)
+    }
+    if leads:
+        fields['leads'] = lead_summary
+        artifacts['lead_waveforms'] = leads['playback']
+    with stage_timer('session_create'):
+        SESSIONS.create(session_id, fields, artifacts=artifacts)
+    
+    # 步骤4: 把报告生成任务交给后台调度器（异步模式下先由HeartVoice补全数据），主程序继续执行，不会等待
+    queue_info = None
+    if enrich:
+        _enrich_executor.submit(_enrich_and_schedule_report, session_id, resampled_signal, analysis_key)
+    elif not cached_report:
+        try:
+            queue_info = _schedule_report(session_id)
+        except QueueFullError:
+            # HeartVoice结果已经进入缓存，客户端稍后重试时不会重复调用上游
+            SESSIONS.delete(session_id)
+            raise
+
+    # 步骤5: 提取仪表盘所需指标
+    if cached_report:
+        logger.info("命中分析缓存，直接复用已生成的报告", extra={'session_id': session_id})
+        _schedule_answer_warmup(session_id)
+    else:
+        logger.info("已返回初始响应，报告正在后台生成", extra={'session_id': session_id, 'analysis_source': analysis_source})
+    
+    result = {
+        'session_id': session_id,
+        'status': status,
+        'queue': queue_info,
+        'analysis_source': analysis_source,
+        'signal_quality': quality_report,
+        'initialAnalysis': _dashboard_metrics(full_api_data),
+    }
+    if leads:
+        result['leads'] = lead_summary
+    return result
+
+
+def _request_lead(form, args):
+    """读取并校验请求中的 lead 参数（查询参数或表单字段），格式错误时抛出 LeadSelectionError。"""
+    return parse_lead(args.get('lead') or form.get('lead'))
+
+
+def _check_upload(files, form, args):
+    """校验 /analyze 的上传参数，返回 (文件, 波形编码, 导联, 错误)；错误为 (响应体, 状态码) 或 None。"""
+    if 'file' not in files:
+        return None, None, None, ({"error": "未找到文件部分"}, 400)
+    file = files['file']
+    if file.filename == '':
+        return None, None, None, ({"error": "未选择文件"}, 400)
+    waveform_encoding = args.get('waveform_encoding') or form.get('waveform_encoding', 'json')
+    if waveform_encoding not in WAVEFORM_ENCODINGS:
+        return None, None, None, ({"error": f"不支持的波形编码: {waveform_encoding}，可选值: {', '.join(WAVEFORM_ENCODINGS)}"}, 400)
+    try:
+        lead = _request_lead(form, args)
+    except LeadSelectionError as e:
+        return None, None, None, ({"error": str(e)}, 400)
+    return file, waveform_encoding, lead, None
+
+
+def _analysis_response(result: dict, playback_waveform, leads, waveform_encoding) -> dict:
+    """/analyze 的响应体：会话信息和播放波形；多导联记录在 leads 中另附逐导联的播放波形。"""
+    response = {**result, 'waveform': encode_waveform(playback_waveform, waveform_encoding)}
+    if leads:
+        # 逐导联波形的数据量是单导联的数倍，请求 'json' 时也使用紧凑的 int16 二进制编码
+        lead_encoding = 'int16' if waveform_encoding == 'json' else waveform_encoding
+        response['leads'] = {**result['leads'], 'waveforms': encode_waveform(leads['playback'], lead_encoding)}
+    return response
+
+
+def _retry_after_seconds(error: QueueFullError) -> int:
+    return max(1, math.ceil(error.retry_after))
+
+
+def _signal_quality_response(error: SignalQualityError):
+    """信号质量不合格时的 422 响应，附带结构化的质量报告（各项指标与不合格原因）。"""
+    return jsonify({"error": str(error), "quality": error.report}), 422
+
+
+def _queue_full_response(error: QueueFullError):
+    """报告队列已满时的 429 响应，附带预计等待时间。"""
+    retry_after = _retry_after_seconds(error)
+    response = jsonify({"error": str(error), "retry_after": retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def _analysis_unavailable_response(error: AnalysisUnavailableError):
+    """上游不可用且本地无法分析时的 503 响应。"""
+    return jsonify({"error": str(error)}), 503
 
 
 @analysis_bp.route('/analyze', methods=['POST'])
 def analyze_ecg():
     """
     接收文件，进行分析，启动后台报告生成，并立即返回初始数据。
+
+    可通过查询参数或表单字段 waveform_encoding 选择波形编码：
+    'json'（默认，浮点数列表）、'int16'、'float16'、'float32'（base64编码的小端二进制）。
+
+    多导联记录可通过查询参数或表单字段 lead 选择用于分析的导联：导联序号、标准12导联名称（如 'II'）、
+    'pca'（各导联的第一主成分）或 'auto'（默认，见配置项 ANALYSIS_LEAD）。
     """
-    if 'file' not in request.files:
-        return jsonify({"error": "未找到文件部分"}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "未选择文件"}), 400
+    file, waveform_encoding, lead, error = _check_upload(request.files, request.form, request.args)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # 报告队列已满时尽早拒绝，避免白白处理文件和调用HeartVoice
+    if report_scheduler.is_full():
+        return _queue_full_response(QueueFullError(report_scheduler.estimated_wait()))
 
     try:
-        # 步骤1: 调用数据处理模块处理文件
-        resampled_signal, playback_waveform = process_ecg_signal_from_file(file.stream)
-        
-        # 步骤2: 调用外部HeartVoice API获取专业分析数据
-        api_payload = {'ecgData': resampled_signal.tolist(), 'ecgSampleRate': TARGET_SAMPLING_RATE, 'method': 'FeatureDB'}
-        response = requests.post(url=HEARTVOICE_API_URL, headers={'Content-Type': 'application/json'}, json=api_payload)
-        response.raise_for_status()
-        response_data_from_api = response.json()
+        # 步骤1: 调用数据处理模块处理文件（质量不合格的记录在这里被拒绝，不会调用HeartVoice和GLM）
+        try:
+            resampled_signal, playback_waveform, quality_report, leads = process_ecg_signal_from_file(file.stream, lead=lead)
+        except SignalQualityError as e:
+            return _signal_quality_response(e)
+        except LeadSelectionError as e:
+            return jsonify({"error": str(e)}), 400
         
-        if response_data_from_api.get('code') != 200:
-            raise Exception(f"HeartVoice API返回错误: {response_data_from_api.get('msg')}")
-        
-        full_api_data = response_data_from_api.get('data', {})
-        
-        # 步骤3: 创建会话并设置初始状态
-        session_id = str(uuid.uuid4())
-        SESSIONS[session_id] = {
-            'status': 'generating_report',  # 【关键点】初始状态
-            'full_analysis': full_api_data,
-            'report': None
-        }
-        
-        # 步骤4: 启动后台线程来异步生成报告
-        report_thread = threading.Thread(
-            target=_generate_report_and_update_status,
-            args=(session_id,)
-        )
-        report_thread.start() # 线程启动后，主程序继续执行，不会等待
-
-        # 步骤5: 提取仪表盘所需指标并立即返回给前端
-        health_index = full_api_data.get('HealthIndex', {})
-        dashboard_metrics = {
-            'HR': full_api_data.get('Features', {}).get('HR'),
-            'Pressure': health_index.get('Pressure'),
-            'HRV': health_index.get('HRV'),
-            'Emotion': health_index.get('Emotion'),
-            'Fatigue': health_index.get('Fatigue'),
-            'Vitality': health_index.get('Vitality')
-        }
-
-        print(f"[{time.strftime('%H:%M:%S')}] 已为会话 {session_id} 返回初始响应，报告正在后台生成。")
-        
-        return jsonify({
-            'session_id': session_id,
-            'status': 'generating_report',
-            'waveform': playback_waveform.tolist(),
-            'initialAnalysis': {k: (float(v) if v is not None and not isinstance(v, str) else v) for k, v in dashboard_metrics.items()},
-        })
+        # 步骤2-4: 获取分析数据、创建会话并安排报告生成
+        try:
+            result = _create_analysis_session(resampled_signal, playback_waveform, quality_report, leads=leads)
+        except QueueFullError as e:
+            return _queue_full_response(e)
+        except AnalysisUnavailableError as e:
+            return _analysis_unavailable_response(e)
+
+        # 步骤5: 附带播放波形，立即返回给前端
+        with stage_timer('serialize'):
+            return jsonify(_analysis_response(result, playback_waveform, leads, waveform_encoding))
 
     except Exception as e:
-        print(f"处理文件时出错: {e}")
+        logger.exception("处理文件时出错: %s", e)
         return jsonify({"error": f"处理文件时出现未知错误: {str(e)}"}), 500
 
 
+def _remove_spooled(path):
+    if path is not None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@analysis_bp.route('/analyze/batch', methods=['POST'])
+def analyze_ecg_batch():
+    """
+    批量分析：一次上传多个 .mat 文件（multipart 表单字段 files，可重复）。
+
+    - 文件的解码和重采样在进程池中并行执行，吞吐量随CPU核数增长。上传先按块落盘，
+      工作进程只拿到文件路径；超过流式阈值的大文件在本进程的专用线程池中流式处理（落盘 + memmap，
+      同时处理的数量不超过 BATCH_STREAM_WORKERS），不经过进程间传输；
+    - 每个文件处理完成后立即在有界线程池中调用HeartVoice并创建会话，
+      同时进行的上游请求不超过 BATCH_HEARTVOICE_CONCURRENCY；
+    - 单个文件失败不影响其他文件：results 中按上传顺序给出每个文件的会话信息或错误，
+      全部成功返回 200，部分或全部失败返回 207。响应不包含播放波形，可通过 /waveform 获取。
+    - 查询参数或表单字段 lead 与 /analyze 相同，对所有文件生效。
+    """
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({"error": "未找到文件部分（表单字段 files）"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"单次最多上传 {BATCH_MAX_FILES} 个文件"}), 413
+    try:
+        lead = _request_lead(request.form, request.args)
+    except LeadSelectionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # 报告队列已满时尽早拒绝
+    if report_scheduler.is_full():
+        return _queue_full_response(QueueFullError(report_scheduler.estimated_wait()))
+
+    results = [{'filename': f.filename} for f in files]
+
+    def fail(index, message, **extra):
+        results[index].update({'error': message, **extra})
+
+    spooled = {}  # 文件序号 -> 落盘路径，工作进程处理完后立即删除
+    session_futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=BATCH_HEARTVOICE_CONCURRENCY, thread_name_prefix='batch-analyze') as upstream:
+            # 步骤1: 并行解码、重采样（进程池在第一个需要它的文件到来时才创建，全部是大文件时不会启动子进程）
+            pool = None
+            futures = {}
+            for index, f in enumerate(files):
+                if should_stream(f.stream):
+                    futures[_stream_ingest_executor.submit(process_ecg_signal_from_file, f.stream, True, lead)] = index
+                    continue
+                try:
+                    spooled[index] = spool_upload(f.stream)
+                except OSError as e:
+                    fail(index, f"文件保存失败: {e}")
+                    continue
+                if pool is None:
+                    pool = get_processing_pool()
+                futures[pool.submit(process_ecg_file, spooled[index], lead)] = index
+
+            # 步骤2: 哪个文件先处理完就先分析哪个，HeartVoice请求并发数有上限
+            for future in as_completed(futures):
+                index = futures[future]
+                _remove_spooled(spooled.pop(index, None))
+                try:
+                    resampled_signal, playback_waveform, quality_report, leads = future.result()
+                except SignalQualityError as e:
+                    fail(index, str(e), quality=e.report)
+                    continue
+                except BrokenProcessPool as e:
+                    reset_processing_pool()
+                    fail(index, f"信号处理进程异常退出: {e}")
+                    continue
+                except Exception as e:
+                    fail(index, f"文件处理失败: {e}")
+                    continue
+                session_futures[upstream.submit(_create_analysis_session, resampled_signal, playback_waveform,
+                                                quality_report, leads=leads)] = index
+
+            for future, index in session_futures.items():
+                try:
+                    results[index].update(future.result())
+                except QueueFullError as e:
+                    fail(index, str(e), retry_after=_retry_after_seconds(e))
+                except AnalysisUnavailableError as e:
+                    fail(index, str(e))
+                except Exception as e:
+                    fail(index, f"分析失败: {e}")
+    finally:
+        for path in spooled.values():
+            _remove_spooled(path)
+
+    failed = sum(1 for result in results if 'error' in result)
+    logger.info("批量分析完成", extra={'succeeded': len(files) - failed, 'failed': failed})
+    return jsonify({
+        'results': results,
+        'succeeded': len(files) - failed,
+        'failed': failed,
+    }), (207 if failed else 200)
+
+
+@analysis_bp.route('/stream', methods=['POST'])
+def create_live_stream():
+    """
+    开始一条实时心电流，供可穿戴设备边采集边上传。
+
+    请求体（JSON，可选）: {"sample_rate": 原始采样率，默认 ORIGINAL_SAMPLING_RATE}。
+    之后通过 POST /stream/<stream_id>/samples 追加样本，GET /stream/<stream_id>/events 订阅滚动指标，
+    POST /stream/<stream_id>/finish 结束并按 /analyze 的流程生成完整的分析会话。
+    流的状态保存在处理它的进程内存中，多 worker 部署时需要按 stream_id 做会话保持。
+    """
+    data = request.get_json(silent=True) or {}
+    sample_rate = data.get('sample_rate', ORIGINAL_SAMPLING_RATE)
+    if not isinstance(sample_rate, int) or isinstance(sample_rate, bool) or not TARGET_SAMPLING_RATE <= sample_rate <= _LIVE_MAX_SAMPLE_RATE:
+        return jsonify({"error": f"sample_rate 必须是 {TARGET_SAMPLING_RATE}-{_LIVE_MAX_SAMPLE_RATE} 之间的整数"}), 400
+    try:
+        stream = live_streams.create(sample_rate)
+    except LiveStreamLimitError as e:
+        return jsonify({"error": str(e)}), 503
+    logger.info("实时流已开始", extra={'stream_id': stream.stream_id, 'sample_rate': sample_rate})
+    return jsonify({
+        'stream_id': stream.stream_id,
+        'sample_rate': sample_rate,
+        'target_sample_rate': TARGET_SAMPLING_RATE,
+        'buffer_seconds': LIVE_STREAM_BUFFER_SECONDS,
+    }), 201
+
+
+@analysis_bp.route('/stream/<stream_id>/samples', methods=['POST'])
+def append_live_samples(stream_id):
+    """
+    向实时流追加样本，返回最新的状态快照与滚动指标。两种格式：
+
+    - Content-Type: application/json，{"samples": [数值, ...]}；
+    - Content-Type: application/octet-stream，小端int16原始样本。请求体按块读取、边读边处理，
+      设备可以用一个持续的分块传输（Transfer-Encoding: chunked）请求不断上传。
+    """
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "实时流不存在或已过期"}), 404
+
+    try:
+        if request.mimetype == 'application/octet-stream':
+            snapshot, carry = stream.snapshot(), b''
+            while True:
+                block = request.stream.read(_LIVE_READ_BYTES)
+                if not block:
+                    break
+                block = carry + block
+                usable = len(block) - len(block) % 2
+                carry = block[usable:]
+                snapshot = stream.append(np.frombuffer(block[:usable], dtype='<i2'))
+        else:
+            samples = (request.get_json(silent=True) or {}).get('samples')
+            try:
+                samples = np.asarray(samples, dtype=np.float32)
+            except (TypeError, ValueError):
+                samples = None
+            if samples is None or samples.ndim != 1 or not np.isfinite(samples).all():
+                return jsonify({"error": "samples 必须是数值列表"}), 400
+            snapshot = stream.append(samples)
+    except LiveStreamClosedError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(snapshot)
+
+
+@analysis_bp.route('/stream/<stream_id>', methods=['GET'])
+def get_live_stream(stream_id):
+    """实时流的当前状态快照与滚动指标。"""
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "实时流不存在或已过期"}), 404
+    return jsonify(stream.snapshot())
+
+
+def _limited_sse_response(events):
+    """
+    由 Flask 处理的事件流响应。每条事件流会一直占用一个请求线程，同时打开的数量超过 SSE_MAX_CONNECTIONS 时
+    返回 503，避免事件流占满 worker 的全部线程；连接关闭时释放名额。
+    """
+    if not _sse_connections.try_acquire():
+        response = jsonify({"error": "同时打开的事件流过多，请稍后重试或改为轮询"})
+        response.headers['Retry-After'] = str(math.ceil(SSE_POLL_INTERVAL_S * 5))
+        return response, 503
+    response = sse_response(events)
+    response.call_on_close(_sse_connections.release)
+    return response
+
+
+def _live_metrics_event(stream_id, stream, snapshot, version):
+    """
+    实时指标事件流的一步（同步与异步版本共用）：根据最新快照返回 (事件或 None, 新的版本号, 是否结束)。
+    """
+    if snapshot['finished']:
+        return sse_event('finished', snapshot), version, True
+    if snapshot['version'] != version:
+        return sse_event('metrics', snapshot), snapshot['version'], False
+    if live_streams.get(stream_id) is not stream:
+        return sse_event('error', {"error": "实时流长时间没有新数据，已被丢弃"}), version, True
+    return None, version, False
+
+
+@analysis_bp.route('/stream/<stream_id>/events', methods=['GET'])
+def stream_live_metrics(stream_id):
+    """
+    以 Server-Sent Events 推送实时流的滚动指标。
+
+    事件：
+    - metrics：检测到新的R峰、指标更新时推送状态快照；
+    - finished：流已结束，推送最终快照后关闭连接；
+    - error：流因长时间没有新数据被丢弃。
+
+    同步部署中同时打开的事件流不超过 SSE_MAX_CONNECTIONS（超出时返回 503）；异步服务模式原生处理，不占用线程。
+    """
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "实时流不存在或已过期"}), 404
+
+    def events():
+        version = -1
+        last_sent = started = time.time()
+        while time.time() - started < SSE_MAX_DURATION_S:
+            snapshot = stream.wait_for_update(version, SSE_POLL_INTERVAL_S)
+            event, version, finished = _live_metrics_event(stream_id, stream, snapshot, version)
+            if event:
+                last_sent = time.time()
+                yield event
+            if finished:
+                return
+            if time.time() - last_sent > _SSE_KEEPALIVE_S:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+        yield sse_event('timeout', {"error": "事件流已达到最长持续时间，请重新连接"})
+
+    return _limited_sse_response(events())
+
+
+@analysis_bp.route('/stream/<stream_id>/finish', methods=['POST'])
+def finish_live_stream(stream_id):
+    """
+    结束实时流：用缓冲区中的信号（最近 LIVE_STREAM_BUFFER_SECONDS 秒）走与 /analyze 相同的分析流程，
+    返回会话信息和最终的滚动指标。报告队列已满（429）或分析服务暂不可用（503）时流会保留，客户端可以稍后重试。
+    """
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "实时流不存在或已过期"}), 404
+    if report_scheduler.is_full():
+        return _queue_full_response(QueueFullError(report_scheduler.estimated_wait()))
+
+    resampled_signal = stream.finish()
+    snapshot = stream.snapshot()
+    if len(resampled_signal) < _LIVE_MIN_SECONDS * TARGET_SAMPLING_RATE:
+        live_streams.remove(stream_id)
+        return jsonify({"error": f"实时流不足 {_LIVE_MIN_SECONDS} 秒，无法分析", "live": snapshot}), 400
+    try:
+        # 质量报告只统计缓冲区覆盖的时段（见 LiveStream），流开头早已移出缓冲区的问题不影响结果
+        quality_report = check_signal_quality(snapshot['signal_quality'])
+    except SignalQualityError as e:
+        live_streams.remove(stream_id)
+        return _signal_quality_response(e)
+
+    try:
+        result = _create_analysis_session(resampled_signal, playback_from_resampled(resampled_signal), quality_report)
+    except QueueFullError as e:
+        return _queue_full_response(e)
+    except AnalysisUnavailableError as e:
+        return _analysis_unavailable_response(e)
+    live_streams.remove(stream_id)
+    return jsonify({**result, 'live': snapshot})
+
+
 @analysis_bp.route('/session-status/<session_id>', methods=['GET'])
 def get_session_status(session_id):
     """
@@ -130,10 +683,198 @@ def get_session_status(session_id):
     if not session:
         return jsonify({"error": "会话不存在或已过期"}), 404
     
-    print(f"[{time.strftime('%H:%M:%S')}] 前端查询会话 {session_id} 状态: {session['status']}")
+    # 前端每秒轮询，只在 DEBUG 级别（且按比例采样）记录
+    logger.debug("前端查询会话状态", extra={'session_id': session_id, 'status': session['status']})
     
     return jsonify({
         "session_id": session_id,
         "status": session['status'],
+        "queue": _queue_info(session_id, session),
+        # 异步分析模式下，HeartVoice补全后 analysis_source 变为 'heartvoice'，仪表盘指标随之更新
+        "analysis_source": session.get('analysis_source', 'heartvoice'),
+        "signal_quality": session.get('signal_quality'),
+        "analysis": _dashboard_metrics(session.get('full_analysis', {})),
         "report": session.get('report') # 如果报告已生成，则一并返回
-    })
\ No newline at end of file
+    })
+
+
+def _queue_info(session_id, session):
+    """报告仍在排队或生成时，返回排队位置和预计剩余时间。"""
+    if session['status'] != 'generating_report':
+        return None
+    queue_info = report_scheduler.position(session_id)
+    if queue_info is None and session.get('report_eta_at'):
+        # 任务在其他 worker 进程中，只能给出提交时的预计完成时间
+        queue_info = {'position': None, 'eta_seconds': round(max(session['report_eta_at'] - time.time(), 0), 1)}
+    return queue_info
+
+
+def _session_status_event(session_id, last_state):
+    """
+    会话状态事件流的一步（同步与异步版本共用）：读取会话，返回 (事件或 None, 新的状态, 是否结束)。
+    状态（状态、排队位置、分析来源）没有变化时不产生事件。
+    """
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return sse_event('error', {"error": "会话不存在或已过期"}), last_state, True
+    if session['status'] != 'generating_report':
+        return sse_event('report', {"status": session['status'], "report": session.get('report')}), last_state, True
+
+    queue_info = _queue_info(session_id, session)
+    analysis_source = session.get('analysis_source', 'heartvoice')
+    state = (session['status'], queue_info and queue_info['position'], analysis_source)
+    if state == last_state:
+        return None, last_state, False
+    return sse_event('status', {
+        "status": session['status'],
+        "queue": queue_info,
+        "analysis_source": analysis_source,
+        "analysis": _dashboard_metrics(session.get('full_analysis', {})),
+    }), state, False
+
+
+@analysis_bp.route('/session-status/<session_id>/stream', methods=['GET'])
+def stream_session_status(session_id):
+    """
+    以 Server-Sent Events 推送会话状态，替代轮询 /session-status。
+
+    事件：
+    - status：状态、排队位置或分析来源变化时推送 {"status", "queue", "analysis_source", "analysis"}；
+    - report_delta：报告在本进程中生成时，逐段推送 {"text"}；
+    - report：报告完成（或失败）时推送 {"status", "report"}，随后关闭连接。
+
+    同步部署中同时打开的事件流不超过 SSE_MAX_CONNECTIONS（超出时返回 503）；异步服务模式原生处理，不占用线程。
+    """
+    if SESSIONS.get(session_id) is None:
+        return jsonify({"error": "会话不存在或已过期"}), 404
+
+    def events():
+        last_state, offset = None, 0
+        last_sent = started = time.time()
+        while time.time() - started < SSE_MAX_DURATION_S:
+            event, last_state, finished = _session_status_event(session_id, last_state)
+            if event:
+                last_sent = time.time()
+                yield event
+            if finished:
+                return
+
+            update = report_stream_hub.read(session_id, offset, timeout=SSE_POLL_INTERVAL_S)
+            if update is None:
+                # 报告不在本进程中生成，只能等待共享存储中的状态变化
+                time.sleep(SSE_POLL_INTERVAL_S)
+            elif update[0]:
+                offset += len(update[0])
+                last_sent = time.time()
+                yield sse_event('report_delta', {"text": ''.join(update[0])})
+
+            if time.time() - last_sent > _SSE_KEEPALIVE_S:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+        yield sse_event('timeout', {"error": "事件流已达到最长持续时间，请重新连接"})
+
+    return _limited_sse_response(events())
+
+
+@analysis_bp.route('/session/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    """
+    删除会话（与 /agent 的重置工具相同），报告仍在排队或生成时也可以调用：
+    排队中的报告任务被撤销，正在生成的报告完成后被丢弃。返回 {"deleted": true, "report_cancelled": 是否撤销了排队任务}。
+    """
+    result = reset_session(session_id)
+    if not result['deleted']:
+        return jsonify({"error": "会话不存在或已过期"}), 404
+    return jsonify(result)
+
+
+@analysis_bp.route('/waveform/<session_id>', methods=['GET'])
+def get_waveform(session_id):
+    """
+    按需获取会话的播放波形。
+
+    - 带有 start / end / max_points（秒、秒、点数）任一查询参数时，从缩放金字塔中返回
+      覆盖该视窗的最合适层级，点数不超过 max_points，响应始终为JSON；
+    - Accept: application/octet-stream 时返回原始小端二进制（默认int16），
+      通过 X-Waveform-Dtype / X-Waveform-Scale / X-Waveform-Length 响应头说明如何解码；
+    - 否则返回JSON，编码由查询参数 encoding 决定（默认 'json'）。
+
+    多导联会话可通过查询参数 lead（导联序号或标准12导联名称）获取单个导联的播放波形，
+    不带 lead 时返回用于分析的导联。缩放金字塔只为分析导联构建，lead 不能与范围查询参数同时使用。
+    """
+    waveform = SESSIONS.get_artifact(session_id, 'playback_waveform')
+    if waveform is None:
+        return jsonify({"error": "会话不存在或已过期"}), 404
+
+    if request.args.get('lead'):
+        if any(key in request.args for key in ('start', 'end', 'max_points')):
+            return jsonify({"error": "范围查询只支持分析导联，不能与 lead 参数同时使用"}), 400
+        waveform, error = _lead_waveform(session_id, request.args['lead'])
+        if error:
+            return jsonify(error[0]), error[1]
+
+    if any(key in request.args for key in ('start', 'end', 'max_points')):
+        return _query_waveform_range(session_id, SESSIONS.get_artifact(session_id, 'waveform_pyramid'))
+
+    best = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream'])
+    if best == 'application/octet-stream':
+        encoding = request.args.get('encoding', 'int16')
+        if encoding not in WAVEFORM_ENCODINGS or encoding == 'json':
+            return jsonify({"error": f"二进制响应不支持的编码: {encoding}"}), 400
+        data, scale = waveform_to_bytes(waveform, encoding)
+        return Response(data, mimetype='application/octet-stream', headers={
+            'X-Waveform-Dtype': WAVEFORM_DTYPES[encoding].str,
+            'X-Waveform-Scale': repr(scale),
+            'X-Waveform-Length': str(len(waveform)),
+            'X-Sample-Rate': str(TARGET_SAMPLING_RATE),
+        })
+
+    encoding = request.args.get('encoding', 'json')
+    if encoding not in WAVEFORM_ENCODINGS:
+        return jsonify({"error": f"不支持的波形编码: {encoding}，可选值: {', '.join(WAVEFORM_ENCODINGS)}"}), 400
+    return jsonify({
+        "session_id": session_id,
+        "sample_rate": TARGET_SAMPLING_RATE,
+        "waveform": encode_waveform(waveform, encoding),
+    })
+
+
+def _lead_waveform(session_id, value):
+    """取多导联会话中某个导联的播放波形，返回 (波形, 错误)；错误为 (响应体, 状态码) 或 None。"""
+    lead_waveforms = SESSIONS.get_artifact(session_id, 'lead_waveforms')
+    if lead_waveforms is None:
+        return None, ({"error": "该会话不是多导联记录，不支持 lead 参数"}, 400)
+    try:
+        lead = parse_lead(value)
+        if lead in DERIVED_LEADS:
+            raise LeadSelectionError(f"lead 参数需要导联序号或标准12导联名称，派生导联 {lead} 即不带 lead 时返回的波形")
+        return lead_waveforms[lead_index(lead, len(lead_waveforms))], None
+    except LeadSelectionError as e:
+        return None, ({"error": str(e)}, 400)
+
+
+def _query_waveform_range(session_id, pyramid):
+    """处理 /waveform 的范围查询，返回视窗内的原始样本或 min/max 包络。"""
+    try:
+        start = float(request.args.get('start', 0.0))
+        end = float(request.args.get('end', pyramid.duration))
+        max_points = int(request.args.get('max_points', WAVEFORM_DEFAULT_MAX_POINTS))
+    except ValueError:
+        return jsonify({"error": "start、end 必须为秒数，max_points 必须为整数"}), 400
+    # float() 也接受 nan、inf 和 1e308 这类值，换算成样本下标时会溢出
+    if not (math.isfinite(start) and math.isfinite(end)):
+        return jsonify({"error": "start、end 必须为有限的秒数"}), 400
+    if end < start or not 2 <= max_points <= WAVEFORM_MAX_POINTS_LIMIT:
+        return jsonify({"error": f"需要 start <= end 且 2 <= max_points <= {WAVEFORM_MAX_POINTS_LIMIT}"}), 400
+    start = min(max(start, 0.0), pyramid.duration)
+    end = min(max(end, 0.0), pyramid.duration)
+    encoding = request.args.get('encoding', 'json')
+    if encoding not in WAVEFORM_ENCODINGS:
+        return jsonify({"error": f"不支持的波形编码: {encoding}，可选值: {', '.join(WAVEFORM_ENCODINGS)}"}), 400
+
+    result = pyramid.query(start, end, max_points)
+    for key in ('values', 'min', 'max'):
+        if key in result:
+            result[key] = encode_waveform(result[key], encoding)
+    result.update(session_id=session_id, duration=pyramid.duration)
+    return jsonify(result)
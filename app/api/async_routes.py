@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from werkzeug.formparser import parse_form_data
+
+from app.api.agent_routes import (
+    _cached_answer_events,
+    _check_agent_request,
+    _lookup_answer,
+    _plan_from_glm_response,
+    _rate_limit_error,
+    _record_glm_plan,
+    _remember_answer,
+    _route_locally
+)
+from app.api.analysis_routes import (
+    AnalysisUnavailableError,
+    _analysis_response,
+    _check_upload,
+    _create_analysis_session,
+    _INLINE_HEARTVOICE_MAX_ELAPSED,
+    _SSE_KEEPALIVE_S,
+    _fall_back_to_local,
+    _live_metrics_event,
+    _lookup_analysis,
+    _retry_after_seconds,
+    _session_status_event
+)
+from app.config import SSE_MAX_DURATION_S, SSE_POLL_INTERVAL_S
+from app.services.async_upstream import analyze_with_heartvoice_async, get_glm_response_async, stream_glm_response_async
+from app.services.heartvoice import HeartVoiceError
+from app.services.live_stream import live_streams
+from app.services.report_stream import report_stream_hub
+from app.services.report_scheduler import QueueFullError, report_scheduler
+from app.services.result_cache import analysis_cache
+from app.state import SESSIONS
+from app.toolkit.prompt_compiler import AGENT_TOOLS_SCHEMA, agent_planning_messages
+from app.utils.asgi_http import EventStreamResponse, JsonResponse
+from app.utils.data_processor import process_ecg_signal_from_file
+from app.utils.leads import LeadSelectionError
+from app.utils.request_controller import RateLimitExceeded
+from app.utils.signal_quality import SignalQualityError
+from app.utils.sse import sse_event
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_full_response(error: QueueFullError) -> JsonResponse:
+    retry_after = _retry_after_seconds(error)
+    return JsonResponse({"error": str(error), "retry_after": retry_after}, 429, {'retry-after': retry_after})
+
+
+def _rate_limited_response(error: RateLimitExceeded) -> JsonResponse:
+    body, retry_after = _rate_limit_error(error)
+    return JsonResponse(body, 429, {'retry-after': retry_after})
+
+
+def _parse_upload(spool, size, content_type):
+    """用 werkzeug 解析 multipart 表单（上传文件写入临时文件），返回 (files, form)。"""
+    environ = {'REQUEST_METHOD': 'POST', 'wsgi.input': spool, 'CONTENT_LENGTH': str(size), 'CONTENT_TYPE': content_type}
+    _, form, files = parse_form_data(environ)
+    return files, form
+
+
+async def _resolve_analysis_async(resampled_signal) -> dict:
+    """_resolve_analysis 的 asyncio 版本：等待HeartVoice时不占用线程，缓存查询和本地计算在线程中完成。"""
+    analysis = await asyncio.to_thread(_lookup_analysis, resampled_signal)
+    if analysis['data'] is None:
+        try:
+            analysis['data'] = await analyze_with_heartvoice_async(resampled_signal, max_elapsed=_INLINE_HEARTVOICE_MAX_ELAPSED)
+            await asyncio.to_thread(analysis_cache.put, analysis['key'], analysis['data'])
+        except (httpx.HTTPError, HeartVoiceError) as e:
+            await asyncio.to_thread(_fall_back_to_local, analysis, resampled_signal, e)
+    return analysis
+
+
+async def analyze_ecg(request):
+    """
+    /analyze 的异步版本，请求与响应格式相同。
+    文件解析、重采样等CPU工作在线程中完成；等待HeartVoice期间不占用线程。
+    """
+    spool, size = await request.spool_body()
+    with spool:
+        files, form = await asyncio.to_thread(_parse_upload, spool, size, request.headers.get('content-type', ''))
+        file, waveform_encoding, lead, error = _check_upload(files, form, request.args)
+        if error:
+            return JsonResponse(*error)
+
+        # 报告队列已满时尽早拒绝，避免白白处理文件和调用HeartVoice
+        if report_scheduler.is_full():
+            return _queue_full_response(QueueFullError(report_scheduler.estimated_wait()))
+
+        try:
+            try:
+                resampled_signal, playback_waveform, quality_report, leads = await asyncio.to_thread(
+                    process_ecg_signal_from_file, file.stream, None, lead)
+            except SignalQualityError as e:
+                return JsonResponse({"error": str(e), "quality": e.report}, 422)
+            except LeadSelectionError as e:
+                return JsonResponse({"error": str(e)}, 400)
+
+            try:
+                analysis = await _resolve_analysis_async(resampled_signal)
+                result = await asyncio.to_thread(
+                    _create_analysis_session, resampled_signal, playback_waveform, quality_report, analysis, leads)
+            except QueueFullError as e:
+                return _queue_full_response(e)
+            except AnalysisUnavailableError as e:
+                return JsonResponse({"error": str(e)}, 503)
+
+            # 波形编码与JSON序列化也在线程中完成
+            return await asyncio.to_thread(
+                lambda: JsonResponse(_analysis_response(result, playback_waveform, leads, waveform_encoding)))
+
+        except Exception as e:
+            logger.exception("处理文件时出错: %s", e)
+            return JsonResponse({"error": f"处理文件时出现未知错误: {str(e)}"}, 500)
+
+
+async def _plan_agent_reply_async(session_id, user_prompt):
+    """_plan_agent_reply 的 asyncio 版本：GLM决策调用（含速率控制的等待）不占用线程，工具在线程中执行。"""
+    routed = await asyncio.to_thread(_route_locally, session_id, user_prompt)
+    if routed is not None:
+        return 'tool_result', routed
+
+    plan_start = time.time()
+    glm_response = await get_glm_response_async(messages=agent_planning_messages(user_prompt), tools=AGENT_TOOLS_SCHEMA)
+    _record_glm_plan(time.time() - plan_start)
+    return await asyncio.to_thread(_plan_from_glm_response, session_id, user_prompt, glm_response)
+
+
+async def agent(request):
+    """/agent 的异步版本，请求与响应格式相同。"""
+    session_id, user_prompt, error = await asyncio.to_thread(_check_agent_request, await request.json())
+    if error:
+        return JsonResponse(*error)
+
+    key, cached = await asyncio.to_thread(_lookup_answer, session_id, user_prompt)
+    if cached:
+        return JsonResponse({"response": cached[1], "type": cached[0], "cached": True})
+
+    try:
+        kind, result = await _plan_agent_reply_async(session_id, user_prompt)
+        if kind == 'tool_result':
+            await asyncio.to_thread(_remember_answer, key, session_id, kind, result)
+            return JsonResponse({"response": result, "type": "tool_result"})
+
+        # 与第一次调用共享同一个速率配额
+        chat_data = await get_glm_response_async(messages=result)
+        answer = chat_data['choices'][0]['message']['content']
+        await asyncio.to_thread(_remember_answer, key, session_id, 'text', answer)
+        return JsonResponse({"response": answer, "type": "text"})
+
+    except RateLimitExceeded as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.exception("Agent-GLM交互出错: %s", e)
+        return JsonResponse({"error": f"与AI代理交互时出错: {e}"}, 500)
+
+
+async def agent_stream(request):
+    """/agent/stream 的异步版本，事件格式相同。"""
+    session_id, user_prompt, error = await asyncio.to_thread(_check_agent_request, await request.json())
+    if error:
+        return JsonResponse(*error)
+
+    key, cached = await asyncio.to_thread(_lookup_answer, session_id, user_prompt)
+    if cached:
+        async def replay(cached_events):
+            for event in cached_events:
+                yield event
+        return EventStreamResponse(replay(_cached_answer_events(*cached)))
+
+    # 工具决策在建立事件流之前完成，这样速率限制仍然可以返回普通的 429
+    try:
+        kind, result = await _plan_agent_reply_async(session_id, user_prompt)
+    except RateLimitExceeded as e:
+        return _rate_limited_response(e)
+    except Exception as e:
+        logger.exception("Agent-GLM交互出错: %s", e)
+        return JsonResponse({"error": f"与AI代理交互时出错: {e}"}, 500)
+
+    async def events():
+        if kind == 'tool_result':
+            await asyncio.to_thread(_remember_answer, key, session_id, kind, result)
+            yield sse_event('message', {"response": result, "type": "tool_result"})
+            return
+        chunks = []
+        deltas = stream_glm_response_async(messages=result)
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield sse_event('delta', {"text": delta})
+        except RateLimitExceeded as e:
+            yield sse_event('error', _rate_limit_error(e)[0])
+            return
+        except Exception as e:
+            logger.exception("Agent-GLM交互出错: %s", e)
+            yield sse_event('error', {"error": f"与AI代理交互时出错: {e}"})
+            return
+        finally:
+            await deltas.aclose()
+        await asyncio.to_thread(_remember_answer, key, session_id, 'text', ''.join(chunks))
+        yield sse_event('done', {"response": ''.join(chunks), "type": "text"})
+
+    return EventStreamResponse(events())
+
+
+async def stream_live_metrics(request, stream_id):
+    """/stream/<stream_id>/events 的异步版本，事件格式相同：等待新的指标时只挂起协程，不占用线程。"""
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        return JsonResponse({"error": "实时流不存在或已过期"}, 404)
+
+    async def events():
+        version = -1
+        last_sent = started = time.time()
+        while time.time() - started < SSE_MAX_DURATION_S:
+            snapshot = await stream.wait_for_update_async(version, SSE_POLL_INTERVAL_S)
+            event, version, finished = _live_metrics_event(stream_id, stream, snapshot, version)
+            if event:
+                last_sent = time.time()
+                yield event
+            if finished:
+                return
+            if time.time() - last_sent > _SSE_KEEPALIVE_S:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+        yield sse_event('timeout', {"error": "事件流已达到最长持续时间，请重新连接"})
+
+    return EventStreamResponse(events())
+
+
+async def stream_session_status(request, session_id):
+    """
+    /session-status/<session_id>/stream 的异步版本，事件格式相同：等待报告文本和状态变化时只挂起协程，
+    会话读取在线程中完成，连接再多也不会占满线程。
+    """
+    if await asyncio.to_thread(SESSIONS.get, session_id) is None:
+        return JsonResponse({"error": "会话不存在或已过期"}, 404)
+
+    async def events():
+        last_state, offset = None, 0
+        last_sent = started = time.time()
+        while time.time() - started < SSE_MAX_DURATION_S:
+            event, last_state, finished = await asyncio.to_thread(_session_status_event, session_id, last_state)
+            if event:
+                last_sent = time.time()
+                yield event
+            if finished:
+                return
+
+            update = await report_stream_hub.read_async(session_id, offset, timeout=SSE_POLL_INTERVAL_S)
+            if update is None:
+                # 报告不在本进程中生成，只能等待共享存储中的状态变化
+                await asyncio.sleep(SSE_POLL_INTERVAL_S)
+            elif update[0]:
+                offset += len(update[0])
+                last_sent = time.time()
+                yield sse_event('report_delta', {"text": ''.join(update[0])})
+
+            if time.time() - last_sent > _SSE_KEEPALIVE_S:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+        yield sse_event('timeout', {"error": "事件流已达到最长持续时间，请重新连接"})
+
+    return EventStreamResponse(events())
+
+
+# 异步服务模式下原生处理的接口：(方法, 路由模板) -> 处理函数，路由模板的写法与 Flask 相同，
+# 路径参数作为关键字参数传给处理函数。其余接口仍由 Flask 应用处理
+ASYNC_ROUTES = {
+    ('POST', '/analyze'): analyze_ecg,
+    ('POST', '/agent'): agent,
+    ('POST', '/agent/stream'): agent_stream,
+    ('GET', '/stream/<stream_id>/events'): stream_live_metrics,
+    ('GET', '/session-status/<session_id>/stream'): stream_session_status,
+}
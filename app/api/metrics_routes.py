@@ -0,0 +1,93 @@
+import time
+from flask import Blueprint, Response, g, request, jsonify
+from app.config import METRICS_ENABLED
+from app.state import SESSIONS
+from app.utils.metrics import HTTP_REQUEST_SECONDS, metrics
+from app.services.answer_cache import answer_cache
+from app.services.http_client import get_pool_stats
+from app.services.live_stream import live_streams
+from app.services.report_cache import report_cache
+from app.services.report_scheduler import report_scheduler
+from app.services.result_cache import analysis_cache
+from app.toolkit.intent_router import intent_router
+
+metrics_bp = Blueprint('metrics_api', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@metrics_bp.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def _observe_request(response):
+    """按路由模板（而不是具体URL）记录接口耗时，避免 session_id 等路径参数造成标签爆炸。"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                     method=request.method, status=str(response.status_code))
+    return response
+
+
+def _collect_component_stats():
+    """抓取时把各组件已有的 stats() 转换为 Prometheus 指标。"""
+    scheduler = report_scheduler.stats()
+    sessions = SESSIONS.stats()
+    analysis = analysis_cache.stats()
+    reports = report_cache.stats()
+    router = intent_router.stats()
+    answers = answer_cache.stats()
+    streams = live_streams.stats()
+    upstream = get_pool_stats()
+    return [
+        ('ecg_report_queue_jobs', 'gauge', "Report jobs by state.",
+         [({'state': 'queued'}, scheduler['queued']), ({'state': 'running'}, scheduler['running'])]),
+        ('ecg_report_workers', 'gauge', "Report worker threads.", [({}, scheduler['workers'])]),
+        ('ecg_report_jobs_completed_total', 'counter', "Report jobs finished.", [({}, scheduler['completed'])]),
+        ('ecg_sessions', 'gauge', "Live sessions in the session store.", [({}, sessions['sessions'])]),
+        ('ecg_session_cache_bytes', 'gauge', "Bytes held by the in-memory session cache.", [({}, sessions['cache_bytes'])]),
+        ('ecg_session_stored_bytes', 'gauge', "Bytes of session artifacts in the store.", [({}, sessions['stored_bytes'])]),
+        ('ecg_analysis_cache_entries', 'gauge', "Entries in the HeartVoice result cache.", [({}, analysis['entries'])]),
+        ('ecg_analysis_cache_lookups_total', 'counter', "HeartVoice result cache lookups.",
+         [({'result': 'hit'}, analysis['hits']), ({'result': 'miss'}, analysis['misses'])]),
+        ('ecg_report_cache_entries', 'gauge', "Entries in the report cache.", [({}, reports['entries'])]),
+        ('ecg_report_cache_requests_total', 'counter', "Report cache requests by outcome.",
+         [({'result': 'hit'}, reports['hits']), ({'result': 'generated'}, reports['generations']),
+          ({'result': 'joined_in_flight'}, reports['joined_in_flight'])]),
+        ('ecg_report_generations_in_flight', 'gauge', "Reports currently being generated.", [({}, reports['in_flight'])]),
+        ('ecg_intent_router_queries_total', 'counter', "Agent questions by routing outcome.",
+         [({'result': 'routed'}, router['routed']), ({'result': 'fallback'}, router['fallbacks'])]),
+        ('ecg_agent_answer_cache_entries', 'gauge', "Entries in the agent answer cache.", [({}, answers['entries'])]),
+        ('ecg_agent_answer_cache_lookups_total', 'counter', "Agent answer cache lookups.",
+         [({'result': 'hit'}, answers['hits']), ({'result': 'miss'}, answers['misses'])]),
+        ('ecg_agent_answers_warmed_total', 'counter', "Agent answers precomputed after report generation.",
+         [({}, answers['warmed'])]),
+        ('ecg_live_streams', 'gauge', "Active live ECG streams.", [({}, streams['active'])]),
+        ('ecg_live_streams_expired_total', 'counter', "Live streams dropped after idling.", [({}, streams['expired'])]),
+        ('ecg_upstream_requests_total', 'counter', "Upstream HTTP attempts, retries included.",
+         [({'service': name}, s['requests']) for name, s in upstream.items()]),
+        ('ecg_upstream_retries_total', 'counter', "Upstream retry attempts.",
+         [({'service': name}, s['retries']) for name, s in upstream.items()]),
+        ('ecg_upstream_in_flight', 'gauge', "Upstream requests in flight.",
+         [({'service': name}, s['in_flight']) for name, s in upstream.items()]),
+        ('ecg_upstream_idle_connections', 'gauge', "Idle pooled connections per upstream host.",
+         [({'service': name, 'host': pool['host']}, pool['idle_connections'])
+          for name, s in upstream.items() for pool in s['pools']]),
+    ]
+
+
+metrics.register_collector(_collect_component_stats)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus 文本格式的指标：各处理阶段耗时、上游请求耗时与错误、GLM限流等待、接口耗时，
+    以及队列、会话、缓存等组件的当前状态。数据属于处理本次请求的 worker 进程。
+    """
+    if not METRICS_ENABLED:
+        return jsonify({"error": "指标未启用（METRICS_ENABLED=0）"}), 404
+    return Response(metrics.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,248 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from app import create_app
+from app.api.async_routes import ASYNC_ROUTES
+from app.config import ASGI_WSGI_THREADS
+from app.services.async_http_client import async_glm_client, async_heartvoice_client
+from app.utils.asgi_http import AsgiRequest, send_response
+from app.utils.metrics import HTTP_REQUEST_SECONDS
+
+# 与 Flask 应用中 flask-cors 的默认配置一致
+_CORS_HEADERS = {'access-control-allow-origin': '*'}
+
+# 请求体管道中最多缓冲的字节数：WSGI 线程读得慢时暂停从连接读取，上传再大内存占用也有上限
+_BODY_PIPE_MAX_BUFFERED = 1024 * 1024
+
+
+class ClientDisconnected(OSError):
+    """客户端已断开，WSGI 应用的响应迭代（或请求体读取）应当停止。"""
+
+
+class RequestBodyPipe(io.RawIOBase):
+    """
+    线程安全的请求体管道，作为 wsgi.input 使用：事件循环中的协程把 receive() 收到的数据块写入，
+    WSGI 线程阻塞读取。
+
+    请求体不再整体缓存后才交给 Flask，分块传输的持续上传（POST /stream/<id>/samples）可以边收边处理。
+    """
+
+    def __init__(self, loop, max_buffered: int = _BODY_PIPE_MAX_BUFFERED):
+        super().__init__()
+        self.loop = loop
+        self.max_buffered = max_buffered
+        self.chunks = deque()
+        self.buffered = 0
+        self.finished = False       # 请求体已全部收到
+        self.disconnected = False   # 客户端已断开
+        self.cond = threading.Condition()
+        self.space = asyncio.Event()  # 缓冲区有空位（只在事件循环中等待）
+        self.space.set()
+
+    # ------------------------------------------------------------ 事件循环一侧
+
+    async def feed(self, chunk: bytes):
+        """写入一个数据块；缓冲区满时等待 WSGI 线程读走数据（反压）。"""
+        while True:
+            with self.cond:
+                if self.buffered < self.max_buffered:
+                    if chunk:
+                        self.chunks.append(memoryview(chunk))
+                        self.buffered += len(chunk)
+                        self.cond.notify_all()
+                    return
+                self.space.clear()
+            await self.space.wait()
+
+    def finish(self, disconnected: bool = False):
+        with self.cond:
+            self.finished = True
+            self.disconnected = self.disconnected or disconnected
+            self.cond.notify_all()
+
+    # ------------------------------------------------------------ WSGI 线程一侧
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        with self.cond:
+            while not self.chunks and not self.finished:
+                self.cond.wait()
+            if not self.chunks:
+                if self.disconnected:
+                    raise ClientDisconnected("客户端在请求体传输完成前断开")
+                return 0
+            chunk = self.chunks[0]
+            size = min(len(buffer), len(chunk))
+            buffer[:size] = chunk[:size]
+            if size == len(chunk):
+                self.chunks.popleft()
+            else:
+                self.chunks[0] = chunk[size:]
+            self.buffered -= size
+            if self.buffered < self.max_buffered:
+                self.loop.call_soon_threadsafe(self.space.set)
+            return size
+
+
+def _async_url_map() -> Map:
+    """ASYNC_ROUTES 的路由表，endpoint 为 (路由模板, 处理函数)。"""
+    return Map([Rule(rule, methods=[method], endpoint=(rule, handler), strict_slashes=False)
+                for (method, rule), handler in ASYNC_ROUTES.items()])
+
+
+class WsgiBridge:
+    """
+    在线程池中运行 Flask（WSGI）应用的 ASGI 适配器，响应按块转发，事件流可以逐条送达。
+
+    不使用 asgiref.wsgi.WsgiToAsgi：它把所有 WSGI 请求放在同一个线程里依次执行，
+    一条长连接的事件流就会挡住其他所有请求。
+    """
+
+    def __init__(self, wsgi_app, max_threads: int):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = RequestBodyPipe(loop)
+
+        async def pump():
+            """唯一调用 receive() 的地方：先把请求体送入管道，之后等待客户端断开。"""
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    body.finish(disconnected=True)
+                    return
+                if not body.finished:
+                    await body.feed(message.get('body', b''))
+                    if not message.get('more_body'):
+                        body.finish()
+
+        receiving = asyncio.ensure_future(pump())
+
+        def send_from_thread(message):
+            if body.disconnected:
+                raise ClientDisconnected()
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            await loop.run_in_executor(self.executor, self._run, scope, body, send_from_thread)
+        finally:
+            receiving.cancel()
+            # WSGI 应用没有读完请求体就返回时，唤醒可能仍在等待的读取方
+            body.finish()
+
+    @staticmethod
+    def _environ(scope, body) -> dict:
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+            'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            # 管道在请求体结束处返回 EOF，分块传输（没有 Content-Length）的请求体也可以直接读取
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _run(self, scope, body, send):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+        def send_start():
+            send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+
+        with body:
+            result = self.wsgi_app(self._environ(scope, body), start_response)
+            try:
+                head_sent = False
+                for chunk in result:
+                    if not chunk:
+                        continue
+                    if not head_sent:
+                        send_start()
+                        head_sent = True
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if not head_sent:
+                    send_start()
+                send({'type': 'http.response.body', 'body': b''})
+            except ClientDisconnected:
+                pass
+            finally:
+                # 关闭响应迭代器：结束事件流生成器并执行 Flask 的请求清理
+                if hasattr(result, 'close'):
+                    result.close()
+
+
+def create_asgi_app():
+    """
+    创建异步服务模式的 ASGI 应用（入口见项目根目录的 asgi.py）。
+
+    /analyze、/agent、/agent/stream 以及两个长连接事件流（/session-status/<id>/stream、/stream/<id>/events）
+    由 app.api.async_routes 原生异步处理：等待HeartVoice/GLM响应、GLM速率配额或新事件时只挂起协程，不占用线程，
+    一个 worker 可以同时挂起数百个对话和事件流。其余接口转交给线程池中的 Flask 应用，行为与同步部署完全相同。
+    """
+    flask_app = create_app()
+    bridge = WsgiBridge(flask_app.wsgi_app, ASGI_WSGI_THREADS)
+    routes = _async_url_map().bind('localhost')
+
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for client in (async_heartvoice_client, async_glm_client):
+                    if client.client is not None:
+                        await client.client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        try:
+            (rule, handler), params = routes.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            await bridge(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        response = await handler(AsgiRequest(scope, receive), **params)
+        # 事件流的耗时记到开始推送为止，与 Flask 接口的口径一致；按路由模板记录，与 Flask 接口相同
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=rule,
+                                     method=scope['method'], status=str(response.status))
+        await send_response(response, scope, receive, send, _CORS_HEADERS)
+
+    return app
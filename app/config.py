@@ -6,20 +6,157 @@ from dotenv import load_dotenv
 from dotenv import find_dotenv
 load_dotenv(find_dotenv())
 
+from app.utils.private_dir import default_data_dir, ensure_private_dir
+
 # --- 从环境变量中读取所有外部配置 ---
 
 # 心电分析API
 HEARTVOICE_API_URL = os.environ.get('HEARTVOICE_API_URL', "http://183.162.233.24:10081/HeartVoice")
+HEARTVOICE_METHOD = 'FeatureDB'
 
 # 智谱AI GLM模型配置
 ZHIPU_API_TOKEN = os.environ.get('ZHIPU_API_TOKEN') 
+# 可选：逗号分隔的多个密钥，每个密钥有独立的速率配额
+ZHIPU_API_TOKENS = [t.strip() for t in os.environ.get('ZHIPU_API_TOKENS', ZHIPU_API_TOKEN or '').split(',') if t.strip()]
 GLM_API_URL = os.environ.get('GLM_API_URL', "https://open.bigmodel.cn/api/paas/v4/chat/completions")
 GLM_MODEL_NAME = os.environ.get('GLM_MODEL_NAME', "glm-4.5")
 
+# 上游HTTP客户端：每个主机的连接池大小、超时（秒）与有限重试
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+UPSTREAM_BACKOFF_BASE_S = 0.5
+UPSTREAM_BACKOFF_MAX_S = 8.0
+HEARTVOICE_CONNECT_TIMEOUT_S = float(os.environ.get('HEARTVOICE_CONNECT_TIMEOUT_S', 5))
+HEARTVOICE_READ_TIMEOUT_S = float(os.environ.get('HEARTVOICE_READ_TIMEOUT_S', 60))
+GLM_CONNECT_TIMEOUT_S = float(os.environ.get('GLM_CONNECT_TIMEOUT_S', 5))
+GLM_READ_TIMEOUT_S = float(os.environ.get('GLM_READ_TIMEOUT_S', 120))
+# 一次上游调用（含全部重试与退避）的总耗时上限（秒），每次尝试的读取超时也不会超过剩余时间
+HEARTVOICE_MAX_ELAPSED_S = float(os.environ.get('HEARTVOICE_MAX_ELAPSED_S', 90))
+GLM_MAX_ELAPSED_S = float(os.environ.get('GLM_MAX_ELAPSED_S', 150))
+
 # --- 应用常量 ---
 ORIGINAL_SAMPLING_RATE = 300
 TARGET_SAMPLING_RATE = 100
 PLAYBACK_DURATION_S = 300
 
-GLM_RPM_LIMIT = 3  # RPM: Requests Per Minute
-GLM_TIME_WINDOW_SECONDS = 60 # 时间窗口（秒）
\ No newline at end of file
+# 重采样引擎：'polyphase'（多相滤波，float32）或 'fft'（scipy.signal.resample）
+RESAMPLE_METHOD = os.environ.get('RESAMPLE_METHOD', 'polyphase')
+
+# 分析模式：'sync'（等待HeartVoice，超时或不可用时回退到本地特征引擎）或
+# 'async'（本地特征引擎立即返回心率/HRV，HeartVoice在后台补全后再生成报告）
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'sync')
+# 'sync' 模式下 /analyze 在请求内等待HeartVoice的总时长上限（秒，含重试），超过即回退到本地特征引擎
+HEARTVOICE_SYNC_TIMEOUT_S = float(os.environ.get('HEARTVOICE_SYNC_TIMEOUT_S', 15))
+HEARTVOICE_ENRICH_WORKERS = int(os.environ.get('HEARTVOICE_ENRICH_WORKERS', 4))
+
+# 批量分析：单次请求的文件数上限、信号处理进程数、同时进行的HeartVoice请求数，
+# 以及本进程中同时流式处理的大文件数（所有批量请求共享）
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 50))
+BATCH_PROCESS_WORKERS = int(os.environ.get('BATCH_PROCESS_WORKERS', os.cpu_count() or 2))
+BATCH_HEARTVOICE_CONCURRENCY = int(os.environ.get('BATCH_HEARTVOICE_CONCURRENCY', 4))
+BATCH_STREAM_WORKERS = int(os.environ.get('BATCH_STREAM_WORKERS', 2))
+
+# 实时流式上传：每个流的环形缓冲区时长（秒）、滚动HRV窗口与瞬时心率窗口（秒）、
+# 单个进程内的并发流上限，以及多久没有新数据就丢弃该流（秒）
+LIVE_STREAM_BUFFER_SECONDS = int(os.environ.get('LIVE_STREAM_BUFFER_SECONDS', 1800))
+LIVE_HRV_WINDOW_S = int(os.environ.get('LIVE_HRV_WINDOW_S', 300))
+LIVE_HR_WINDOW_S = 10
+LIVE_STREAM_MAX_COUNT = int(os.environ.get('LIVE_STREAM_MAX_COUNT', 100))
+LIVE_STREAM_IDLE_TIMEOUT_S = int(os.environ.get('LIVE_STREAM_IDLE_TIMEOUT_S', 120))
+
+# 信号质量预检：'reject'（质量不合格的记录直接拒绝，不调用HeartVoice和GLM）、
+# 'flag'（只在结果中标注质量问题）或 'off'
+SIGNAL_QUALITY_MODE = os.environ.get('SIGNAL_QUALITY_MODE', 'reject')
+
+# 文件读取模式：'memory'（loadmat 整体读入）、'streaming'（落盘 + memmap + 分块处理）
+# 或 'auto'（文件超过阈值时自动切换到流式处理）
+INGEST_MODE = os.environ.get('INGEST_MODE', 'auto')
+STREAMING_INGEST_THRESHOLD_BYTES = int(os.environ.get('STREAMING_INGEST_THRESHOLD_MB', 32)) * 1024 * 1024
+STREAM_CHUNK_SECONDS = int(os.environ.get('STREAM_CHUNK_SECONDS', 600))  # 流式处理时每块的原始信号时长（秒）
+
+# 多导联记录默认用哪个导联做上游分析（请求参数 lead 可覆盖）：导联序号、标准12导联名称（如 'II'），
+# 'pca'（各导联的第一主成分）或 'auto'（多导联时为 'pca'，单导联时就是该导联）
+ANALYSIS_LEAD = os.environ.get('ANALYSIS_LEAD', 'auto')
+
+# 波形金字塔：相邻层级的抽取倍数，以及 /waveform 范围查询默认/最大返回点数
+WAVEFORM_PYRAMID_FACTOR = 4
+WAVEFORM_DEFAULT_MAX_POINTS = 2000
+WAVEFORM_MAX_POINTS_LIMIT = 20000
+
+# HeartVoice分析结果缓存：内存层条目上限、存活时间（秒），以及可选的 sqlite 磁盘层路径
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 256))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get('ANALYSIS_CACHE_TTL_SECONDS', 24 * 3600))
+ANALYSIS_CACHE_DB_PATH = os.environ.get('ANALYSIS_CACHE_DB_PATH')
+
+# AI报告缓存（按分析结果摘要去重）的内存层条目上限
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 256))
+
+# 提示词中分析数据表格的 token 预算（估算值），超出时按优先级省略次要指标
+REPORT_PROMPT_TOKEN_BUDGET = int(os.environ.get('REPORT_PROMPT_TOKEN_BUDGET', 1200))
+CHAT_PROMPT_TOKEN_BUDGET = int(os.environ.get('CHAT_PROMPT_TOKEN_BUDGET', 400))
+
+# 会话库、限流状态等运行时文件的默认目录：必须是当前用户独占的 0700 目录，否则启动时报错
+# （默认放在系统临时目录下按用户区分的子目录中，不与其他用户共享）
+DATA_DIR = ensure_private_dir(os.environ.get('ECG_DATA_DIR') or default_data_dir())
+
+# 会话存储：sqlite（WAL）共享层路径（设为空字符串则只使用进程内存）、存活时间与容量上限；
+# 波形信号文件保存在数据库旁的 <路径>-artifacts 目录（同样为 0700）中
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(DATA_DIR, 'sessions.sqlite3')) or None
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 6 * 3600))
+SESSION_MAX_COUNT = int(os.environ.get('SESSION_MAX_COUNT', 10000))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 256))
+SESSION_CACHE_MAX_BYTES = int(os.environ.get('SESSION_CACHE_MAX_MB', 512)) * 1024 * 1024
+
+# 后台报告生成：工作线程数与等待队列上限（队列满时 /analyze 返回 429）
+REPORT_WORKER_COUNT = int(os.environ.get('REPORT_WORKER_COUNT', 2))
+REPORT_QUEUE_SIZE = int(os.environ.get('REPORT_QUEUE_SIZE', 50))
+
+# SSE 事件流：状态检查间隔与单个连接的最长持续时间（秒）
+SSE_POLL_INTERVAL_S = 1.0
+SSE_MAX_DURATION_S = int(os.environ.get('SSE_MAX_DURATION_S', 600))
+# 同步部署（Flask）中每条事件流会一直占用一个请求线程，因此每个进程同时打开的事件流有上限，超出时返回 503。
+# 同步部署必须使用多线程 worker（如 gunicorn --threads 8 或 gthread），且这个值要小于每个 worker 的线程数，
+# 给普通请求留出线程；单线程的 sync worker 会被一条事件流完全占住。异步服务模式（asgi.py）原生处理事件流，不受此限制
+SSE_MAX_CONNECTIONS = int(os.environ.get('SSE_MAX_CONNECTIONS', 4))
+
+GLM_RPM_LIMIT = int(os.environ.get('GLM_RPM_LIMIT', 3))  # RPM: Requests Per Minute
+GLM_TIME_WINDOW_SECONDS = 60 # 时间窗口（秒）
+# 速率控制器的共享状态文件（设为空字符串则只在本进程内限流），以及为交互式请求保留的令牌数
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH', os.path.join(DATA_DIR, 'rate_limit.sqlite3')) or None
+GLM_INTERACTIVE_RESERVE = int(os.environ.get('GLM_INTERACTIVE_RESERVE', 1))
+GLM_INTERACTIVE_MAX_WAIT_S = float(os.environ.get('GLM_INTERACTIVE_MAX_WAIT_S', 15))  # /agent 最多等待多久，超过则返回 429
+
+# 本地意图路由：单纯的指标查询不经过GLM直接回答；置信度低于阈值时仍交给GLM决策
+INTENT_ROUTER_ENABLED = os.environ.get('INTENT_ROUTER_ENABLED', '1') != '0'
+INTENT_ROUTER_MIN_CONFIDENCE = float(os.environ.get('INTENT_ROUTER_MIN_CONFIDENCE', 0.75))
+
+# /agent 回答缓存：按 (会话, 分析结果摘要, 规范化后的问题) 缓存的回答条目上限与存活时间（秒）
+AGENT_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('AGENT_ANSWER_CACHE_MAX_ENTRIES', 2048))
+AGENT_ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('AGENT_ANSWER_CACHE_TTL_SECONDS', 3600))
+# 报告生成后是否预先回答常见问题（'|' 分隔）。预热只使用GLM速率配额中空闲的令牌，有报告排队时让路
+AGENT_WARMUP_ENABLED = os.environ.get('AGENT_WARMUP_ENABLED', '0') != '0'
+AGENT_WARMUP_QUESTIONS = [q.strip() for q in os.environ.get(
+    'AGENT_WARMUP_QUESTIONS', '我的心脏健康吗|我的压力大吗|我需要注意些什么|我的检测结果正常吗'
+).split('|') if q.strip()]
+
+
+# 运行指标：各处理阶段耗时、上游错误、速率控制等待等，通过 /metrics 以 Prometheus 格式输出
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+
+# 日志：后台线程异步输出的结构化日志（json 每行一条JSON记录，text 便于本地开发阅读）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+# 等待输出的日志记录上限；队列满时新记录被丢弃（计入 ecg_log_records_dropped_total），请求线程不会阻塞
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+# 消息和每个附加字段的最大字符数（GLM请求体、分析结果等大对象会被截断）
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', 2000))
+# DEBUG 日志的采样比例（0-1），避免开启 DEBUG 后每次轮询、每个请求体都输出
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))
+
+
+# 异步服务模式（asgi.py）：每个上游同时在途的请求数，超出的在客户端内排队（不占线程）。
+# 不宜过大：httpcore 分配连接的开销随连接数平方增长，单核上 32 比 100 的吞吐高得多
+ASYNC_UPSTREAM_POOL_SIZE = int(os.environ.get('ASYNC_UPSTREAM_POOL_SIZE', 32))
+# 异步服务模式下，仍由 Flask 处理的接口（波形查询、实时流样本上传等）所用的线程数
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
@@ -0,0 +1,91 @@
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+
+from app.config import AGENT_ANSWER_CACHE_MAX_ENTRIES, AGENT_ANSWER_CACHE_TTL_SECONDS
+
+# 规范化问题时去掉的空白和标点（“我的心脏健康吗？”与“我的心脏健康吗”视为同一个问题）
+_NOISE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角转半角、英文转小写，并去掉空白和标点。"""
+    return _NOISE.sub('', unicodedata.normalize('NFKC', prompt).lower())
+
+
+class AgentAnswerCache:
+    """
+    /agent 回答的进程内缓存（LRU + TTL）。
+
+    键为 (会话ID, 分析结果摘要, 规范化后的问题)：同一会话中重复的问题直接返回上次的回答，
+    不再占用GLM的速率配额；会话的分析结果被替换（异步分析模式下HeartVoice补全）后摘要随之变化，
+    旧的回答自然不再命中。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        """
+        Args:
+            max_entries (int): 最多保留的回答数，超出后淘汰最久未使用的条目。
+            ttl_seconds (int): 回答的存活时间（秒）。
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (过期时间, (回答类型, 回答文本))
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+
+    @staticmethod
+    def key_for(session_id: str, session: dict, prompt: str) -> tuple:
+        return session_id, session.get('analysis_key') or '', normalize_prompt(prompt)
+
+    def _lookup(self, key):
+        """返回未过期的回答，过期的条目顺便删除。调用方需持有锁。"""
+        cached = self.entries.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        if cached:
+            del self.entries[key]
+        return None
+
+    def __contains__(self, key) -> bool:
+        """只检查是否有未过期的回答，不计入命中统计（预热时使用）。"""
+        with self.lock:
+            return self._lookup(key) is not None
+
+    def get(self, key):
+        """命中时返回 (回答类型, 回答文本)，否则返回 None。"""
+        with self.lock:
+            answer = self._lookup(key)
+            if answer is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key, kind: str, text: str, warmup: bool = False):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl_seconds, (kind, text))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if warmup:
+                self.warmed += 1
+
+    def drop_session(self, session_id: str):
+        """删除某个会话的全部回答（会话被重置时）。"""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'warmed': self.warmed}
+
+
+# 全局共享的回答缓存实例
+answer_cache = AgentAnswerCache(max_entries=AGENT_ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=AGENT_ANSWER_CACHE_TTL_SECONDS)
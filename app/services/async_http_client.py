@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from threading import Lock
+
+import httpx
+
+from app.utils.metrics import UPSTREAM_ERRORS, UPSTREAM_REQUEST_SECONDS
+from app.services.http_client import RETRY_STATUS_CODES, UpstreamClient, register_client
+from app.config import (
+    ASYNC_UPSTREAM_POOL_SIZE,
+    UPSTREAM_MAX_RETRIES,
+    HEARTVOICE_CONNECT_TIMEOUT_S,
+    HEARTVOICE_READ_TIMEOUT_S,
+    HEARTVOICE_MAX_ELAPSED_S,
+    GLM_CONNECT_TIMEOUT_S,
+    GLM_READ_TIMEOUT_S,
+    GLM_MAX_ELAPSED_S
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUpstreamClient:
+    """
+    UpstreamClient 的 asyncio 版本（基于 httpx.AsyncClient），供异步服务模式（asgi.py）使用。
+
+    超时、抖动退避重试和统计口径与同步客户端相同；等待响应和退避期间让出事件循环，
+    一个 worker 可以同时挂起数百个上游请求而不占用线程。
+    httpx.AsyncClient 绑定在创建它的事件循环上，换了事件循环（如测试中多次 asyncio.run）会重新创建。
+
+    超出连接数的请求在 self.slots 信号量上排队，而不是交给 httpx 排队：
+    httpcore 每次分配连接都要遍历“排队请求 × 连接”，几百个请求排在它的池里时CPU开销会迅速上升。
+    """
+
+    def __init__(self, name: str, pool_size: int, connect_timeout: float, read_timeout: float,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, max_elapsed: float = None):
+        self.name = name
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.max_elapsed = max_elapsed
+        self.client = None
+        self.slots = None
+        self.loop = None
+
+        self.lock = Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'errors': 0, 'in_flight': 0}
+
+    def _count(self, key, delta=1):
+        with self.lock:
+            self.counters[key] += delta
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.loop is not loop:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self.client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self.slots = asyncio.Semaphore(self.pool_size)
+            self.loop = loop
+        return self.client
+
+    async def post(self, url: str, stream: bool = False, before_retry=None, max_elapsed=None, **kwargs) -> httpx.Response:
+        """
+        发送POST请求，必要时退避重试，参数与 httpx.AsyncClient.post 相同。
+
+        content 为异步生成器的请求体只能发送一次，因此这类请求不会重试。
+        before_retry 为协程函数，max_elapsed 与总耗时上限的含义都与 UpstreamClient.post 相同。
+        stream=True 时返回尚未读取响应体的响应，调用方负责 await response.aclose()。
+        最终仍失败时抛出 httpx 的异常，或返回最后一次的响应交由调用方 raise_for_status()。
+        """
+        client = self._get_client()
+        deadline = UpstreamClient._deadline(self, max_elapsed)
+        body = kwargs.get('content')
+        replayable = body is None or isinstance(body, (bytes, str))
+        attempts = 1 + (self.max_retries if replayable else 0)
+
+        for attempt in range(attempts):
+            if attempt and before_retry is not None:
+                kwargs = await before_retry(kwargs)
+            is_last = attempt == attempts - 1
+            self._count('requests')
+            self._count('in_flight')
+            try:
+                # 流式响应在收到响应头后就归还名额，其响应体占用的连接仍受 httpx 连接池的上限约束
+                async with self.slots:
+                    started = time.perf_counter()
+                    connect, read = UpstreamClient._attempt_timeout((self.connect_timeout, self.read_timeout), deadline)
+                    request = client.build_request('POST', url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+                    response = await client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                self._count('errors')
+                kind = 'timeout' if isinstance(e, httpx.TimeoutException) else 'connection'
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, service=self.name, outcome=kind)
+                UPSTREAM_ERRORS.inc(service=self.name, kind=kind)
+                wait = UpstreamClient._backoff(attempt)
+                if is_last or UpstreamClient._out_of_time(deadline, wait):
+                    raise
+                logger.warning("%s 请求失败（%s），%.2f 秒后重试", self.name, e, wait)
+            else:
+                outcome = 'ok' if response.status_code < 400 else f"http_{response.status_code}"
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, service=self.name, outcome=outcome)
+                if response.status_code >= 400:
+                    UPSTREAM_ERRORS.inc(service=self.name, kind=outcome)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                self._count('errors')
+                wait = UpstreamClient._backoff(attempt, response)
+                if is_last or UpstreamClient._out_of_time(deadline, wait):
+                    return response
+                await response.aclose()
+                logger.warning("%s 返回 %s，%.2f 秒后重试", self.name, response.status_code, wait)
+            finally:
+                self._count('in_flight', -1)
+            self._count('retries')
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+        # httpx 不公开连接池的逐主机状态，只报告上限
+        stats['pools'] = []
+        stats['max_connections'] = self.pool_size
+        return stats
+
+
+# 每个上游一个共享的异步客户端；名称带 -async 后缀，与同步客户端的统计分开
+async_heartvoice_client = AsyncUpstreamClient(
+    'HeartVoice-async', ASYNC_UPSTREAM_POOL_SIZE, HEARTVOICE_CONNECT_TIMEOUT_S, HEARTVOICE_READ_TIMEOUT_S,
+    max_elapsed=HEARTVOICE_MAX_ELAPSED_S
+)
+async_glm_client = AsyncUpstreamClient(
+    'GLM-async', ASYNC_UPSTREAM_POOL_SIZE, GLM_CONNECT_TIMEOUT_S, GLM_READ_TIMEOUT_S, max_elapsed=GLM_MAX_ELAPSED_S
+)
+register_client(async_heartvoice_client)
+register_client(async_glm_client)
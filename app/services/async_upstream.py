@@ -0,0 +1,93 @@
+import asyncio
+import json
+import logging
+
+import httpx
+
+from app.config import GLM_API_URL, HEARTVOICE_API_URL
+from app.services.async_http_client import async_glm_client, async_heartvoice_client
+from app.services.heartvoice import _heartvoice_data, _heartvoice_request_kwargs
+from app.services.zhipuai_client import _prepare_glm_request_async, _retry_through_limiter_async, _stream_delta
+from app.utils.metrics import stage_timer
+from app.utils.request_controller import PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+_EXHAUSTED = object()
+
+
+async def _iterate_in_thread(iterator):
+    """在线程中逐块推进同步生成器（把长信号编码为JSON是CPU工作），产出的块交给 httpx 异步发送。"""
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, _EXHAUSTED)
+        if chunk is _EXHAUSTED:
+            return
+        yield chunk
+
+
+def _encode_heartvoice_request(resampled_signal) -> dict:
+    """在线程中构造请求参数：普通数组直接编码为JSON字节，memmap 仍保留为分块生成器。"""
+    kwargs = _heartvoice_request_kwargs(resampled_signal)
+    if 'json' in kwargs:
+        kwargs['content'] = json.dumps(kwargs.pop('json')).encode()
+    return kwargs
+
+
+async def analyze_with_heartvoice_async(resampled_signal, max_elapsed=None) -> dict:
+    """
+    analyze_with_heartvoice 的 asyncio 版本：JSON编码在线程中完成，等待HeartVoice响应时不占用线程。
+
+    Raises:
+        httpx.HTTPError: 网络错误、超时或HTTP错误状态。
+        HeartVoiceError: HeartVoice返回了业务错误。
+    """
+    with stage_timer('heartvoice'):
+        kwargs = await asyncio.to_thread(_encode_heartvoice_request, resampled_signal)
+        if 'data' in kwargs:
+            kwargs['content'] = _iterate_in_thread(kwargs.pop('data'))
+        response = await async_heartvoice_client.post(HEARTVOICE_API_URL, max_elapsed=max_elapsed, **kwargs)
+        response.raise_for_status()
+        return _heartvoice_data(response.json())
+
+
+async def get_glm_response_async(messages: list, tools: list = None, tool_choice: str = "auto",
+                                 priority: int = PRIORITY_INTERACTIVE):
+    """get_glm_response 的 asyncio 版本：速率控制的等待与HTTP请求都不占用线程。"""
+    headers, payload = await _prepare_glm_request_async(messages, tools, tool_choice, priority)
+
+    try:
+        response = await async_glm_client.post(GLM_API_URL, headers=headers, json=payload,
+                                               before_retry=_retry_through_limiter_async(priority))
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        logger.error("调用GLM API时发生网络错误: %s", e)
+        raise
+
+
+async def stream_glm_response_async(messages: list, priority: int = PRIORITY_INTERACTIVE):
+    """stream_glm_response 的 asyncio 版本（异步生成器）；生成器被关闭时会释放底层连接。"""
+    headers, payload = await _prepare_glm_request_async(messages, None, None, priority)
+    payload["stream"] = True
+
+    try:
+        response = await async_glm_client.post(GLM_API_URL, stream=True, headers=headers, json=payload,
+                                               before_retry=_retry_through_limiter_async(priority))
+    except httpx.HTTPError as e:
+        logger.error("调用GLM API时发生网络错误: %s", e)
+        raise
+
+    try:
+        response.raise_for_status()
+        # 响应为SSE格式：每行 "data: {json}"，以 "data: [DONE]" 结束
+        async for line in response.aiter_lines():
+            done, delta = _stream_delta(line)
+            if done:
+                break
+            if delta:
+                yield delta
+    except httpx.HTTPError as e:
+        logger.error("调用GLM API时发生网络错误: %s", e)
+        raise
+    finally:
+        await response.aclose()
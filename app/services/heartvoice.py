@@ -0,0 +1,49 @@
+import numpy as np
+
+from app.config import HEARTVOICE_API_URL, HEARTVOICE_METHOD, TARGET_SAMPLING_RATE
+from app.services.http_client import heartvoice_client
+from app.utils.data_processor import iter_json_array
+from app.utils.metrics import UPSTREAM_ERRORS, stage_timer
+
+
+class HeartVoiceError(Exception):
+    """HeartVoice 返回了业务错误（code != 200）。"""
+
+
+@stage_timer('heartvoice_encode')
+def _heartvoice_request_kwargs(resampled_signal):
+    """
+    构造发往HeartVoice的请求参数。
+    流式读取得到的是磁盘上的 memmap，此时用分块传输逐段编码JSON，避免 tolist() 生成整段列表。
+    """
+    if isinstance(resampled_signal, np.memmap):
+        prefix = f'{{"ecgSampleRate": {TARGET_SAMPLING_RATE}, "method": "{HEARTVOICE_METHOD}", "ecgData": '.encode()
+        body = (chunk for part in ([prefix], iter_json_array(resampled_signal), [b'}']) for chunk in part)
+        return {'headers': {'Content-Type': 'application/json'}, 'data': body}
+    api_payload = {'ecgData': resampled_signal.tolist(), 'ecgSampleRate': TARGET_SAMPLING_RATE, 'method': HEARTVOICE_METHOD}
+    return {'headers': {'Content-Type': 'application/json'}, 'json': api_payload}
+
+
+@stage_timer('heartvoice')
+def analyze_with_heartvoice(resampled_signal, max_elapsed=None) -> dict:
+    """
+    调用外部HeartVoice API获取专业分析数据，返回其 data 块。
+    max_elapsed 为本次调用（含重试）的总耗时上限（秒），为 None 时使用 HEARTVOICE_MAX_ELAPSED_S。
+
+    Raises:
+        requests.exceptions.RequestException: 网络错误、超时或HTTP错误状态。
+        HeartVoiceError: HeartVoice返回了业务错误。
+    """
+    response = heartvoice_client.post(HEARTVOICE_API_URL, max_elapsed=max_elapsed,
+                                      **_heartvoice_request_kwargs(resampled_signal))
+    response.raise_for_status()
+    return _heartvoice_data(response.json())
+
+
+def _heartvoice_data(response_data_from_api: dict) -> dict:
+    """检查HeartVoice的业务返回码并取出 data 块（同步和异步调用共用）。"""
+    if response_data_from_api.get('code') != 200:
+        UPSTREAM_ERRORS.inc(service='HeartVoice', kind='business')
+        raise HeartVoiceError(f"HeartVoice API返回错误: {response_data_from_api.get('msg')}")
+
+    return response_data_from_api.get('data', {})
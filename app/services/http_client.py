@@ -0,0 +1,187 @@
+import logging
+import random
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import UPSTREAM_ERRORS, UPSTREAM_REQUEST_SECONDS
+from app.config import (
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE_S,
+    UPSTREAM_BACKOFF_MAX_S,
+    HEARTVOICE_CONNECT_TIMEOUT_S,
+    HEARTVOICE_READ_TIMEOUT_S,
+    HEARTVOICE_MAX_ELAPSED_S,
+    GLM_CONNECT_TIMEOUT_S,
+    GLM_READ_TIMEOUT_S,
+    GLM_MAX_ELAPSED_S
+)
+
+logger = logging.getLogger(__name__)
+
+# 这些状态码通常是暂时性的，值得退避后重试
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class UpstreamClient:
+    """
+    某个上游服务专用的HTTP客户端。
+
+    内部复用一个 requests.Session 和它的连接池（keep-alive），为每次请求设置
+    连接/读取超时，并对连接错误、超时和暂时性状态码做有限次数的抖动退避重试。
+    包括重试在内的总耗时不超过 max_elapsed 秒：剩余时间不够再等一次退避时直接放弃。
+    """
+
+    def __init__(self, name: str, pool_size: int, connect_timeout: float, read_timeout: float,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, max_elapsed: float = None):
+        """
+        Args:
+            name (str): 上游名称，用于日志和统计。
+            pool_size (int): 每个主机保持的最大连接数。
+            connect_timeout (float): 建立连接的超时（秒）。
+            read_timeout (float): 等待响应数据的超时（秒）。
+            max_retries (int): 首次请求失败后最多重试的次数。
+            max_elapsed (float): 一次 post() 的总耗时上限（秒），为 None 时不限制。
+        """
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.max_elapsed = max_elapsed
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self.lock = Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'errors': 0, 'in_flight': 0}
+
+    def _count(self, key, delta=1):
+        with self.lock:
+            self.counters[key] += delta
+
+    @staticmethod
+    def _backoff(attempt: int, response=None) -> float:
+        """计算第 attempt 次重试前的等待时间（full jitter），429 时优先遵循 Retry-After。"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), UPSTREAM_BACKOFF_MAX_S)
+        return random.uniform(0, min(UPSTREAM_BACKOFF_MAX_S, UPSTREAM_BACKOFF_BASE_S * 2 ** attempt))
+
+    def _deadline(self, max_elapsed=None):
+        max_elapsed = self.max_elapsed if max_elapsed is None else max_elapsed
+        return None if max_elapsed is None else time.monotonic() + max_elapsed
+
+    @staticmethod
+    def _out_of_time(deadline, wait: float) -> bool:
+        """退避 wait 秒之后是否已经没有时间再尝试一次。"""
+        return deadline is not None and time.monotonic() + wait >= deadline
+
+    @staticmethod
+    def _attempt_timeout(timeout, deadline):
+        """本次尝试的 (连接, 读取) 超时，不超过距离总耗时上限的剩余时间。"""
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        if deadline is None:
+            return connect, read
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return min(connect, remaining), min(read, remaining)
+
+    def post(self, url: str, before_retry=None, max_elapsed=None, **kwargs) -> requests.Response:
+        """
+        发起POST请求。参数与 requests.post 相同，未指定 timeout 时使用该上游的默认超时。
+
+        生成器形式的请求体只能发送一次，因此这类请求不会重试。
+        before_retry(kwargs) 在每次重试之前调用并返回新的请求参数，例如重新向速率控制器申请槽位、
+        换用新的密钥；它抛出的异常（如 RateLimitExceeded）直接传给调用方。
+        max_elapsed 为本次调用的总耗时上限（秒），为 None 时使用该上游的默认值。
+        最终仍失败时抛出 requests 的异常，或返回最后一次的响应交由调用方 raise_for_status()。
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        deadline = self._deadline(max_elapsed)
+        body = kwargs.get('data')
+        replayable = body is None or isinstance(body, (bytes, str, dict))
+        attempts = 1 + (self.max_retries if replayable else 0)
+
+        for attempt in range(attempts):
+            if attempt and before_retry is not None:
+                kwargs = before_retry(kwargs)
+            is_last = attempt == attempts - 1
+            self._count('requests')
+            self._count('in_flight')
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, timeout=self._attempt_timeout(timeout, deadline), **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._count('errors')
+                kind = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection'
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, service=self.name, outcome=kind)
+                UPSTREAM_ERRORS.inc(service=self.name, kind=kind)
+                wait = self._backoff(attempt)
+                if is_last or self._out_of_time(deadline, wait):
+                    raise
+                logger.warning("%s 请求失败（%s），%.2f 秒后重试", self.name, e, wait)
+            else:
+                # 流式响应只统计到收到响应头为止
+                outcome = 'ok' if response.status_code < 400 else f"http_{response.status_code}"
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, service=self.name, outcome=outcome)
+                if response.status_code >= 400:
+                    UPSTREAM_ERRORS.inc(service=self.name, kind=outcome)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                self._count('errors')
+                wait = self._backoff(attempt, response)
+                if is_last or self._out_of_time(deadline, wait):
+                    return response
+                response.close()
+                logger.warning("%s 返回 %s，%.2f 秒后重试", self.name, response.status_code, wait)
+            finally:
+                self._count('in_flight', -1)
+            self._count('retries')
+            time.sleep(wait)
+
+    def stats(self) -> dict:
+        """返回请求计数以及连接池的使用情况。"""
+        with self.lock:
+            stats = dict(self.counters)
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                'connections_opened': pool.num_connections,
+                'requests_sent': pool.num_requests,
+                # 连接池队列中未被借出的槽位里，非 None 的才是可复用的空闲连接
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                'max_size': self.pool_size,
+            })
+        stats['pools'] = pools
+        return stats
+
+
+# 每个上游一个共享客户端（同一进程内的所有线程共用连接池）
+heartvoice_client = UpstreamClient(
+    'HeartVoice', UPSTREAM_POOL_SIZE, HEARTVOICE_CONNECT_TIMEOUT_S, HEARTVOICE_READ_TIMEOUT_S,
+    max_elapsed=HEARTVOICE_MAX_ELAPSED_S
+)
+glm_client = UpstreamClient(
+    'GLM', UPSTREAM_POOL_SIZE, GLM_CONNECT_TIMEOUT_S, GLM_READ_TIMEOUT_S, max_elapsed=GLM_MAX_ELAPSED_S
+)
+
+
+# 其他模块创建的客户端（如异步服务模式的 httpx 客户端）登记在这里，一起出现在统计中
+_registered_clients = []
+
+
+def register_client(client):
+    """登记一个带 name 与 stats() 的上游客户端，使其出现在 get_pool_stats() 中。"""
+    _registered_clients.append(client)
+
+
+def get_pool_stats() -> dict:
+    """返回所有上游客户端的请求与连接池统计。"""
+    return {client.name: client.stats() for client in (heartvoice_client, glm_client, *_registered_clients)}
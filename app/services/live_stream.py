@@ -0,0 +1,262 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+
+from app.config import (
+    TARGET_SAMPLING_RATE,
+    LIVE_STREAM_BUFFER_SECONDS,
+    LIVE_HRV_WINDOW_S,
+    LIVE_HR_WINDOW_S,
+    LIVE_STREAM_MAX_COUNT,
+    LIVE_STREAM_IDLE_TIMEOUT_S,
+    SIGNAL_QUALITY_MODE
+)
+from app.utils.async_condition import AsyncAwareCondition
+from app.utils.data_processor import StreamingResampler
+from app.utils.ecg_features import InsufficientBeatsError, StreamingPeakDetector, features_from_peaks
+from app.utils.signal_quality import WindowedQualityAccumulator
+
+# 滚动指标中非线性指标的刷新间隔（秒，按流时长计）
+_NONLINEAR_REFRESH_SECONDS = 30
+_NONLINEAR_KEYS = ('SampEn', 'ApEn', 'DFA')
+
+
+class LiveStreamLimitError(Exception):
+    """本进程中同时进行的实时流已达上限。"""
+
+
+class LiveStreamClosedError(Exception):
+    """实时流已经结束，不能再追加样本。"""
+
+
+class RingBuffer:
+    """预分配的定长float32环形缓冲区，只保留最近 capacity 个样本，追加时不重新分配内存。"""
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.total = 0  # 累计写入的样本数
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def start(self) -> int:
+        """缓冲区中最早的样本在整条流中的位置。"""
+        return self.total - len(self)
+
+    def append(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        # 一次写入超过容量时，只有最后 capacity 个样本会留下
+        skipped = max(0, len(samples) - self.capacity)
+        self.total += skipped
+        samples = samples[skipped:]
+        position = self.total % self.capacity
+        first = min(len(samples), self.capacity - position)
+        self.data[position:position + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+    def latest(self) -> np.ndarray:
+        """按时间顺序返回缓冲区内容的拷贝。"""
+        position = self.total % self.capacity
+        if self.total <= self.capacity:
+            return self.data[:self.total].copy()
+        return np.concatenate((self.data[position:], self.data[:position]))
+
+
+class LiveStream:
+    """
+    一条实时心电流：样本到达后增量重采样到 TARGET_SAMPLING_RATE 写入环形缓冲区，
+    增量检测R峰，并在出现新的R峰时根据最近的R峰序列更新滚动的心率/HRV指标。
+    原始样本同时交给（只覆盖缓冲区时段的）信号质量累加器，导联脱落、饱和等问题在流进行中就能看到，
+    结束时用同一份报告决定缓冲区中的信号能否提交分析。
+
+    每次追加的计算量只与新样本数（加上固定长度的重叠区/上下文）有关，与已经接收的总时长无关。
+    """
+
+    def __init__(self, stream_id: str, sample_rate: int):
+        self.stream_id = stream_id
+        self.sample_rate = sample_rate
+        self.resampler = StreamingResampler(sample_rate, TARGET_SAMPLING_RATE)
+        self.buffer = RingBuffer(LIVE_STREAM_BUFFER_SECONDS * TARGET_SAMPLING_RATE)
+        self.detector = StreamingPeakDetector(TARGET_SAMPLING_RATE)
+        # 质量只统计缓冲区覆盖的时段，与结束时提交分析的信号一致
+        quality_enabled = SIGNAL_QUALITY_MODE != 'off'
+        self.quality = WindowedQualityAccumulator(sample_rate, LIVE_STREAM_BUFFER_SECONDS) if quality_enabled else None
+        self.peaks = deque()  # 仍在缓冲区内的R峰位置（整条流中的样本序号）
+        self.cond = AsyncAwareCondition()
+        self.samples_received = 0
+        self.beats_detected = 0
+        self.metrics = None
+        self.version = 0  # 每次指标更新加一，供事件流判断是否有新数据
+        self.nonlinear = {}  # 最近一次计算的非线性指标，及其计算时刻（流中的样本序号）
+        self.nonlinear_at = None
+        self.last_active = time.time()
+        self.finished = False
+        self.final_signal = None
+
+    def append(self, samples) -> dict:
+        """
+        追加一段原始采样率的样本，返回最新的状态快照。
+
+        Raises:
+            LiveStreamClosedError: 流已经结束。
+        """
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        with self.cond:
+            if self.finished:
+                raise LiveStreamClosedError(f"实时流 {self.stream_id} 已经结束")
+            self.samples_received += len(samples)
+            if self.quality is not None:
+                self.quality.update(samples)
+            self._ingest(self.resampler.push(samples))
+            return self._snapshot()
+
+    def _ingest(self, resampled):
+        self.last_active = time.time()
+        if len(resampled):
+            self.buffer.append(resampled)
+            self._add_peaks(self.detector.update(resampled))
+
+    def _add_peaks(self, new_peaks):
+        if len(new_peaks) == 0:
+            return
+        self.beats_detected += len(new_peaks)
+        self.peaks.extend(new_peaks)
+        while self.peaks and self.peaks[0] < self.buffer.start:
+            self.peaks.popleft()
+        # 一次追加超过缓冲区长度时，新检测到的R峰可能已经全部移出缓冲区
+        if self.peaks:
+            self._update_metrics()
+
+    def _update_metrics(self):
+        """只用最近 LIVE_HRV_WINDOW_S 秒内的R峰计算滚动指标，不重新处理信号。"""
+        peaks = np.fromiter(self.peaks, dtype=np.float64, count=len(self.peaks))
+        latest = peaks[-1]
+        window = peaks[peaks >= latest - LIVE_HRV_WINDOW_S * TARGET_SAMPLING_RATE]
+        # 非线性指标（熵是 O(N^2) 的）每 _NONLINEAR_REFRESH_SECONDS 秒流时长才重新计算一次，其余时候沿用上次的值
+        refresh = self.nonlinear_at is None or latest - self.nonlinear_at >= _NONLINEAR_REFRESH_SECONDS * TARGET_SAMPLING_RATE
+        try:
+            features = features_from_peaks(window, TARGET_SAMPLING_RATE, nonlinear=refresh)
+        except InsufficientBeatsError:
+            features = None
+        if features is not None:
+            if refresh:
+                self.nonlinear = {k: features['HRVIndex'][k] for k in _NONLINEAR_KEYS if k in features['HRVIndex']}
+                self.nonlinear_at = latest
+            else:
+                features['HRVIndex'].update(self.nonlinear)
+
+        # 瞬时心率：最近 LIVE_HR_WINDOW_S 秒内RR间期的中位数，对单个误检/漏检不敏感
+        recent = peaks[peaks >= latest - LIVE_HR_WINDOW_S * TARGET_SAMPLING_RATE]
+        heart_rate = None
+        if len(recent) >= 2:
+            heart_rate = round(60.0 * TARGET_SAMPLING_RATE / float(np.median(np.diff(recent))), 1)
+
+        self.metrics = {
+            'heart_rate': heart_rate,
+            'window_seconds': round((window[-1] - window[0]) / TARGET_SAMPLING_RATE, 1),
+            'window_beats': len(window),
+            'Features': features and features['Features'],
+            'HRVIndex': features and features['HRVIndex'],
+        }
+        self.version += 1
+        self.cond.notify_all()
+
+    def _snapshot(self) -> dict:
+        return {
+            'stream_id': self.stream_id,
+            'finished': self.finished,
+            'samples_received': self.samples_received,
+            'duration_s': round(self.buffer.total / TARGET_SAMPLING_RATE, 2),
+            'buffered_seconds': round(len(self.buffer) / TARGET_SAMPLING_RATE, 2),
+            'beats_detected': self.beats_detected,
+            'version': self.version,
+            'metrics': self.metrics,
+            'signal_quality': self.quality.report() if self.quality is not None else None,
+        }
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            return self._snapshot()
+
+    def wait_for_update(self, version: int, timeout: float) -> dict:
+        """等待指标版本超过 version（或流结束），最多 timeout 秒，返回最新快照。"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > version or self.finished, timeout)
+            return self._snapshot()
+
+    async def wait_for_update_async(self, version: int, timeout: float) -> dict:
+        """wait_for_update 的 asyncio 版本：等待期间不占用线程。"""
+        await self.cond.wait_for_async(lambda: self.version > version or self.finished, timeout)
+        return self.snapshot()
+
+    def finish(self) -> np.ndarray:
+        """
+        结束输入：补齐重采样和R峰检测的末尾，返回缓冲区中的完整（重采样后）信号。
+        可以重复调用，之后的调用直接返回同一份信号。
+        """
+        with self.cond:
+            if not self.finished:
+                self._ingest(self.resampler.flush())
+                # 末尾尚未确认的R峰也计入最终指标
+                self._add_peaks(self.detector.flush())
+                self.final_signal = self.buffer.latest()
+                self.finished = True
+                self.cond.notify_all()
+            return self.final_signal
+
+
+class LiveStreamRegistry:
+    """
+    进程内的实时流登记表。流的环形缓冲区和滤波器状态都在本进程的内存中，
+    多 worker 部署时需要按 stream_id 做会话保持（sticky），否则其他 worker 会返回 404。
+    空闲超过 idle_timeout 秒的流在下一次访问登记表时被丢弃。
+    """
+
+    def __init__(self, max_streams: int = LIVE_STREAM_MAX_COUNT, idle_timeout: float = LIVE_STREAM_IDLE_TIMEOUT_S):
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.expired = 0
+
+    def _sweep(self):
+        deadline = time.time() - self.idle_timeout
+        for stream_id in [sid for sid, s in self.streams.items() if s.last_active < deadline]:
+            del self.streams[stream_id]
+            self.expired += 1
+
+    def create(self, sample_rate: int) -> LiveStream:
+        """
+        Raises:
+            LiveStreamLimitError: 并发流已达上限。
+        """
+        with self.lock:
+            self._sweep()
+            if len(self.streams) >= self.max_streams:
+                raise LiveStreamLimitError(f"同时进行的实时流已达上限（{self.max_streams}）")
+            stream = LiveStream(str(uuid.uuid4()), sample_rate)
+            self.streams[stream.stream_id] = stream
+            return stream
+
+    def get(self, stream_id: str):
+        with self.lock:
+            self._sweep()
+            return self.streams.get(stream_id)
+
+    def remove(self, stream_id: str):
+        with self.lock:
+            self.streams.pop(stream_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'active': len(self.streams), 'max': self.max_streams, 'expired': self.expired}
+
+
+# 全局共享的实时流登记表
+live_streams = LiveStreamRegistry()
@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import BATCH_PROCESS_WORKERS, DATA_DIR
+from app.utils.data_processor import process_ecg_signal_from_file
+from app.utils.logging_config import setup_logging
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def spool_upload(stream) -> str:
+    """把上传的文件按块写入私有数据目录，返回文件路径（由调用方删除）。"""
+    fd, path = tempfile.mkstemp(suffix='.mat', dir=DATA_DIR)
+    with os.fdopen(fd, 'wb') as out:
+        shutil.copyfileobj(stream, out, 1024 * 1024)
+    return path
+
+
+def process_ecg_file(path: str, lead=None):
+    """
+    在工作进程中解码并重采样一个已落盘的 .mat 文件，返回 (resampled_signal, playback_waveform, quality_report, leads)。
+
+    父进程只传文件路径，文件内容不经过进程间通信；超过流式阈值的大文件由父进程自己流式处理，
+    这里总是整体读入，返回普通 ndarray，大小受流式阈值限制。
+    """
+    with open(path, 'rb') as f:
+        return process_ecg_signal_from_file(f, streaming=False, lead=lead)
+
+
+def get_processing_pool() -> ProcessPoolExecutor:
+    """
+    返回共享的信号处理进程池（首次使用时创建）。
+
+    解码和重采样是CPU密集的 scipy 计算，在线程中会被GIL串行化，放到进程池里才能用满多核。
+    使用 spawn 启动方式，避免在已经有后台线程的 worker 进程里 fork。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn 出的子进程不继承日志配置，各自安装同样的异步日志管道
+            _pool = ProcessPoolExecutor(max_workers=BATCH_PROCESS_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=setup_logging)
+        return _pool
+
+
+def reset_processing_pool():
+    """子进程异常退出后进程池会处于 broken 状态，丢弃它，下次使用时重新创建。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+
+from app.config import REPORT_CACHE_MAX_ENTRIES
+from app.services.result_cache import analysis_cache
+
+
+class _Flight:
+    """一次正在进行的报告生成，等待者通过 event 获取它的结果或异常。"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ReportCache:
+    """
+    AI报告的缓存，带 single-flight 去重。
+
+    后台报告任务和 tool_get_full_analysis_report 都通过它获取报告：
+    - 键是分析结果的内容摘要（analysis_key），相同数据的会话共享同一份报告；
+      没有摘要时退化为按会话ID缓存；
+    - 已生成的报告直接返回（先查进程内 LRU，再查分析结果缓存中持久化的报告）；
+    - 同一个键同时只会有一次生成在进行，其余调用方等待它完成并拿到同一个结果；
+    - 生成失败不会被缓存，等待中的调用方会收到同一个异常。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> report
+        self.flights = {}             # key -> _Flight
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.generations = 0
+        self.joined = 0
+
+    @staticmethod
+    def key_for(session_id: str, session: dict) -> str:
+        return session.get('analysis_key') or f"session:{session_id}"
+
+    def _remember(self, key, report):
+        """写入内存层并按 LRU 淘汰。调用方需持有锁。"""
+        self.entries[key] = report
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str):
+        """返回已缓存的报告，没有时返回 None。"""
+        with self.lock:
+            report = self.entries.get(key)
+            if report is not None:
+                self.entries.move_to_end(key)
+                return report
+        if key.startswith('session:'):
+            return None
+        report = analysis_cache.get_report(key)
+        if report is not None:
+            with self.lock:
+                self._remember(key, report)
+        return report
+
+    def put(self, key: str, report: str):
+        with self.lock:
+            self._remember(key, report)
+        if not key.startswith('session:'):
+            analysis_cache.attach_report(key, report)
+
+    def get_or_generate(self, key: str, generate) -> str:
+        """
+        返回键对应的报告；没有缓存时调用 generate() 生成并缓存。
+        同一个键上并发的调用只会执行一次 generate()。
+        """
+        report = self.get(key)
+        with self.lock:
+            # 重新检查内存层：上一次生成可能恰好在 get() 之后完成
+            report = report if report is not None else self.entries.get(key)
+            if report is not None:
+                self.hits += 1
+                return report
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.generations += 1
+            else:
+                self.joined += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = generate()
+            self.put(key, flight.result)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.event.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'generations': self.generations,
+                'joined_in_flight': self.joined,
+                'in_flight': len(self.flights),
+            }
+
+
+# 全局共享的报告缓存实例
+report_cache = ReportCache(max_entries=REPORT_CACHE_MAX_ENTRIES)
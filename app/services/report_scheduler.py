@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import (
+    REPORT_WORKER_COUNT,
+    REPORT_QUEUE_SIZE,
+    GLM_RPM_LIMIT,
+    GLM_TIME_WINDOW_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """报告队列已满。retry_after 为预计可以重试的等待秒数。"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"报告生成队列已满，请在约 {retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+class ReportScheduler:
+    """
+    后台报告生成的任务调度器：固定数量的工作线程 + 有界队列。
+
+    - 同一个会话的任务只会排队一次（重复提交返回已有的排队位置）；
+    - 队列满时 submit 抛出 QueueFullError，由调用方返回 429；
+    - cancel 可以撤销尚未开始的任务（例如会话被重置时）；
+    - position 返回任务的排队位置和预计完成时间，供 /session-status 展示。
+    """
+
+    def __init__(self, worker_count: int, max_queue_size: int):
+        """
+        Args:
+            worker_count (int): 工作线程数。
+            max_queue_size (int): 等待中的任务上限（不含正在执行的任务）。
+        """
+        self.worker_count = worker_count
+        self.max_queue_size = max_queue_size
+        self.pending = OrderedDict()  # session_id -> (job, 入队时间)，按先进先出排列
+        self.running = {}             # session_id -> 开始时间
+        self.cond = threading.Condition()
+        self.workers = []
+        # 单个任务平均耗时的指数滑动平均，初始值取GLM速率限制下每个请求的最小间隔
+        self.avg_job_seconds = GLM_TIME_WINDOW_SECONDS / GLM_RPM_LIMIT
+        self.completed = 0
+
+    def _ensure_workers(self):
+        """按需启动工作线程（避免在 gunicorn 主进程 fork 之前创建线程）。调用方需持有锁。"""
+        self.workers = [w for w in self.workers if w.is_alive()]
+        while len(self.workers) < self.worker_count:
+            worker = threading.Thread(target=self._worker_loop, name=f"report-worker-{len(self.workers)}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                session_id, (job, _) = self.pending.popitem(last=False)
+                self.running[session_id] = time.time()
+
+            start = time.time()
+            try:
+                job(session_id)
+            except Exception as e:
+                logger.exception("报告任务异常退出: %s", e, extra={'session_id': session_id})
+            finally:
+                with self.cond:
+                    self.running.pop(session_id, None)
+                    self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * (time.time() - start)
+                    self.completed += 1
+
+    def _eta(self, ahead: int) -> float:
+        """估算前面还有 ahead 个任务时，当前任务完成所需的秒数。调用方需持有锁。"""
+        by_workers = (ahead // self.worker_count + 1) * self.avg_job_seconds
+        # 所有任务共享GLM的速率限制，吞吐量不会高于 GLM_RPM_LIMIT / 时间窗口
+        by_rate_limit = (ahead + 1) * GLM_TIME_WINDOW_SECONDS / GLM_RPM_LIMIT
+        return max(by_workers, by_rate_limit)
+
+    def is_full(self) -> bool:
+        with self.cond:
+            return len(self.pending) >= self.max_queue_size
+
+    def estimated_wait(self) -> float:
+        """队列满时，预计多久之后会腾出一个排队位置（秒）。"""
+        with self.cond:
+            return self.avg_job_seconds / self.worker_count
+
+    def submit(self, session_id: str, job) -> dict:
+        """
+        提交一个报告任务。
+
+        Args:
+            job: 可调用对象，工作线程以 job(session_id) 的方式执行它。
+
+        Returns:
+            dict: 与 position() 相同的排队信息。
+
+        Raises:
+            QueueFullError: 等待队列已满。
+        """
+        with self.cond:
+            if session_id not in self.pending and session_id not in self.running:
+                if len(self.pending) >= self.max_queue_size:
+                    raise QueueFullError(self.estimated_wait())
+                self.pending[session_id] = (job, time.time())
+                self._ensure_workers()
+                self.cond.notify()
+            return self.position(session_id)
+
+    def cancel(self, session_id: str) -> bool:
+        """撤销尚未开始执行的任务，返回是否撤销成功。"""
+        with self.cond:
+            return self.pending.pop(session_id, None) is not None
+
+    def position(self, session_id: str):
+        """
+        返回任务的排队信息：{'position': 0 表示正在生成, 1 表示下一个..., 'eta_seconds': 预计剩余秒数}。
+        任务不在本进程的调度器中时返回 None。
+        """
+        with self.cond:
+            if session_id in self.running:
+                elapsed = time.time() - self.running[session_id]
+                return {'position': 0, 'eta_seconds': round(max(self.avg_job_seconds - elapsed, 0), 1)}
+            for index, queued_id in enumerate(self.pending):
+                if queued_id == session_id:
+                    ahead = index + len(self.running)
+                    return {'position': index + 1, 'eta_seconds': round(self._eta(ahead), 1)}
+        return None
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                'workers': self.worker_count,
+                'queued': len(self.pending),
+                'running': len(self.running),
+                'completed': self.completed,
+                'avg_job_seconds': round(self.avg_job_seconds, 2),
+            }
+
+
+# 全局共享的报告调度器
+report_scheduler = ReportScheduler(worker_count=REPORT_WORKER_COUNT, max_queue_size=REPORT_QUEUE_SIZE)
@@ -0,0 +1,60 @@
+from app.utils.async_condition import AsyncAwareCondition
+
+
+class ReportStreamHub:
+    """
+    进程内的报告文本广播：报告任务边生成边 publish，SSE 连接通过 read 订阅。
+
+    每个会话保留已生成的全部文本，因此中途加入的订阅者也能从头拿到完整内容。
+    任务结束后调用 close 清理缓冲区，此后订阅者应转而从会话中读取最终报告。
+    """
+
+    def __init__(self):
+        self.streams = {}  # session_id -> {'chunks': [...], 'done': bool}
+        self.cond = AsyncAwareCondition()
+
+    def open(self, session_id: str):
+        with self.cond:
+            self.streams[session_id] = {'chunks': [], 'done': False}
+
+    def publish(self, session_id: str, text: str):
+        with self.cond:
+            stream = self.streams.get(session_id)
+            if stream is not None:
+                stream['chunks'].append(text)
+                self.cond.notify_all()
+
+    def close(self, session_id: str):
+        with self.cond:
+            stream = self.streams.pop(session_id, None)
+            if stream is not None:
+                stream['done'] = True
+                self.cond.notify_all()
+
+    def read(self, session_id: str, offset: int, timeout: float):
+        """
+        等待第 offset 段之后的新文本，最多等待 timeout 秒。
+
+        Returns:
+            (新的文本段列表, 是否已结束)；本进程中没有该会话的生成任务时返回 None。
+        """
+        with self.cond:
+            stream = self.streams.get(session_id)
+            if stream is None:
+                return None
+            self.cond.wait_for(lambda: len(stream['chunks']) > offset or stream['done'], timeout)
+            return stream['chunks'][offset:], stream['done']
+
+    async def read_async(self, session_id: str, offset: int, timeout: float):
+        """read 的 asyncio 版本：等待期间不占用线程。"""
+        with self.cond:
+            stream = self.streams.get(session_id)
+        if stream is None:
+            return None
+        await self.cond.wait_for_async(lambda: len(stream['chunks']) > offset or stream['done'], timeout)
+        with self.cond:
+            return stream['chunks'][offset:], stream['done']
+
+
+# 全局共享的报告文本广播实例
+report_stream_hub = ReportStreamHub()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+
+from app.config import ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_TTL_SECONDS, ANALYSIS_CACHE_DB_PATH
+
+
+def make_analysis_key(signal, sample_rate: int, method: str, chunk_size: int = 1 << 20) -> str:
+    """
+    计算一次HeartVoice分析的内容地址：重采样信号（float32字节）+ 采样率 + 分析方法的哈希。
+    分块读取信号，因此对磁盘上的 memmap 也不会整体读入内存。
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{sample_rate}:{method}:".encode())
+    for start in range(0, len(signal), chunk_size):
+        chunk = np.ascontiguousarray(signal[start:start + chunk_size], dtype=np.float32)
+        digest.update(memoryview(chunk).cast('B'))
+    return digest.hexdigest()
+
+
+class AnalysisResultCache:
+    """
+    HeartVoice分析结果的缓存：进程内 LRU + TTL，可选 sqlite 磁盘层。
+
+    每个条目保存HeartVoice返回的 data 块，以及（如果已经生成过）对应的AI报告，
+    相同的录音再次上传时可以跳过网络请求，甚至直接复用报告。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, db_path: str = None):
+        """
+        Args:
+            max_entries (int): 内存层最多保留的条目数，超出后淘汰最久未使用的条目。
+            ttl_seconds (int): 条目的存活时间（秒）。
+            db_path (str): sqlite 文件路径；为 None 时只使用内存层。
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.entries = OrderedDict()  # key -> (过期时间, {'data': ..., 'report': ...})
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    "key TEXT PRIMARY KEY, data TEXT NOT NULL, report TEXT, expires_at REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key, expires_at, entry):
+        """写入内存层并按 LRU 淘汰。调用方需持有锁。"""
+        self.entries[key] = (expires_at, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str):
+        """查找缓存条目，命中时返回 {'data': ..., 'report': ...}，否则返回 None。"""
+        now = time.time()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and cached[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(cached[1])
+            if cached:
+                del self.entries[key]
+
+        entry = None
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT data, report, expires_at FROM analysis_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            if row:
+                entry = {'data': json.loads(row[0]), 'report': row[1]}
+                with self.lock:
+                    self._remember(key, row[2], entry)
+
+        with self.lock:
+            if entry:
+                self.hits += 1
+                return dict(entry)
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: dict):
+        """缓存HeartVoice返回的 data 块（会清除该键上旧的报告）。"""
+        expires_at = time.time() + self.ttl_seconds
+        with self.lock:
+            self._remember(key, expires_at, {'data': data, 'report': None})
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, data, report, expires_at) VALUES (?, ?, NULL, ?)",
+                    (key, json.dumps(data, ensure_ascii=False), expires_at)
+                )
+                conn.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),))
+
+    def attach_report(self, key: str, report: str):
+        """把生成成功的AI报告附加到已有条目上，后续命中时可直接复用。"""
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached:
+                cached[1]['report'] = report
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("UPDATE analysis_cache SET report = ? WHERE key = ?", (report, key))
+
+    def get_report(self, key: str):
+        """只查询条目上已附加的报告（不计入命中统计），没有时返回 None。"""
+        now = time.time()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and cached[0] > now and cached[1].get('report'):
+                return cached[1]['report']
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT report FROM analysis_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            if row and row[0]:
+                return row[0]
+        return None
+
+    def stats(self) -> dict:
+        """返回缓存的命中统计。"""
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# 全局共享的分析结果缓存实例
+analysis_cache = AnalysisResultCache(
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+    db_path=ANALYSIS_CACHE_DB_PATH
+)
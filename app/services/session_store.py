@@ -0,0 +1,433 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.utils.private_dir import ensure_private_dir
+from app.utils.waveform_pyramid import WaveformPyramid
+
+# 信号文件按块写入，峰值内存与记录长度无关
+_SIGNAL_CHUNK_SAMPLES = 1 << 20
+_ARTIFACT_NAME = re.compile(r'\w+')
+
+
+def _estimate_nbytes(obj) -> int:
+    """粗略估算一个对象（及其 numpy 数组成员）占用的内存字节数；memmap 在磁盘上，不计入。"""
+    if isinstance(obj, np.memmap):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_estimate_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_estimate_nbytes(v) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return _estimate_nbytes(vars(obj))
+    return sys.getsizeof(obj)
+
+
+class _CachedSession:
+    """内存层中的一个会话：字段快照、版本号、过期时间，以及已加载的大对象（artifacts）。"""
+    __slots__ = ('fields', 'version', 'expires_at', 'artifacts', 'nbytes')
+
+    def __init__(self, fields, version, expires_at):
+        self.fields = fields
+        self.version = version
+        self.expires_at = expires_at
+        self.artifacts = {}
+        self.nbytes = len(json.dumps(fields, ensure_ascii=False, default=str))
+
+
+class SessionStore:
+    """
+    会话存储：进程内 LRU + TTL 内存层，加上可选的 sqlite（WAL 模式）共享层。
+
+    - 会话字段（status、full_analysis、report 等可JSON序列化的数据）保存在 sessions 表中，
+      所有 gunicorn worker 读写同一个数据库文件，因此请求落在哪个 worker 上都能找到会话；
+    - 波形、金字塔等大对象作为 artifact 单独保存，按需加载并缓存在内存层；
+    - 每次写入都会递增版本号，内存层读取时只需比对版本号即可判断缓存是否仍然有效；
+    - transition() 在一个 IMMEDIATE 事务中完成“比较并设置”，保证状态迁移是原子的。
+
+    db_path 为 None 时只使用内存层，此时内存层就是唯一的数据来源，超出上限会直接淘汰会话。
+
+    artifact 不使用 pickle：numpy 数组以 .npy 格式保存；波形金字塔只把包络层级存入数据库，
+    完整信号按块写成 float32 原始文件放在数据库旁的 0700 目录中，读取时以只读 memmap 打开。
+    """
+
+    def __init__(self, db_path=None, ttl_seconds=6 * 3600, max_sessions=10000,
+                 cache_max_entries=256, cache_max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            db_path (str): sqlite 文件路径；为 None 时只使用内存层。
+            ttl_seconds (int): 会话自最后一次访问起的存活时间（秒）。
+            max_sessions (int): 共享层最多保留的会话数，超出时淘汰最早过期的会话。
+            cache_max_entries (int): 内存层最多缓存的会话数。
+            cache_max_bytes (int): 内存层（含 artifacts）的内存上限（字节）。
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.cache_max_entries = cache_max_entries
+        self.cache_max_bytes = cache_max_bytes
+        # 访问时续期的最小间隔，避免每次读取都写数据库
+        self.touch_interval = min(60, ttl_seconds / 10)
+
+        # 仅使用内存层时，它就是唯一的数据来源，条目上限取 max_sessions
+        self.entry_limit = cache_max_entries if db_path else max_sessions
+        self.cache = OrderedDict()  # session_id -> _CachedSession
+        self.cache_bytes = 0
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.artifact_dir = ensure_private_dir(f'{db_path}-artifacts') if db_path else None
+        if db_path:
+            with self._transaction() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "id TEXT PRIMARY KEY, status TEXT, data TEXT NOT NULL, nbytes INTEGER NOT NULL, "
+                    "version INTEGER NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS session_artifacts ("
+                    "session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE, "
+                    "name TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (session_id, name))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+
+    # ------------------------------------------------------------------ sqlite
+
+    def _connection(self):
+        """每个线程（且每个进程，fork 之后需要重新连接）一个 sqlite 连接。"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """开启一个 IMMEDIATE 事务：立即获取写锁，跨进程互斥。"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _purge(self, conn, now) -> list:
+        """删除已过期的会话，并把会话总数压到 max_sessions 以内，返回被删除的会话ID。"""
+        rows = conn.execute(
+            "SELECT id FROM sessions WHERE expires_at <= ? UNION "
+            "SELECT id FROM (SELECT id FROM sessions WHERE expires_at > ? ORDER BY expires_at ASC "
+            "LIMIT max(0, (SELECT COUNT(*) FROM sessions WHERE expires_at > ?) - ?))",
+            (now, now, now, self.max_sessions)
+        ).fetchall()
+        purged = [row[0] for row in rows]
+        conn.executemany("DELETE FROM sessions WHERE id = ?", rows)
+        return purged
+
+    # -------------------------------------------------------------- artifacts
+
+    @staticmethod
+    def _signal_prefix(session_id) -> str:
+        """信号文件名前缀：会话ID的摘要，保证文件名不会逃出 artifact_dir。"""
+        return hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32]
+
+    def _signal_file(self, session_id, name) -> str:
+        if not _ARTIFACT_NAME.fullmatch(name):
+            raise ValueError(f"非法的 artifact 名称: {name!r}")
+        return os.path.join(self.artifact_dir, f'{self._signal_prefix(session_id)}-{name}.f32')
+
+    def _remove_signal_files(self, session_ids):
+        for session_id in session_ids:
+            for path in glob.glob(os.path.join(self.artifact_dir, f'{self._signal_prefix(session_id)}-*.f32')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _write_signal(self, path, signal):
+        """把信号按块写成 float32 原始文件（先写临时文件再原子替换，正在读取旧文件的进程不受影响）。"""
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(signal), _SIGNAL_CHUNK_SAMPLES):
+                np.asarray(signal[start:start + _SIGNAL_CHUNK_SAMPLES], dtype=np.float32).tofile(f)
+        os.replace(tmp_path, path)
+
+    def _encode_artifact(self, session_id, name, obj) -> bytes:
+        """把 artifact 编码为不含 pickle 的 npz 字节；波形金字塔的完整信号另存为文件。"""
+        if isinstance(obj, WaveformPyramid):
+            path = self._signal_file(session_id, name)
+            self._write_signal(path, obj.signal)
+            arrays = dict(obj.state(), kind=np.asarray('waveform_pyramid'), signal_length=np.asarray(len(obj.signal)))
+        elif isinstance(obj, np.ndarray):
+            arrays = {'kind': np.asarray('array'), 'value': obj}
+        else:
+            raise TypeError(f"不支持的 artifact 类型: {type(obj).__name__}")
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    def _decode_artifact(self, session_id, name, blob):
+        """_encode_artifact 的逆操作；信号文件缺失或长度不符时返回 None。"""
+        with np.load(io.BytesIO(blob), allow_pickle=False) as archive:
+            arrays = {key: archive[key] for key in archive.files}
+        kind = str(arrays.pop('kind'))
+        if kind == 'array':
+            return arrays['value']
+        if kind != 'waveform_pyramid':
+            return None
+        length = int(arrays.pop('signal_length'))
+        path = self._signal_file(session_id, name)
+        try:
+            if os.path.getsize(path) != length * np.dtype(np.float32).itemsize:
+                return None
+        except OSError:
+            return None
+        signal = np.memmap(path, dtype=np.float32, mode='r', shape=(length,)) if length else np.zeros(0, np.float32)
+        return WaveformPyramid.from_state(signal, arrays)
+
+    # ------------------------------------------------------------ memory tier
+
+    def _cache_put(self, session_id, entry):
+        """写入内存层并按条目数与字节数做 LRU 淘汰（不会淘汰刚写入的条目）。调用方需持有锁。"""
+        self._cache_drop(session_id)
+        self.cache[session_id] = entry
+        self.cache_bytes += entry.nbytes
+        while len(self.cache) > 1 and (len(self.cache) > self.entry_limit or self.cache_bytes > self.cache_max_bytes):
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted.nbytes
+
+    def _cache_drop(self, session_id):
+        entry = self.cache.pop(session_id, None)
+        if entry:
+            self.cache_bytes -= entry.nbytes
+
+    def _load(self, session_id):
+        """返回最新的 _CachedSession（必要时从共享层刷新），会话不存在或已过期时返回 None。"""
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(session_id)
+            if entry and entry.expires_at <= now:
+                self._cache_drop(session_id)
+                entry = None
+            if not self.db_path:
+                if entry:
+                    self.cache.move_to_end(session_id)
+                    entry.expires_at = now + self.ttl_seconds
+                return entry
+
+        # 只有版本号变化时才取回并解析 data 列
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT version, expires_at, CASE WHEN version = ? THEN NULL ELSE data END "
+            "FROM sessions WHERE id = ? AND expires_at > ?",
+            (entry.version if entry else -1, session_id, now)
+        ).fetchone()
+        if row is None:
+            with self.lock:
+                self._cache_drop(session_id)
+            return None
+
+        version, expires_at, data = row
+        if expires_at - now < self.ttl_seconds - self.touch_interval:
+            expires_at = now + self.ttl_seconds
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, session_id))
+
+        with self.lock:
+            if data is not None:
+                fresh = _CachedSession(json.loads(data), version, expires_at)
+                if entry and entry.version < version:
+                    # artifact 写入后不可变，版本号变化不影响已加载的大对象
+                    fresh.artifacts = entry.artifacts
+                    fresh.nbytes += sum(_estimate_nbytes(a) for a in entry.artifacts.values())
+                entry = fresh
+            entry.expires_at = expires_at
+            self._cache_put(session_id, entry)
+        return entry
+
+    # ---------------------------------------------------------------- public
+
+    def create(self, session_id: str, fields: dict, artifacts: dict = None):
+        """
+        创建（或覆盖）一个会话。
+
+        Args:
+            fields (dict): 可JSON序列化的会话字段，至少包含 'status'。
+            artifacts (dict): 名称 -> 大对象（numpy 数组、波形金字塔等），按需通过 get_artifact 读取。
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        artifacts = artifacts or {}
+        entry = _CachedSession(dict(fields), 1, expires_at)
+        entry.artifacts = dict(artifacts)
+        entry.nbytes += sum(_estimate_nbytes(a) for a in artifacts.values())
+
+        if self.db_path:
+            data = json.dumps(fields, ensure_ascii=False)
+            try:
+                blobs = [(session_id, name, self._encode_artifact(session_id, name, obj))
+                         for name, obj in artifacts.items()]
+                with self._transaction() as conn:
+                    purged = self._purge(conn, now)
+                    conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                    conn.execute(
+                        "INSERT INTO sessions (id, status, data, nbytes, version, expires_at) VALUES (?, ?, ?, ?, 1, ?)",
+                        (session_id, fields.get('status'), data, len(data) + sum(len(b[2]) for b in blobs), expires_at)
+                    )
+                    conn.executemany("INSERT INTO session_artifacts (session_id, name, data) VALUES (?, ?, ?)", blobs)
+            except BaseException:
+                self._remove_signal_files([session_id])
+                raise
+            self._remove_signal_files(purged_id for purged_id in purged if purged_id != session_id)
+        with self.lock:
+            self._cache_put(session_id, entry)
+
+    def get(self, session_id: str, default=None):
+        """返回会话字段的一个副本（修改它不会影响存储，请使用 update / transition）。"""
+        entry = self._load(session_id)
+        return dict(entry.fields) if entry else default
+
+    def get_artifact(self, session_id: str, name: str, default=None):
+        """读取会话的一个大对象，首次读取后缓存在内存层。"""
+        entry = self._load(session_id)
+        if entry is None:
+            return default
+        if name in entry.artifacts:
+            return entry.artifacts[name]
+        if not self.db_path:
+            return default
+        row = self._connection().execute(
+            "SELECT data FROM session_artifacts WHERE session_id = ? AND name = ?", (session_id, name)
+        ).fetchone()
+        if row is None:
+            return default
+        obj = self._decode_artifact(session_id, name, row[0])
+        if obj is None:
+            return default
+        with self.lock:
+            cached = self.cache.get(session_id) is entry
+            if cached:
+                self._cache_drop(session_id)
+            entry.artifacts[name] = obj
+            entry.nbytes += _estimate_nbytes(obj)
+            if cached:
+                self._cache_put(session_id, entry)
+        return obj
+
+    def transition(self, session_id: str, expected_status, new_status: str = None, **fields) -> bool:
+        """
+        原子地更新会话：仅当当前状态属于 expected_status 时才写入。
+
+        Args:
+            expected_status: 允许的当前状态（字符串或元组）；为 None 表示不检查状态。
+            new_status (str): 新状态；为 None 时保持不变。
+            **fields: 需要一并更新的其他字段。
+
+        Returns:
+            bool: 会话存在且状态匹配并已更新时返回 True。
+        """
+        if isinstance(expected_status, str):
+            expected_status = (expected_status,)
+        if new_status is not None:
+            fields['status'] = new_status
+        now = time.time()
+
+        if not self.db_path:
+            with self.lock:
+                entry = self.cache.get(session_id)
+                if not entry or entry.expires_at <= now:
+                    return False
+                if expected_status is not None and entry.fields.get('status') not in expected_status:
+                    return False
+                self._cache_drop(session_id)
+                entry.fields.update(fields)
+                entry.version += 1
+                entry.expires_at = now + self.ttl_seconds
+                entry.nbytes = (len(json.dumps(entry.fields, ensure_ascii=False, default=str))
+                                + sum(_estimate_nbytes(a) for a in entry.artifacts.values()))
+                self._cache_put(session_id, entry)
+                return True
+
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data, version FROM sessions WHERE id = ? AND expires_at > ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                return False
+            current = json.loads(row[0])
+            if expected_status is not None and current.get('status') not in expected_status:
+                return False
+            current.update(fields)
+            data = json.dumps(current, ensure_ascii=False)
+            conn.execute(
+                "UPDATE sessions SET status = ?, data = ?, nbytes = nbytes - ? + ?, version = ?, expires_at = ? "
+                "WHERE id = ?",
+                (current.get('status'), data, len(row[0]), len(data), row[1] + 1, now + self.ttl_seconds, session_id)
+            )
+        return True
+
+    def update(self, session_id: str, **fields) -> bool:
+        """无条件地更新会话字段，会话不存在时返回 False。"""
+        return self.transition(session_id, None, **fields)
+
+    def delete(self, session_id: str) -> bool:
+        """删除会话及其所有 artifact，返回会话此前是否存在。"""
+        with self.lock:
+            existed = session_id in self.cache
+            self._cache_drop(session_id)
+        if self.db_path:
+            with self._transaction() as conn:
+                existed = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+            self._remove_signal_files([session_id])
+        return existed
+
+    def __contains__(self, session_id):
+        return self._load(session_id) is not None
+
+    def __delitem__(self, session_id):
+        if not self.delete(session_id):
+            raise KeyError(session_id)
+
+    def __len__(self):
+        if not self.db_path:
+            now = time.time()
+            with self.lock:
+                return sum(1 for e in self.cache.values() if e.expires_at > now)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+
+    def stats(self) -> dict:
+        """返回会话数量与内存占用统计。"""
+        with self.lock:
+            stats = {
+                'backend': 'sqlite' if self.db_path else 'memory',
+                'cached_sessions': len(self.cache),
+                'cache_bytes': self.cache_bytes,
+                'cache_max_bytes': self.cache_max_bytes,
+            }
+        if self.db_path:
+            count, stored = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM sessions WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+            stats.update(sessions=count, stored_bytes=stored)
+        else:
+            stats.update(sessions=len(self), stored_bytes=stats['cache_bytes'])
+        return stats
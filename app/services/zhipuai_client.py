@@ -1,26 +1,50 @@
+import json
+import logging
 import requests
-import pprint
-from app.config import ZHIPU_API_TOKEN, GLM_API_URL, GLM_MODEL_NAME, GLM_RPM_LIMIT, GLM_TIME_WINDOW_SECONDS
-from app.utils.request_controller import RequestController
+import time
+from app.config import (
+    ZHIPU_API_TOKENS, GLM_API_URL, GLM_MODEL_NAME, GLM_RPM_LIMIT, GLM_TIME_WINDOW_SECONDS,
+    RATE_LIMIT_DB_PATH, GLM_INTERACTIVE_RESERVE, GLM_INTERACTIVE_MAX_WAIT_S
+)
+from app.utils.request_controller import RequestController, RateLimitExceeded, PRIORITY_INTERACTIVE, PRIORITY_IDLE
+from app.utils.metrics import RATE_LIMIT_REJECTIONS, RATE_LIMIT_WAIT_SECONDS, metrics
+from app.services.http_client import glm_client
+from app.toolkit.prompt_compiler import count_message_tokens
+
+logger = logging.getLogger(__name__)
 
 # 【新增】在服务层初始化一个全局的速率控制器实例
-# 所有对 get_glm_response 的调用都会共享这个控制器
+# 所有对 get_glm_response 的调用（包括其他 worker 进程中的调用）都会共享这个控制器的配额
 glm_rate_limiter = RequestController(
     max_requests=GLM_RPM_LIMIT,
-    per_seconds=GLM_TIME_WINDOW_SECONDS
+    per_seconds=GLM_TIME_WINDOW_SECONDS,
+    api_keys=ZHIPU_API_TOKENS,
+    db_path=RATE_LIMIT_DB_PATH,
+    interactive_reserve=GLM_INTERACTIVE_RESERVE
 )
 
+# 每次GLM请求的提示词 token 数（估算值）
+GLM_PROMPT_TOKENS = metrics.histogram(
+    'ecg_glm_prompt_tokens', "Estimated prompt tokens per GLM request.", ['kind'],
+    buckets=(100, 200, 400, 800, 1600, 3200, 6400, 12800))
+
 
-def get_glm_response(messages: list, tools: list = None, tool_choice: str = "auto"):
+def _rate_limit_params(priority: int):
     """
-    向智谱AI GLM模型发起请求并获取响应（已集成速率控制）。
+    返回 (等待上限秒数, 指标中的优先级标签)。交互式请求最多等待 GLM_INTERACTIVE_MAX_WAIT_S 秒，
+    后台请求一直等待，空闲优先级的请求不等待（没有空闲令牌时立即抛出 RateLimitExceeded）。
     """
-    # 【新增】在发起任何请求前，先调用控制器等待一个“通行槽位”
-    glm_rate_limiter.wait_for_slot()
-    
-    if not ZHIPU_API_TOKEN:
+    if not ZHIPU_API_TOKENS:
         raise ValueError("ZHIPU_API_TOKEN 未在环境中配置。")
+    if priority == PRIORITY_INTERACTIVE:
+        return GLM_INTERACTIVE_MAX_WAIT_S, 'interactive'
+    if priority == PRIORITY_IDLE:
+        return 0.0, 'idle'
+    return None, 'background'
+
 
+def _build_glm_request(messages: list, tools: list, tool_choice: str, api_key: str):
+    """构造发往GLM的请求头与负载（同步和异步调用共用）。"""
     payload = {
         "model": GLM_MODEL_NAME,
         "messages": messages
@@ -30,19 +54,134 @@ def get_glm_response(messages: list, tools: list = None, tool_choice: str = "aut
         payload["tools"] = tools
         payload["tool_choice"] = tool_choice
 
-    print("--- Sending Payload to GLM API ---")
-    pprint.pprint(payload)
-    print("------------------------------------")
+    prompt_tokens = count_message_tokens(messages, tools)
+    GLM_PROMPT_TOKENS.observe(prompt_tokens, kind='tools' if tools else 'chat')
+    logger.info("GLM request prepared", extra={
+        'prompt_tokens': prompt_tokens, 'messages': len(messages), 'tools': len(tools) if tools else 0})
+    # 完整请求体（含知识库/分析数据）只在 DEBUG 级别按比例采样输出，并在日志线程中截断
+    logger.debug("GLM payload", extra={'payload': payload})
     
     headers = {
-        'Authorization': f'Bearer {ZHIPU_API_TOKEN}',
+        'Authorization': f'Bearer {api_key}',
         'Content-Type': 'application/json'
     }
+    return headers, payload
+
+
+def _acquire_glm_slot(priority: int) -> str:
+    """等待速率控制器的一个“通行槽位”，返回本次请求应使用的密钥。"""
+    timeout, priority_label = _rate_limit_params(priority)
+    started = time.perf_counter()
+    try:
+        api_key = glm_rate_limiter.wait_for_slot(priority, timeout=timeout)
+    except RateLimitExceeded:
+        RATE_LIMIT_REJECTIONS.inc(priority=priority_label)
+        raise
+    RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - started, priority=priority_label)
+    return api_key
+
+
+async def _acquire_glm_slot_async(priority: int) -> str:
+    """_acquire_glm_slot 的 asyncio 版本：等待速率配额期间让出事件循环，不占用线程。"""
+    timeout, priority_label = _rate_limit_params(priority)
+    started = time.perf_counter()
+    try:
+        api_key = await glm_rate_limiter.wait_for_slot_async(priority, timeout=timeout)
+    except RateLimitExceeded:
+        RATE_LIMIT_REJECTIONS.inc(priority=priority_label)
+        raise
+    RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - started, priority=priority_label)
+    return api_key
+
+
+def _with_api_key(kwargs: dict, api_key: str) -> dict:
+    return {**kwargs, 'headers': {**kwargs['headers'], 'Authorization': f'Bearer {api_key}'}}
+
+
+def _retry_through_limiter(priority: int):
+    """
+    glm_client.post 的 before_retry：每次重试（包括上游返回 429 之后）都重新申请一个槽位，
+    重试同样计入速率配额，并可能换用另一个有余量的密钥。
+    """
+    return lambda kwargs: _with_api_key(kwargs, _acquire_glm_slot(priority))
+
+
+def _retry_through_limiter_async(priority: int):
+    """_retry_through_limiter 的 asyncio 版本。"""
+    async def before_retry(kwargs):
+        return _with_api_key(kwargs, await _acquire_glm_slot_async(priority))
+    return before_retry
+
+
+def _prepare_glm_request(messages: list, tools: list, tool_choice: str, priority: int):
+    """等待速率配额，并构造发往GLM的请求头与负载。"""
+    # 【新增】在发起任何请求前，先调用控制器等待一个“通行槽位”，并取得本次使用的密钥
+    return _build_glm_request(messages, tools, tool_choice, _acquire_glm_slot(priority))
+
+
+async def _prepare_glm_request_async(messages: list, tools: list, tool_choice: str, priority: int):
+    """_prepare_glm_request 的 asyncio 版本：等待速率配额期间让出事件循环，不占用线程。"""
+    return _build_glm_request(messages, tools, tool_choice, await _acquire_glm_slot_async(priority))
+
+
+def _stream_delta(line: str):
+    """
+    解析GLM流式响应（SSE）中的一行。
+
+    Returns:
+        (是否结束, 文本增量或 None)
+    """
+    if not line or not line.startswith('data:'):
+        return False, None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return True, None
+    return False, json.loads(data)['choices'][0].get('delta', {}).get('content') or None
+
+
+def get_glm_response(messages: list, tools: list = None, tool_choice: str = "auto", priority: int = PRIORITY_INTERACTIVE):
+    """
+    向智谱AI GLM模型发起请求并获取响应（已集成速率控制）。
+
+    交互式请求最多等待 GLM_INTERACTIVE_MAX_WAIT_S 秒，超时抛出 RateLimitExceeded；
+    后台请求（priority=PRIORITY_BACKGROUND）会一直等到有空闲配额为止；
+    空闲优先级的请求（priority=PRIORITY_IDLE）没有空闲配额时立即抛出 RateLimitExceeded。
+    """
+    headers, payload = _prepare_glm_request(messages, tools, tool_choice, priority)
 
     try:
-        response = requests.post(GLM_API_URL, headers=headers, json=payload)
+        response = glm_client.post(GLM_API_URL, headers=headers, json=payload,
+                                   before_retry=_retry_through_limiter(priority))
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"调用GLM API时发生网络错误: {e}")
-        raise
\ No newline at end of file
+        logger.error("调用GLM API时发生网络错误: %s", e)
+        raise
+
+
+def stream_glm_response(messages: list, priority: int = PRIORITY_INTERACTIVE):
+    """
+    以流式（stream=true）方式调用GLM，逐段产出模型生成的文本增量。
+    速率控制与 get_glm_response 相同；生成器被关闭时会释放底层连接。
+    """
+    headers, payload = _prepare_glm_request(messages, None, None, priority)
+    payload["stream"] = True
+
+    try:
+        response = glm_client.post(GLM_API_URL, headers=headers, json=payload, stream=True,
+                                   before_retry=_retry_through_limiter(priority))
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.error("调用GLM API时发生网络错误: %s", e)
+        raise
+
+    with response:
+        # 响应为SSE格式：每行 "data: {json}"，以 "data: [DONE]" 结束。
+        # text/event-stream 规定为 UTF-8，上游通常不带 charset，requests 会按 ISO-8859-1 解码导致中文乱码
+        response.encoding = 'utf-8'
+        for line in response.iter_lines(decode_unicode=True):
+            done, delta = _stream_delta(line)
+            if done:
+                break
+            if delta:
+                yield delta
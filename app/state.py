@@ -1 +1,17 @@
-SESSIONS = {}
\ No newline at end of file
+from app.config import (
+    SESSION_DB_PATH,
+    SESSION_TTL_SECONDS,
+    SESSION_MAX_COUNT,
+    SESSION_CACHE_MAX_ENTRIES,
+    SESSION_CACHE_MAX_BYTES
+)
+from app.services.session_store import SessionStore
+
+# 所有模块共享的会话存储；配置了 SESSION_DB_PATH 时，各 gunicorn worker 通过同一个 sqlite 文件共享会话
+SESSIONS = SessionStore(
+    db_path=SESSION_DB_PATH,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_sessions=SESSION_MAX_COUNT,
+    cache_max_entries=SESSION_CACHE_MAX_ENTRIES,
+    cache_max_bytes=SESSION_CACHE_MAX_BYTES
+)
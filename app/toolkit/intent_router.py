@@ -0,0 +1,160 @@
+import re
+import time
+from threading import Lock
+
+from app.config import INTENT_ROUTER_MIN_CONFIDENCE
+from app.toolkit.knowledge import get_flat_knowledge_base
+
+# 查询类问题中常见的、不影响意图的词语；去掉指标名和这些词后剩下的内容越少，说明问题越单纯
+_FILLER_WORDS = [
+    "请问", "请", "帮我", "帮忙", "麻烦", "告诉我", "我想知道", "想知道", "我想看", "查询", "查一下", "查下", "查看",
+    "看看", "看一下", "显示", "给我", "我的", "我", "的", "是多少", "有多少", "多少", "是", "数值", "值", "指标",
+    "现在", "目前", "当前", "这次", "一下", "怎么样", "如何", "呢", "吗", "啊", "呀", "和", "与", "及", "以及",
+    "还有", "还是", "情况", "水平", "结果",
+    "what", "whats", "what's", "is", "are", "my", "the", "show", "me", "tell", "of", "and", "value", "values",
+    "level", "how", "about", "please", "check", "current", "get",
+    "一份", "生成", "我要", "出", "give", "a", "an", "generate", "want", "i",
+]
+# 可以在本地直接调用的无参数工具及其触发短语（重置会话有破坏性，仍交给GLM判断）
+_TOOL_PHRASES = {
+    'tool_get_full_analysis_report': [
+        "完整报告", "完整的报告", "健康报告", "分析报告", "详细报告", "报告",
+        "full report", "complete report", "health report", "report",
+    ],
+}
+_TOOL_PREFIX = '@'  # 索引中区分工具和指标键的前缀
+_ASCII_WORD = re.compile(r'^[a-z0-9_/ \'.-]+$')
+_NOISE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def _term_pattern(term: str) -> str:
+    """英文/数字词条要求词边界（避免 'hr' 命中 'hrv'），中文词条直接做子串匹配。"""
+    escaped = re.escape(term)
+    if _ASCII_WORD.match(term):
+        return rf'(?<![a-z0-9]){escaped}(?![a-z0-9])'
+    return escaped
+
+
+class IntentRouter:
+    """
+    本地意图路由：不经过LLM，直接识别“查询某个/某几个指标”和“要完整报告”这类问题。
+
+    从 metric_knowledge_base.json 预编译一个“词条 -> 指标键”的索引（指标键、中文名、
+    aliases 别名，外加报告工具的触发短语），对用户问题做最长优先的匹配。只有当命中的
+    目标没有歧义、并且问题中除这些词条和常见虚词外几乎没有其他内容
+    （置信度 >= min_confidence）时才直接回答，其余情况（解释类问题、重置、闲聊等）
+    仍交给GLM决定。
+    """
+
+    def __init__(self, min_confidence: float = INTENT_ROUTER_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.lock = Lock()
+        self.counters = {'queries': 0, 'routed': 0, 'fallbacks': 0, 'route_seconds': 0.0,
+                         'glm_plan_calls': 0, 'glm_plan_seconds': 0.0}
+        self.term_to_targets = {}
+        self.pattern = None
+        self.filler_pattern = None
+
+    def _build_index(self):
+        """首次使用时编译索引。同一个词条指向多个目标时保留全部，匹配时视为有歧义。"""
+        term_to_targets = {}
+        for key, info in get_flat_knowledge_base().items():
+            terms = {key, key.replace('_', ' '), key.replace('_', ''), info.get('name_cn', '')}
+            terms.update(info.get('aliases', []))
+            for term in terms:
+                term = term.strip().lower()
+                if term:
+                    term_to_targets.setdefault(term, set()).add(key)
+        for tool_name, phrases in _TOOL_PHRASES.items():
+            for term in phrases:
+                term_to_targets.setdefault(term, set()).add(_TOOL_PREFIX + tool_name)
+        # 长词条优先，保证“心率变异性”不会被拆成“心率”
+        ordered = sorted(term_to_targets, key=len, reverse=True)
+        self.term_to_targets = term_to_targets
+        self.pattern = re.compile('|'.join(f'(?P<t{i}>{_term_pattern(t)})' for i, t in enumerate(ordered)))
+        self.terms_by_group = {f't{i}': t for i, t in enumerate(ordered)}
+        fillers = sorted(_FILLER_WORDS, key=len, reverse=True)
+        self.filler_pattern = re.compile('|'.join(_term_pattern(w) for w in fillers))
+
+    def _match(self, prompt: str):
+        """返回 (命中的目标列表, 置信度)，没有命中或有歧义时目标列表为空。工具以 _TOOL_PREFIX 开头。"""
+        text = prompt.lower()
+        matched_terms, spans = [], []
+        # 正则交替按顺序尝试，长词条在前；finditer 不重叠，因此天然是最长优先
+        for m in self.pattern.finditer(text):
+            matched_terms.append(self.terms_by_group[m.lastgroup])
+            spans.append(m.span())
+        if not matched_terms:
+            return [], 0.0
+
+        targets = []
+        for term in matched_terms:
+            candidates = self.term_to_targets[term]
+            if len(candidates) > 1:
+                return [], 0.0
+            (target,) = candidates
+            if target not in targets:
+                targets.append(target)
+
+        # 去掉命中的词条和虚词，统计剩余的“有意义”字符所占比例
+        residual = list(text)
+        for start, end in spans:
+            residual[start:end] = ' ' * (end - start)
+        residual = self.filler_pattern.sub(' ', ''.join(residual))
+        meaningful = len(_NOISE.sub('', text))
+        leftover = len(_NOISE.sub('', residual))
+        confidence = 1.0 - leftover / meaningful if meaningful else 0.0
+        return targets, confidence
+
+    def route(self, prompt: str):
+        """
+        尝试在本地识别问题的意图。
+
+        Returns:
+            置信度足够时返回 ('metrics', 指标键列表（按出现顺序）) 或 ('tool', 工具名)；
+            否则返回 None，调用方应回退到GLM。
+        """
+        start = time.perf_counter()
+        with self.lock:
+            if self.pattern is None:
+                self._build_index()
+        targets, confidence = self._match(prompt)
+        tools = [t[len(_TOOL_PREFIX):] for t in targets if t.startswith(_TOOL_PREFIX)]
+        intent = None
+        if targets and confidence >= self.min_confidence:
+            if not tools:
+                intent = ('metrics', targets)
+            elif len(targets) == 1:
+                intent = ('tool', tools[0])
+            # 同时提到工具和指标（如“心率报告”）时交给GLM判断
+        with self.lock:
+            self.counters['queries'] += 1
+            self.counters['routed' if intent else 'fallbacks'] += 1
+            self.counters['route_seconds'] += time.perf_counter() - start
+        return intent
+
+    def record_glm_plan(self, seconds: float):
+        """记录一次回退到GLM做工具决策的耗时，用于估算本地路由节省的时间。"""
+        with self.lock:
+            self.counters['glm_plan_calls'] += 1
+            self.counters['glm_plan_seconds'] += seconds
+
+    def stats(self) -> dict:
+        """命中率、本地路由平均耗时，以及按GLM决策平均耗时估算的节省时间。"""
+        with self.lock:
+            c = dict(self.counters)
+        avg_glm = c['glm_plan_seconds'] / c['glm_plan_calls'] if c['glm_plan_calls'] else None
+        return {
+            'queries': c['queries'],
+            'routed': c['routed'],
+            'fallbacks': c['fallbacks'],
+            'hit_rate': round(c['routed'] / c['queries'], 3) if c['queries'] else None,
+            'avg_route_ms': round(c['route_seconds'] / c['queries'] * 1000, 3) if c['queries'] else None,
+            'avg_glm_plan_ms': round(avg_glm * 1000, 1) if avg_glm is not None else None,
+            'glm_requests_saved': c['routed'],
+            'estimated_seconds_saved': round(c['routed'] * avg_glm, 1) if avg_glm is not None else None,
+        }
+
+
+# 全局共享的意图路由实例
+intent_router = IntentRouter()
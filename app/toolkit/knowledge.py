@@ -1,6 +1,9 @@
 import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 _knowledge_base_raw = None
 _knowledge_base_flat = None
 
@@ -14,7 +17,7 @@ def _load_kb_if_needed():
             with open(json_path, 'r', encoding='utf-8') as f:
                 _knowledge_base_raw = json.load(f)
         except FileNotFoundError:
-            print("错误：metric_knowledge_base.json 文件未找到！")
+            logger.error("metric_knowledge_base.json 文件未找到！")
             _knowledge_base_raw = {}
 
 def get_flat_knowledge_base():
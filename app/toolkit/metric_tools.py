@@ -1,18 +1,27 @@
 import json
+import logging
 from app.state import SESSIONS
+from app.services.answer_cache import answer_cache
+from app.services.report_scheduler import report_scheduler
+from app.services.report_cache import report_cache
 from app.services.zhipuai_client import get_glm_response
-from app.toolkit.knowledge import get_knowledge_for_prompt
-from app.config import ZHIPU_API_TOKEN, GLM_API_URL, GLM_MODEL_NAME
+from app.toolkit.prompt_compiler import report_messages
+from app.config import ZHIPU_API_TOKENS, GLM_API_URL, GLM_MODEL_NAME
 # (这里粘贴之前在 app.py 中定义的所有 tool_* 函数)
 # 例如 tool_get_specific_metric, tool_reset_session 等
 # 注意：原先的 tool_get_full_analysis_report 为方便演示，这里也只返回模拟内容
 from app.toolkit.knowledge import get_knowledge_for_prompt, get_flat_knowledge_base
+from app.utils.request_controller import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+
 def tool_get_full_analysis_report(session_id: str) -> str:
     """
     工具函数：获取并生成完整的健康分析报告。
     它从会话中读取数据，然后调用GLM模型生成报告。
     """
-    print(f"--- [Tool Executing] tool_get_full_analysis_report for session: {session_id} ---")
+    logger.info("Tool executing: tool_get_full_analysis_report", extra={'session_id': session_id})
     
     # 从会话中获取数据
     session_data = SESSIONS.get(session_id)
@@ -20,41 +29,61 @@ def tool_get_full_analysis_report(session_id: str) -> str:
         return "工具执行失败：未找到有效的分析数据。请先上传文件进行分析。"
 
     full_api_data = session_data['full_analysis']
+
+    # 后台任务已经生成好的报告直接复用，不再调用GLM
+    if session_data.get('status') == 'ready' and session_data.get('report'):
+        logger.info("Tool finished: reused the report generated in background", extra={'session_id': session_id})
+        return _clean_report(session_data['report'])
     
     # 检查API Token
-    if not ZHIPU_API_TOKEN:
+    if not ZHIPU_API_TOKENS:
         return "报告生成失败：服务器未配置ZHIPU_API_TOKEN。"
 
-    # --- 调用LLM生成报告的核心逻辑 ---
-    prompt = "你是一名专业的心脏健康数据分析师HeartTalk。请根据以下提供的心电图（ECG）详细分析数据，为用户生成一份专业、简洁且通俗易懂的健康总结报告。报告应分点阐述，并给出一个总体的健康建议。请使用Markdown格式化你的回答。\n\n--- 分析数据摘要 ---\n"
-    
-    for key, value in full_api_data.items():
-        if isinstance(value, dict):
-            prompt += f"\n**{key}**:\n"
-            for sub_key, sub_value in value.items():
-                prompt += f"- {sub_key}: {sub_value}\n"
-    prompt += "\n请基于以上完整数据开始生成报告："
+    # --- 调用LLM生成报告的核心逻辑（与后台报告任务使用同一份Prompt） ---
+    messages = report_messages(full_api_data)
 
-    try:
+    def generate():
+        report_data = get_glm_response(messages=messages)
+        return report_data['choices'][0]['message']['content']
 
-        report_data = get_glm_response(messages=[{"role": "user", "content": prompt}])
-        
-        content = report_data['choices'][0]['message']['content']
-        cleaned_content = content.replace("<think>", "").replace("</think>", "").strip()
-        print("--- [Tool Finished] Report generated successfully. ---")
-        return cleaned_content
+    try:
+        # 与后台报告任务共享报告缓存：相同的数据只生成一次，并发请求等待同一次生成
+        content = report_cache.get_or_generate(report_cache.key_for(session_id, session_data), generate)
+        logger.info("Tool finished: report generated", extra={'session_id': session_id})
+        return _clean_report(content)
 
+    except RateLimitExceeded:
+        # 交由 /agent 返回 429，而不是当作报告内容返回
+        raise
     except Exception as e:
-        print(f"调用GLM生成报告时出错: {e}")
+        logger.exception("调用GLM生成报告时出错: %s", e, extra={'session_id': session_id})
         return f"调用AI生成报告时出错: {e}"
 
 
+def _clean_report(content: str) -> str:
+    return content.replace("<think>", "").replace("</think>", "").strip()
+
+
+def reset_session(session_id: str) -> dict:
+    """
+    删除会话：撤销尚未开始的报告任务（已在生成中的任务完成后会因会话不存在而被丢弃），清除缓存的回答。
+    报告仍在排队时也可以调用（DELETE /session/<session_id>），不要求会话已就绪。
+
+    Returns:
+        dict: {'deleted': 会话此前是否存在, 'report_cancelled': 是否撤销了排队中的报告任务}。
+    """
+    report_cancelled = report_scheduler.cancel(session_id)
+    answer_cache.drop_session(session_id)
+    deleted = SESSIONS.delete(session_id)
+    if deleted:
+        logger.info("Session has been reset", extra={'session_id': session_id, 'report_cancelled': report_cancelled})
+    return {'deleted': deleted, 'report_cancelled': report_cancelled}
+
+
 def tool_reset_session(session_id: str) -> str:
     """【新增】工具函数：重置或清空当前会话数据。"""
-    print(f"--- [Tool Executing] tool_reset_session for session: {session_id} ---")
-    if session_id in SESSIONS:
-        del SESSIONS[session_id]
-        print(f"--- Session {session_id} has been reset. ---")
+    logger.info("Tool executing: tool_reset_session", extra={'session_id': session_id})
+    if reset_session(session_id)['deleted']:
         return "会话已成功重置。您可以上传新文件开始新的分析了。"
     return "操作失败：未找到需要重置的会话。"
 
@@ -62,7 +91,7 @@ def tool_get_specific_metric(session_id: str, metric_name: str) -> str:
     """
     简单查询工具：接收一个标准化的指标名称，查询并返回其值。
     """
-    print(f"--- [Simple Tool Executing] for session: {session_id} with precise metric: '{metric_name}' ---")
+    logger.info("Tool executing: tool_get_specific_metric", extra={'session_id': session_id, 'metric_name': metric_name})
     
     session_data = SESSIONS.get(session_id)
     if not session_data or 'full_analysis' not in session_data:
@@ -71,7 +100,8 @@ def tool_get_specific_metric(session_id: str, metric_name: str) -> str:
     full_data = session_data['full_analysis']
     flat_kb = get_flat_knowledge_base() # 从 knowledge.py 导入
     
-    key_to_find = metric_name.upper()
+    # 按知识库中的标准键名匹配（不区分大小写），保证 'PR_interval' 这类混合大小写的键也能找到
+    key_to_find = next((key for key in flat_kb if key.upper() == metric_name.upper()), metric_name.upper())
     
     # 在所有可能的子字典中查找
     value = full_data.get('Features', {}).get(key_to_find) or \
@@ -0,0 +1,161 @@
+import json
+import math
+import re
+from functools import lru_cache
+
+from app.config import REPORT_PROMPT_TOKEN_BUDGET, CHAT_PROMPT_TOKEN_BUDGET
+from app.toolkit.knowledge import get_knowledge_for_prompt
+
+# 工具决策时提供给GLM的工具定义（静态，只构建一次）
+AGENT_TOOLS_SCHEMA = [
+    {"type": "function", "function": {"name": "tool_get_full_analysis_report", "description": "当用户想要一份完整、详细的文本格式健康分析报告时调用。"}},
+    {"type": "function", "function": {"name": "tool_reset_session", "description": "当用户想要清除数据并重新开始时调用。"}},
+    {
+        "type": "function",
+        "function": {
+            "name": "tool_get_specific_metric",
+            "description": "在理解用户问题后，用于查询单个标准化健康指标的数值。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "metric_name": {
+                        "type": "string",
+                        "description": "从下面的知识库中选择的最匹配用户问题的、标准化的指标键名，例如 'HR', 'HRV'。"
+                    }
+                },
+                "required": ["metric_name"]
+            }
+        }
+    }
+]
+
+# 超出预算时按优先级保留指标：数字越小越重要，未列出的指标排在最后
+_METRIC_PRIORITY = {
+    # 综合健康指标和最常被问到的基础指标
+    'HR': 0, 'Pressure': 0, 'HRV': 0, 'Emotion': 0, 'Fatigue': 0, 'Vitality': 0,
+    # 临床上最常用的间期与HRV时域指标
+    'RR': 1, 'PR_interval': 1, 'QRS_duration': 1, 'QT_interval': 1, 'QTc': 1, 'ST_form': 1,
+    'SDNN': 1, 'RMSSD': 1, 'PNN_50': 1, 'LF/HF': 1,
+    # 其余波形特征与频域指标
+    'P_duration': 2, 'ST': 2, 'ST_amplitude': 2, 'MeanNN': 2, 'LF': 2, 'HF': 2, 'LFnorm': 2, 'HFnorm': 2,
+    'SD1': 2, 'SD2': 2,
+}
+_LOWEST_PRIORITY = 3
+
+_CJK = re.compile(r'[⺀-鿿가-힯＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数：中文等全角字符约 1 个 token/字，其余字符约 4 个字符/token。
+    GLM 没有可离线使用的分词器，这个估算只用于预算控制和日志对比。
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_message_tokens(messages: list, tools: list = None) -> int:
+    """估算一次GLM请求的提示词 token 数（消息内容 + 工具定义）。"""
+    total = sum(estimate_tokens(message.get('content') or '') + 4 for message in messages)
+    if tools:
+        total += estimate_tokens(json.dumps(tools, ensure_ascii=False, separators=(',', ':')))
+    return total
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool) or value is None:
+        return str(value)
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    if isinstance(value, (list, tuple)):
+        return f"[{len(value)}项]"
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return str(value)
+
+
+def render_analysis_table(full_analysis: dict, token_budget: int, categories=None) -> str:
+    """
+    把HeartVoice的分析数据渲染为紧凑的表格文本：每个类别一个小节，每行“指标键|数值”。
+
+    超过 token_budget 时按 _METRIC_PRIORITY 从低到高删除指标，并在末尾注明省略的数量。
+
+    Args:
+        categories: 只渲染这些类别（默认渲染所有字典类型的类别）。
+    """
+    rows = []  # (优先级, 出现顺序, 类别, 行文本)
+    for category, metrics in full_analysis.items():
+        if not isinstance(metrics, dict) or (categories and category not in categories):
+            continue
+        for key, value in metrics.items():
+            if value is None or value == '':
+                continue
+            rows.append((_METRIC_PRIORITY.get(key, _LOWEST_PRIORITY), len(rows), category, f"{key}|{_format_value(value)}"))
+
+    def render(kept):
+        lines, current = [], None
+        for _, _, category, line in sorted(kept, key=lambda row: row[1]):
+            if category != current:
+                lines.append(f"[{category}]")
+                current = category
+            lines.append(line)
+        return '\n'.join(lines)
+
+    kept = sorted(rows, key=lambda row: (row[0], row[1]))
+    text = render(kept)
+    # 逐行删除优先级最低的指标，直到满足预算
+    while kept and estimate_tokens(text) > token_budget:
+        kept.pop()
+        text = render(kept)
+    dropped = len(rows) - len(kept)
+    if dropped:
+        text += f"\n（另有 {dropped} 项次要指标因篇幅省略）"
+    return text
+
+
+@lru_cache(maxsize=1)
+def agent_system_prompt() -> str:
+    """工具决策用的系统提示词。知识库是静态的，只编译一次。"""
+    return (
+        "你是一个顶级的健康数据分析助手。你的任务是：\n"
+        "1. 理解用户的自然语言提问。\n"
+        "2. 参考下面提供的“可用指标知识库”，分析出用户问题涉及到哪些具体的指标。\n"
+        "3. 决定是否需要以及如何调用一个或多个工具来回答问题。\n"
+        "4. 如果一个模糊问题（如“心脏稳定吗”）关联到多个指标，你应该为每个相关指标都发起一次独立的工具调用。\n\n"
+        f"--- 可用指标知识库 ---\n{get_knowledge_for_prompt()}\n"
+        "--- End of Knowledge Base ---"
+    )
+
+
+def compile_static_sections():
+    """在应用启动时预编译静态的提示词片段，避免第一个请求承担编译开销。"""
+    agent_system_prompt()
+
+
+def agent_planning_messages(user_prompt: str) -> list:
+    """第一次（带工具的）GLM调用的消息。"""
+    return [
+        {"role": "system", "content": agent_system_prompt()},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def chat_messages(full_analysis: dict, user_prompt: str) -> list:
+    """上下文感知闲聊的消息：只附带波形特征和综合健康指标的摘要。"""
+    summary = render_analysis_table(full_analysis, CHAT_PROMPT_TOKEN_BUDGET, categories=('Features', 'HealthIndex'))
+    return [
+        {"role": "system", "content": f"你是一名专业的健康顾问。请根据以下用户的已知健康数据摘要，来回答用户的问题。\n摘要（指标|数值）：\n{summary}"},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def report_messages(full_analysis: dict) -> list:
+    """生成完整健康报告的消息。后台报告任务和报告工具共用，保证同一份数据得到一致的报告。"""
+    table = render_analysis_table(full_analysis, REPORT_PROMPT_TOKEN_BUDGET)
+    prompt = (
+        "你是一名专业的心脏健康数据分析师HeartTalk。请根据以下提供的心电图（ECG）详细分析数据，"
+        "为用户生成一份专业、简洁且通俗易懂的健康总结报告。"
+        "报告应分点阐述，并给出一个总体的健康建议。请使用Markdown格式化你的回答。\n\n"
+        f"--- 分析数据摘要（指标|数值） ---\n{table}"
+    )
+    return [{"role": "user", "content": prompt}]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+
+logger = logging.getLogger(__name__)
+
+# 请求体超过这个大小时写入临时文件，而不是留在内存里
+_SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+class AsgiRequest:
+    """异步服务模式下原生处理的请求：只提供本项目接口用到的那部分（查询参数、请求头、请求体）。"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin1')))
+        self.headers = {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+    async def spool_body(self):
+        """读取完整的请求体，返回 (文件对象, 字节数)；大的上传写入临时文件。"""
+        spool = SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
+        size = 0
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            spool.write(chunk)
+            size += len(chunk)
+            if not message.get('more_body'):
+                break
+        spool.seek(0)
+        return spool, size
+
+    async def json(self):
+        """解析JSON请求体，格式错误时返回 None。"""
+        spool, _ = await self.spool_body()
+        with spool:
+            try:
+                return json.loads(spool.read() or b'null')
+            except ValueError:
+                return None
+
+
+class JsonResponse:
+    """JSON响应。正文在构造时编码，较大的正文可以用 asyncio.to_thread(JsonResponse, ...) 在线程中构造。"""
+
+    def __init__(self, body, status: int = 200, headers=None):
+        self.status = status
+        self.body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.headers = {'content-type': 'application/json', **(headers or {})}
+
+
+class EventStreamResponse:
+    """text/event-stream 响应，events 为产出 SSE 文本的异步迭代器。"""
+
+    def __init__(self, events):
+        self.status = 200
+        self.events = events
+        self.headers = {'content-type': 'text/event-stream; charset=utf-8', 'cache-control': 'no-cache', 'x-accel-buffering': 'no'}
+
+
+def _raw_headers(headers: dict, extra: dict) -> list:
+    return [(name.encode('latin1'), str(value).encode('latin1')) for name, value in {**headers, **extra}.items()]
+
+
+async def wait_for_disconnect(receive):
+    """请求体读完之后，receive() 只会在客户端断开时返回 http.disconnect。"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_response(response, scope, receive, send, extra_headers=None):
+    """把 JsonResponse / EventStreamResponse 发送给 ASGI 服务器。"""
+    extra_headers = extra_headers or {}
+    if isinstance(response, JsonResponse):
+        await send({'type': 'http.response.start', 'status': response.status,
+                    'headers': _raw_headers({**response.headers, 'content-length': len(response.body)}, extra_headers)})
+        await send({'type': 'http.response.body', 'body': response.body})
+        return
+
+    await send({'type': 'http.response.start', 'status': response.status,
+                'headers': _raw_headers(response.headers, extra_headers)})
+
+    async def pump():
+        async for text in response.events:
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # 客户端断开时取消事件流，生成器随之关闭并释放上游连接
+    streaming = asyncio.ensure_future(pump())
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if streaming.done() and streaming.exception() is not None:
+            logger.error("事件流异常中断: %s", streaming.exception(), extra={'path': scope['path']})
+    finally:
+        for task in (streaming, disconnected):
+            task.cancel()
+        await asyncio.gather(streaming, disconnected, return_exceptions=True)
+        if hasattr(response.events, 'aclose'):
+            await response.events.aclose()
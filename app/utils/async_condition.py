@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AsyncAwareCondition(threading.Condition):
+    """
+    同时可以被线程和 asyncio 协程等待的条件变量。
+
+    生产者（报告任务、上传样本的请求线程）照常持锁调用 notify_all；线程用 wait_for 等待，
+    协程用 wait_for_async 等待，等待期间只挂起协程，不占用线程。
+    """
+
+    def __init__(self, lock=None):
+        super().__init__(lock)
+        self._async_waiters = []  # (事件循环, future)
+
+    def notify(self, n=1):
+        super().notify(n)
+        self._wake_async()
+
+    def notify_all(self):
+        super().notify_all()
+        self._wake_async()
+
+    def _wake_async(self):
+        for loop, waiter in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+        self._async_waiters.clear()
+
+    async def wait_for_async(self, predicate, timeout: float) -> bool:
+        """wait_for 的 asyncio 版本（不需要持锁调用）：返回超时前 predicate 是否成立。"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self:
+                if predicate():
+                    return True
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
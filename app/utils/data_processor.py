@@ -1,50 +1,376 @@
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from math import gcd
+
 import numpy as np
 from scipy.io import loadmat
-from scipy.signal import resample
+from scipy.signal import firwin, resample, resample_poly
 from app.config import (
     ORIGINAL_SAMPLING_RATE,
     TARGET_SAMPLING_RATE,
-    PLAYBACK_DURATION_S
+    PLAYBACK_DURATION_S,
+    RESAMPLE_METHOD,
+    INGEST_MODE,
+    STREAMING_INGEST_THRESHOLD_BYTES,
+    STREAM_CHUNK_SECONDS,
+    SIGNAL_QUALITY_MODE,
+    ANALYSIS_LEAD
 )
+from app.utils.leads import PCA_FIT_SECONDS, as_lead_matrix, lead_names, parse_lead, select_lead
+from app.utils.mat_stream import UnsupportedMatFileError, map_mat_variable, spool_to_disk
+from app.utils.metrics import stage_timer
+from app.utils.signal_quality import SignalQualityAccumulator, SignalQualityError, assess_signal_quality
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """
+    为给定的升/降采样因子设计抗混叠FIR滤波器（float32）。
+    参数与 scipy.signal.resample_poly 的默认设计一致，只是提前算好并以float32缓存，
+    这样 upfirdn 的计算全程保持在float32，不会被提升为float64。
+    """
+    max_rate = max(up, down)
+    taps = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    taps = taps.astype(np.float32)
+    taps.setflags(write=False)
+    return taps
+
+def _resample_factors(original_rate, target_rate):
+    """返回最简的 (升采样因子, 降采样因子)。"""
+    g = gcd(original_rate, target_rate)
+    return target_rate // g, original_rate // g
+
+def _resample_signal(signal, original_rate=ORIGINAL_SAMPLING_RATE, target_rate=TARGET_SAMPLING_RATE, method=None):
+    """
+    将信号从 original_rate 重采样到 target_rate。
+
+    Args:
+        signal (np.array): 一维float32信号，或 (导联数, 样本数) 的多导联矩阵（所有导联沿时间轴一次完成）。
+        method (str): 'polyphase'（默认，多相滤波）或 'fft'（旧的 scipy.signal.resample 路径）。
+            为 None 时使用配置项 RESAMPLE_METHOD。
+
+    Returns:
+        np.array: 重采样后的float32信号。
+    """
+    method = method or RESAMPLE_METHOD
+    if method == 'fft':
+        num_samples_resampled = int(signal.shape[-1] * target_rate / original_rate)
+        return resample(signal, num_samples_resampled, axis=-1).astype(np.float32, copy=False)
+    if method != 'polyphase':
+        raise ValueError(f"未知的重采样方法: {method}")
+
+    up, down = _resample_factors(original_rate, target_rate)
+    if up == down:
+        return signal
+    return resample_poly(signal, up, down, axis=-1, window=_polyphase_filter(up, down))
+
+def _build_playback_waveform(signal, mean, std):
+    """
+    平铺或截断信号以匹配播放时长，并就地归一化。
+    只分配一块 target_length 大小的float32缓冲区，不生成中间拷贝。
+    signal 为 (导联数, 样本数) 时逐导联处理，mean、std 为每个导联的统计量。
+    """
+    target_length = TARGET_SAMPLING_RATE * PLAYBACK_DURATION_S
+    n = signal.shape[-1]
+    if n >= target_length:
+        playback_waveform = np.array(signal[..., :target_length], dtype=np.float32)
+    elif n:
+        # 信号太短时重复它直到达到目标长度（与 np.resize 相同）
+        playback_waveform = np.take(signal, np.arange(target_length) % n, axis=-1).astype(np.float32, copy=False)
+    else:
+        playback_waveform = np.zeros(signal.shape[:-1] + (target_length,), dtype=np.float32)
+    playback_waveform -= np.asarray(mean, dtype=np.float32)[..., None]
+    playback_waveform /= (np.asarray(std, dtype=np.float64) + 1e-8).astype(np.float32)[..., None]
+    return playback_waveform
+
+def _lead_reader(matrix):
+    """
+    把（通常是 memmap 的）二维 'val' 矩阵看作 (导联数, 样本数)，返回 (导联数, 样本数, read(start, stop))。
+    导联方向的约定与 as_lead_matrix 相同；read 返回 [start, stop) 时间段的 (导联数, 样本数) float32 数组，
+    只会取出请求的那一段，因此可以直接作用在 memmap 上。
+    """
+    rows, cols = matrix.shape
+    if rows <= cols:
+        return rows, cols, lambda start, stop: np.asarray(matrix[:, start:stop], dtype=np.float32)
+    return cols, rows, lambda start, stop: np.asarray(matrix[start:stop, :], dtype=np.float32).T
+
+def _resample_plan(original_rate, target_rate):
+    """
+    返回分块重采样所需的 (升采样因子, 降采样因子, 滤波器, 重叠样本数)。
+    重叠样本数 pad 大于滤波器半长，并对齐到降采样因子。采样率相同时不需要滤波器。
+    """
+    up, down = _resample_factors(original_rate, target_rate)
+    if up == down:
+        return up, down, None, 0
+    taps = _polyphase_filter(up, down)
+    half_len = (len(taps) - 1) // 2
+    pad = down * -(-(half_len // up + 2) // down)
+    return up, down, taps, pad
+
+def _resample_window(window, window_start, start, stop, up, down, taps):
+    """
+    对从 window_start 开始、两侧带重叠区的一段信号做多相重采样，只返回 [start, stop) 对应的输出样本。
+    start 必须对齐到降采样因子；stop 不是信号末尾时也必须对齐。window 可以是 (导联数, 样本数) 的矩阵。
+    """
+    resampled = resample_poly(window, up, down, axis=-1, window=taps)
+    first = (start - window_start) * up // down
+    count = -(-stop * up // down) - start * up // down
+    return resampled[..., first:first + count]
+
+def _iter_resampled_chunks(read, n, chunk_size):
+    """
+    对长度为 n 的（多导联）信号沿时间轴做分块多相重采样，逐块产出 (原始块, 重采样块)，均为 (导联数, 样本数)。
+
+    每块左右各多读 pad 个样本作为重叠区，pad 大于滤波器半长，且块边界对齐到降采样因子，
+    因此拼接后的结果与对整段信号调用 resample_poly 一致，而内存只与块大小有关。
+    原始块不含重叠区，供调用方计算信号质量。
+    """
+    up, down, taps, pad = _resample_plan(ORIGINAL_SAMPLING_RATE, TARGET_SAMPLING_RATE)
+    chunk_size = max(down, chunk_size - chunk_size % down)
+
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        window_start, window_stop = max(0, start - pad), min(n, stop + pad)
+        window = read(window_start, window_stop)
+        raw = window[..., start - window_start:stop - window_start]
+        if up == down:
+            yield raw, raw
+            continue
+        yield raw, _resample_window(window, window_start, start, stop, up, down, taps)
 
-def _normalize_signal(signal):
-    """一个内部辅助函数，用于信号归一化。"""
-    return (signal - np.mean(signal)) / (np.std(signal) + 1e-8)
+class StreamingResampler:
+    """
+    有状态的增量多相重采样器，用于实时流式上传：每次 push 一段新样本，返回已经可以确定的输出样本。
+
+    滤波器的“状态”就是保留下来的最近 pad 个输入样本（pad 大于滤波器半长），
+    因此每段只处理“新样本 + 两侧重叠区”，输出拼接后与对整段信号调用 resample_poly 完全一致。
+    由于 resample_poly 是零相位滤波，输出相对输入有 pad 个样本（300Hz 下约0.1秒）的延迟，
+    调用 flush 时补齐末尾。
+    """
+
+    def __init__(self, original_rate=ORIGINAL_SAMPLING_RATE, target_rate=TARGET_SAMPLING_RATE):
+        self.up, self.down, self.taps, self.pad = _resample_plan(original_rate, target_rate)
+        self.history = np.empty(0, dtype=np.float32)
+        self.history_start = 0  # history[0] 在整个输入中的位置
+        self.done = 0  # 已经产出输出的输入位置（对齐到降采样因子）
+
+    def _emit(self, stop, window_stop):
+        """产出输入 [done, stop) 对应的输出，用到的输入是 [done - pad, window_stop)。"""
+        window_start = max(0, self.done - self.pad)
+        window = self.history[window_start - self.history_start:window_stop - self.history_start]
+        if self.up == self.down:
+            out = window[self.done - window_start:stop - window_start].copy()
+        else:
+            out = _resample_window(window, window_start, self.done, stop, self.up, self.down, self.taps)
+        self.done = stop
+        # 只保留下一段计算需要的重叠区
+        keep_from = max(0, self.done - self.pad)
+        self.history = self.history[keep_from - self.history_start:]
+        self.history_start = keep_from
+        return out.astype(np.float32, copy=False)
+
+    def push(self, samples) -> np.ndarray:
+        """追加输入样本，返回新确定的输出样本（可能为空）。"""
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        self.history = np.concatenate((self.history, samples))
+        available = self.history_start + len(self.history)
+        # 右侧还需要 pad 个样本作为重叠区，输出边界对齐到降采样因子
+        stop = available - self.pad
+        stop -= stop % self.down
+        if stop <= self.done:
+            return np.empty(0, dtype=np.float32)
+        return self._emit(stop, stop + self.pad)
+
+    def flush(self) -> np.ndarray:
+        """输入结束：产出剩余的全部输出样本（末尾与整段 resample_poly 一样按零填充处理）。"""
+        end = self.history_start + len(self.history)
+        if end <= self.done:
+            return np.empty(0, dtype=np.float32)
+        return self._emit(end, end)
+
+def playback_from_resampled(resampled_signal):
+    """为已经重采样好的信号（例如实时流的缓冲区）生成归一化的播放波形。"""
+    mean = resampled_signal.mean(dtype=np.float64)
+    std = resampled_signal.std(dtype=np.float64)
+    return _build_playback_waveform(resampled_signal, mean, std)
+
+def merge_stats(stats, chunk):
+    """
+    用 Chan 的并行算法把一块数据的 (样本数, 均值, M2) 合并进全局统计量。
+    chunk 为 (导联数, 样本数) 时沿时间轴逐导联合并，均值和 M2 是每个导联一个值的数组。
+    """
+    count, mean, m2 = stats
+    chunk_count = chunk.shape[-1]
+    if chunk_count == 0:
+        return stats
+    chunk_mean = chunk.mean(axis=-1, dtype=np.float64)
+    chunk_m2 = np.square(chunk - chunk_mean[..., None].astype(np.float32), dtype=np.float64).sum(axis=-1)
+    total = count + chunk_count
+    delta = chunk_mean - mean
+    mean = mean + delta * chunk_count / total
+    m2 = m2 + chunk_m2 + delta * delta * count * chunk_count / total
+    return total, mean, m2
+
+def check_signal_quality(report):
+    """
+    根据 SIGNAL_QUALITY_MODE 处理质量报告：拒绝模式下不合格的记录抛出 SignalQualityError，否则原样返回。
+    """
+    if report and report['status'] == 'reject' and SIGNAL_QUALITY_MODE == 'reject':
+        raise SignalQualityError(report)
+    return report
+
+def _lead_info(selection, playback_leads) -> dict:
+    """多导联记录的导联信息：导联名称、用于分析的导联及其组合权重，以及逐导联的播放波形。"""
+    n_leads = playback_leads.shape[0]
+    return {'count': n_leads, 'names': lead_names(n_leads), **selection.describe(), 'playback': playback_leads}
+
+def _process_ecg_matrix_streaming(matrix, lead):
+    """
+    分块处理一个（通常是 memmap 的）信号矩阵。
+    所有导联按块一起重采样；用于分析的导联写入磁盘上的float32 memmap，均值/方差按块逐导联合并，
+    峰值内存与记录长度无关。信号质量指标（针对用于分析的导联）在同一遍读取中计算。
+    """
+    n_leads, n, read = _lead_reader(matrix)
+    if n == 0:
+        raise ValueError("文件中的 'val' 信号为空")
+    selection = select_lead(read(0, min(n, PCA_FIT_SECONDS * ORIGINAL_SAMPLING_RATE)), lead, ORIGINAL_SAMPLING_RATE)
+    up, down = _resample_factors(ORIGINAL_SAMPLING_RATE, TARGET_SAMPLING_RATE)
+    n_out = -(-n * up // down)
+    playback_length = TARGET_SAMPLING_RATE * PLAYBACK_DURATION_S
+
+    resampled_signal = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode='w+', shape=(n_out,))
+    stats = (0, 0.0, 0.0)
+    lead_stats = (0, np.zeros(n_leads), np.zeros(n_leads))
+    head, head_length = [], 0  # 各导联开头用于播放的重采样信号
+    position = 0
+    quality = SignalQualityAccumulator(ORIGINAL_SAMPLING_RATE) if SIGNAL_QUALITY_MODE != 'off' else None
+    for raw, chunk in _iter_resampled_chunks(read, n, STREAM_CHUNK_SECONDS * ORIGINAL_SAMPLING_RATE):
+        if quality is not None:
+            quality.update(selection.apply(raw))
+        analysis_chunk = selection.apply(chunk)
+        resampled_signal[position:position + analysis_chunk.size] = analysis_chunk
+        position += analysis_chunk.size
+        stats = merge_stats(stats, analysis_chunk)
+        if n_leads > 1:
+            lead_stats = merge_stats(lead_stats, chunk)
+            if head_length < playback_length:
+                head.append(np.array(chunk[:, :playback_length - head_length]))
+                head_length += head[-1].shape[-1]
+
+    quality_report = check_signal_quality(quality.report() if quality else None)
+    count, mean, m2 = stats
+    std = (m2 / count) ** 0.5
+    playback_waveform = _build_playback_waveform(resampled_signal, mean, std)
+    leads = None
+    if n_leads > 1:
+        count, means, m2s = lead_stats
+        leads = _lead_info(selection, _build_playback_waveform(np.concatenate(head, axis=1), means, np.sqrt(m2s / count)))
+    return resampled_signal, playback_waveform, quality_report, leads
 
-def process_ecg_signal_from_file(file_stream):
+def should_stream(file_stream):
+    """根据 INGEST_MODE 和上传文件的大小决定是否走流式处理。"""
+    if INGEST_MODE != 'auto':
+        return INGEST_MODE == 'streaming'
+    try:
+        size = file_stream.seek(0, os.SEEK_END)
+        file_stream.seek(0)
+    except (AttributeError, OSError):
+        return False
+    return size >= STREAMING_INGEST_THRESHOLD_BYTES
+
+def iter_json_array(signal, chunk_size=65536):
+    """
+    把一维信号逐块编码为JSON数组的字节流，用于以分块传输的方式上传超长信号，
+    避免一次性 tolist() 生成整段Python列表。
+    """
+    yield b'['
+    for start in range(0, len(signal), chunk_size):
+        if start:
+            yield b','
+        yield json.dumps(signal[start:start + chunk_size].tolist())[1:-1].encode()
+    yield b']'
+
+def process_ecg_signal_from_file(file_stream, streaming=None, lead=None):
     """
     从文件流中读取、处理和准备ECG信号。
-    
+
+    'val' 为多导联矩阵时，所有导联沿时间轴一起重采样、逐导联归一化，
+    再按 lead 选出（或组合出）一条用于HeartVoice分析、缓存和波形查询的信号。
+
     Args:
         file_stream: 从Flask请求中获取的文件流对象。
+        streaming (bool): 是否使用流式（落盘 + memmap + 分块）处理。
+            为 None 时由 INGEST_MODE 和文件大小决定。流式处理始终使用多相重采样。
+        lead: 用于分析的导联（parse_lead 的结果：序号、标准导联名称、'pca' 或 'auto'），
+            为 None 时使用配置项 ANALYSIS_LEAD。单导联记录只有导联 0（'auto'、'pca' 也都是它）。
 
     Returns:
         一个元组，包含:
-        - resampled_signal (np.array): 重采样后的信号，用于API调用。
-        - playback_waveform (np.array): 用于前端播放的波形。
-    """
-    # 1. 读取 .mat 文件
-    mat_data = loadmat(file_stream)
-    raw_signal = mat_data['val'].flatten()
-    
-    # 2. 重采样
-    num_samples_resampled = int(len(raw_signal) * TARGET_SAMPLING_RATE / ORIGINAL_SAMPLING_RATE)
-    resampled_signal = resample(raw_signal, num_samples_resampled)
-
-    # 3. 归一化并生成播放波形
-    normalized_signal = _normalize_signal(resampled_signal)
-    target_length = TARGET_SAMPLING_RATE * PLAYBACK_DURATION_S
-    
-    # 平铺或截断信号以匹配播放时长
-    if len(normalized_signal) < target_length:
-        # 如果信号太短，就重复它直到达到目标长度
-        num_tiles = target_length // len(normalized_signal)
-        remainder = target_length % len(normalized_signal)
-        playback_waveform = np.concatenate(
-            (np.tile(normalized_signal, num_tiles), normalized_signal[:remainder])
-        )
-    else:
-        # 如果信号太长，就截断它
-        playback_waveform = normalized_signal[:target_length]
+        - resampled_signal (np.array): 用于分析的导联重采样后的信号，用于API调用。流式处理时是磁盘上的 np.memmap。
+        - playback_waveform (np.array): 该导联用于前端播放的波形。
+        - quality_report (dict): 该导联的信号质量报告（见 SignalQualityAccumulator.report），
+          SIGNAL_QUALITY_MODE 为 'off' 时为 None。
+        - leads (dict): 多导联记录的导联信息（count、names、analysis_lead、weights），
+          以及 (导联数, 样本数) 的逐导联播放波形 playback；单导联记录为 None。
+
+    Raises:
+        SignalQualityError: SIGNAL_QUALITY_MODE 为 'reject' 且信号质量不合格。
+        LeadSelectionError: 请求的导联在该记录中不存在。
+    """
+    if lead is None:
+        lead = parse_lead(ANALYSIS_LEAD)
+    if streaming is None:
+        streaming = should_stream(file_stream)
+    if streaming:
+        with stage_timer('spool'), spool_to_disk(file_stream) as spool:
+            try:
+                matrix = map_mat_variable(spool, 'val')
+            except UnsupportedMatFileError as e:
+                logger.info("无法流式读取该文件（%s），回退到 loadmat", e)
+                spool.seek(0)
+                return _process_ecg_signal_in_memory(spool, lead)
+        with stage_timer('stream_resample'):
+            return _process_ecg_matrix_streaming(matrix, lead)
+    return _process_ecg_signal_in_memory(file_stream, lead)
+
+def _process_ecg_signal_in_memory(file_stream, lead):
+    """使用 loadmat 把整个文件读入内存后处理（适用于普通长度的记录）。"""
+    # 1. 读取 .mat 文件，整理为 (导联数, 样本数) 的float32矩阵（单导联时不拷贝）
+    with stage_timer('loadmat'):
+        mat_data = loadmat(file_stream)
+        raw_leads = as_lead_matrix(mat_data['val'])
+    n_leads = raw_leads.shape[0]
+    selection = select_lead(raw_leads, lead, ORIGINAL_SAMPLING_RATE)
+
+    # 1.5 信号质量预检（针对用于分析的导联）：不合格的记录在重采样之前就被拒绝
+    quality_report = None
+    if SIGNAL_QUALITY_MODE != 'off':
+        with stage_timer('signal_quality'):
+            quality_report = assess_signal_quality(selection.apply(raw_leads), ORIGINAL_SAMPLING_RATE, STREAM_CHUNK_SECONDS)
+        check_signal_quality(quality_report)
+
+    # 2. 所有导联沿时间轴一次重采样，再组合出用于分析的信号（重采样是线性的，先后顺序不影响结果）
+    with stage_timer('resample'):
+        resampled_leads = _resample_signal(raw_leads)
+        resampled_signal = selection.apply(resampled_leads)
+        if n_leads > 1 and selection.row is not None:
+            # 单独拷贝这一行，会话中的波形金字塔不必引用整个多导联矩阵
+            resampled_signal = resampled_signal.copy()
+
+    # 3. 归一化并生成播放波形（统计量用float64累加，所有导联一次完成）
+    with stage_timer('playback'):
+        mean = resampled_signal.mean(dtype=np.float64)
+        std = resampled_signal.std(dtype=np.float64)
+        playback_waveform = _build_playback_waveform(resampled_signal, mean, std)
+        leads = None
+        if n_leads > 1:
+            playback_leads = _build_playback_waveform(resampled_leads, resampled_leads.mean(axis=1, dtype=np.float64),
+                                                      resampled_leads.std(axis=1, dtype=np.float64))
+            leads = _lead_info(selection, playback_leads)
 
-    return resampled_signal, playback_waveform
\ No newline at end of file
+    return resampled_signal, playback_waveform, quality_report, leads
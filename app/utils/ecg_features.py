@@ -0,0 +1,309 @@
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.integrate import trapezoid
+from scipy.ndimage import median_filter
+from scipy.signal import butter, find_peaks, sosfiltfilt, welch
+
+from app.config import TARGET_SAMPLING_RATE
+
+# 每块处理的时长与两侧重叠（秒）：峰值内存与记录长度无关，重叠区足够覆盖滤波器的边缘效应
+_CHUNK_SECONDS = 600
+_OVERLAP_SECONDS = 3
+# 生理上合理的RR间期范围（毫秒），以及判定为异位/误检的相对偏差
+_MIN_RR_MS, _MAX_RR_MS = 300, 2000
+_ECTOPIC_TOLERANCE = 0.2
+# 频域HRV：RR序列插值的采样率（Hz）和计算所需的最短记录时长（秒）
+_RR_INTERP_HZ = 4.0
+_MIN_SPECTRAL_SECONDS = 60
+_BANDS = {'VLF': (0.003, 0.04), 'LF': (0.04, 0.15), 'HF': (0.15, 0.4)}
+# 非线性指标只使用最近的这些NN间期（样本熵是 O(N^2) 的）
+_MAX_ENTROPY_BEATS = 1000
+# 增量检测：每次检测带上的历史上下文，以及末尾暂不确认的时长（秒）
+_STREAM_CONTEXT_SECONDS = 8
+_STREAM_GUARD_SECONDS = 1
+
+
+class InsufficientBeatsError(ValueError):
+    """检测到的有效心搏太少，无法计算心率和HRV指标。"""
+
+
+@lru_cache(maxsize=4)
+def _qrs_filter(fs: int):
+    """QRS波群的 5-15Hz 带通滤波器（Pan-Tompkins 的第一步）。"""
+    return butter(2, [5, 15], btype='bandpass', fs=fs, output='sos')
+
+
+def _detect_chunk(chunk, fs):
+    """
+    在一段信号上做 Pan-Tompkins 风格的R峰检测，全部是向量化的 NumPy/SciPy 运算：
+    带通 -> 差分 -> 平方 -> 150ms 滑动积分 -> 自适应阈值找峰 -> 在带通信号上回溯到R峰位置。
+    """
+    filtered = sosfiltfilt(_qrs_filter(fs), chunk)
+    energy = np.square(np.gradient(filtered))
+    window = max(1, int(0.15 * fs))
+    integrated = np.convolve(energy, np.ones(window) / window, mode='same')
+
+    # 阈值取能量的高分位数的一部分，对幅度和导联极性都不敏感
+    threshold = 0.3 * np.percentile(integrated, 99)
+    candidates, _ = find_peaks(integrated, height=threshold, distance=max(1, int(0.25 * fs)))
+    if len(candidates) == 0:
+        return np.empty(0)
+
+    # 积分峰滞后于QRS，在其前 200ms 到后 50ms 的窗口内取带通信号绝对值的最大处作为R峰
+    before, after = int(0.2 * fs), int(0.05 * fs)
+    magnitude = np.abs(filtered)
+    windows = sliding_window_view(np.pad(magnitude, (before, after)), before + after + 1)[candidates]
+    peaks = np.clip(candidates - before + windows.argmax(axis=1), 1, len(magnitude) - 2)
+
+    # 抛物线插值得到亚样本精度的峰位置：100Hz 下一个样本就是 10ms，直接取整会显著放大 RMSSD/pNN50
+    left, centre, right = magnitude[peaks - 1], magnitude[peaks], magnitude[peaks + 1]
+    curvature = left - 2 * centre + right
+    safe = np.where(curvature < 0, curvature, -1.0)
+    offset = np.where(curvature < 0, 0.5 * (left - right) / safe, 0.0)
+    return peaks + offset
+
+
+def detect_r_peaks(signal, fs: int = TARGET_SAMPLING_RATE) -> np.ndarray:
+    """
+    检测R峰位置（以样本为单位的浮点数，带亚样本插值）。
+
+    长记录（包括磁盘上的 memmap）分块处理，每块两侧带重叠区，只保留落在块核心区的峰，
+    因此结果与整段处理一致而内存只与块大小有关。
+    """
+    n = len(signal)
+    chunk, overlap = _CHUNK_SECONDS * fs, _OVERLAP_SECONDS * fs
+    peaks = []
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        lo, hi = max(0, start - overlap), min(n, stop + overlap)
+        if hi - lo < 2 * fs:
+            continue  # 不足2秒的记录无法可靠滤波
+        found = _detect_chunk(np.asarray(signal[lo:hi], dtype=np.float64), fs) + lo
+        peaks.append(found[(found >= start) & (found < stop)])
+    if not peaks:
+        return np.empty(0)
+
+    peaks = np.unique(np.concatenate(peaks))
+    if not len(peaks):
+        return peaks  # 平直或无心搏的信号
+    # 回溯后相邻的峰可能过近（同一个QRS被检出两次），只保留前一个
+    keep = np.concatenate(([True], np.diff(peaks) >= int(0.25 * fs)))
+    return peaks[keep]
+
+
+def _nn_intervals(peaks, fs):
+    """由R峰计算RR间期（毫秒），并剔除超出生理范围或偏离局部中位数过多的间期。"""
+    rr = np.diff(peaks) * (1000.0 / fs)
+    valid = (rr >= _MIN_RR_MS) & (rr <= _MAX_RR_MS)
+    if valid.sum() >= 3:
+        local_median = median_filter(rr, size=5, mode='nearest')
+        valid &= np.abs(rr - local_median) <= _ECTOPIC_TOLERANCE * local_median
+    return rr, valid
+
+
+def _sample_entropy(x, m=2, r_ratio=0.2):
+    """样本熵（Chebyshev 距离，容差为 r_ratio * 标准差）。"""
+    x = np.asarray(x[-_MAX_ENTROPY_BEATS:], dtype=np.float64)
+    r = r_ratio * x.std()
+    if len(x) <= m + 1 or r == 0:
+        return None
+
+    def matches(length):
+        templates = sliding_window_view(x, length)[:len(x) - m]
+        distance = np.abs(templates[:, None, :] - templates[None, :, :]).max(axis=2)
+        return ((distance <= r).sum() - len(templates)) / 2  # 不计自身匹配
+
+    b, a = matches(m), matches(m + 1)
+    return float(-np.log(a / b)) if a > 0 and b > 0 else None
+
+
+def _approximate_entropy(x, m=2, r_ratio=0.2):
+    """近似熵（计入自身匹配）。"""
+    x = np.asarray(x[-_MAX_ENTROPY_BEATS:], dtype=np.float64)
+    r = r_ratio * x.std()
+    if len(x) <= m + 1 or r == 0:
+        return None
+
+    def phi(length):
+        templates = sliding_window_view(x, length)
+        distance = np.abs(templates[:, None, :] - templates[None, :, :]).max(axis=2)
+        return np.log((distance <= r).mean(axis=1)).mean()
+
+    return float(phi(m) - phi(m + 1))
+
+
+def _dfa_alpha1(x, scales=range(4, 17)):
+    """去趋势波动分析的短程标度指数 α1（窗口 4-16 拍，线性去趋势）。"""
+    x = np.asarray(x, dtype=np.float64)
+    profile = np.cumsum(x - x.mean())
+    sizes, fluctuations = [], []
+    for size in scales:
+        count = len(profile) // size
+        if count < 2:
+            break
+        segments = profile[:count * size].reshape(count, size)
+        t = np.arange(size) - (size - 1) / 2
+        # 每段的最小二乘直线：斜率 = sum(t*y)/sum(t^2)，截距 = 均值
+        slope = segments @ t / (t @ t)
+        residual = segments - segments.mean(axis=1, keepdims=True) - slope[:, None] * t
+        sizes.append(size)
+        fluctuations.append(np.sqrt(np.mean(np.square(residual))))
+    if len(sizes) < 3 or min(fluctuations) <= 0:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(fluctuations), 1)[0])
+
+
+def _spectral_metrics(nn, beat_times):
+    """对NN间期序列做 4Hz 均匀插值后用 Welch 法估计功率谱，积分得到各频段功率（ms²）。"""
+    duration = beat_times[-1] - beat_times[0]
+    if duration < _MIN_SPECTRAL_SECONDS:
+        return {}
+    grid = np.arange(beat_times[0], beat_times[-1], 1.0 / _RR_INTERP_HZ)
+    series = np.interp(grid, beat_times, nn)
+    series -= series.mean()
+    freqs, power = welch(series, fs=_RR_INTERP_HZ, nperseg=min(len(series), 256 if duration < 300 else 1024))
+
+    def band_power(low, high):
+        mask = (freqs >= low) & (freqs < high)
+        return float(trapezoid(power[mask], freqs[mask])) if mask.sum() > 1 else 0.0
+
+    bands = {name: band_power(*limits) for name, limits in _BANDS.items()}
+    lf, hf = bands['LF'], bands['HF']
+    metrics = {**bands, 'TP': sum(bands.values())}
+    if lf + hf > 0:
+        metrics['LFnorm'] = 100 * lf / (lf + hf)
+        metrics['HFnorm'] = 100 * hf / (lf + hf)
+    if hf > 0:
+        metrics['LF/HF'] = lf / hf
+    return metrics
+
+
+class StreamingPeakDetector:
+    """
+    实时流上的增量R峰检测：每次只在“新样本 + 前面一小段上下文”上运行与 detect_r_peaks 相同的检测，
+    而不是每来一段数据就重新处理整条记录。
+
+    最新的 _STREAM_GUARD_SECONDS 秒还不稳定（滤波边缘效应、积分窗口滞后），留到下一次再确认；
+    上下文足够长，保证自适应阈值和滤波器在新数据处已经稳定。
+    """
+
+    def __init__(self, fs: int = TARGET_SAMPLING_RATE):
+        self.fs = fs
+        self.context = np.empty(0, dtype=np.float64)
+        self.context_start = 0  # context[0] 在整条流中的位置
+        self.confirmed_until = 0  # 在此之前的峰都已经确认
+        self.last_peak = None
+
+    def update(self, samples) -> np.ndarray:
+        """追加新样本，返回新确认的R峰位置（整条流中的样本序号，浮点数）。"""
+        self.context = np.concatenate((self.context, np.asarray(samples, dtype=np.float64)))
+        stable_until = self.context_start + len(self.context) - int(_STREAM_GUARD_SECONDS * self.fs)
+        if stable_until - self.confirmed_until < self.fs:
+            return np.empty(0)  # 新的稳定数据不足1秒，攒够了再检测
+        return self._confirm(stable_until)
+
+    def flush(self) -> np.ndarray:
+        """流结束：确认末尾剩余的R峰。"""
+        end = self.context_start + len(self.context)
+        return self._confirm(end) if end > self.confirmed_until else np.empty(0)
+
+    def _confirm(self, stable_until):
+        found = _detect_chunk(self.context, self.fs) + self.context_start if len(self.context) >= 2 * self.fs else np.empty(0)
+        found = found[(found >= self.confirmed_until) & (found < stable_until)]
+        if len(found):
+            # 与 detect_r_peaks 一样去掉同一个QRS的重复检出（包括与上一次确认的峰之间）
+            previous = np.concatenate(([self.last_peak], found)) if self.last_peak is not None else found
+            keep = np.concatenate(([True], np.diff(previous) >= int(0.25 * self.fs)))
+            found = previous[keep][1:] if self.last_peak is not None else previous[keep]
+        if len(found):
+            self.last_peak = found[-1]
+        self.confirmed_until = stable_until
+
+        # 只保留下一次检测需要的上下文
+        keep_from = max(self.context_start, stable_until - int(_STREAM_CONTEXT_SECONDS * self.fs))
+        self.context = self.context[keep_from - self.context_start:]
+        self.context_start = keep_from
+        return found
+
+
+def compute_ecg_features(signal, fs: int = TARGET_SAMPLING_RATE) -> dict:
+    """
+    在本地计算心率与HRV指标，返回与HeartVoice data 块相同结构的字典
+    （'Features' / 'HRVIndex'，键名与 metric_knowledge_base.json 一致）。
+
+    只包含能从R峰序列可靠得到的指标；波形形态（P/QRS/T）和 HealthIndex 需要HeartVoice。
+
+    Raises:
+        InsufficientBeatsError: 有效心搏不足3个。
+    """
+    return features_from_peaks(detect_r_peaks(signal, fs), fs)
+
+
+def features_from_peaks(peaks, fs: int = TARGET_SAMPLING_RATE, nonlinear: bool = True) -> dict:
+    """
+    由R峰位置（样本序号）计算心率与HRV指标，结构同 compute_ecg_features。
+
+    Args:
+        nonlinear: 是否计算 SampEn / ApEn / DFA。熵是 O(N^2) 的，占了大部分耗时，
+            实时流的滚动指标可以降低它们的刷新频率。
+    """
+    peaks = np.asarray(peaks, dtype=np.float64)
+    rr, valid = _nn_intervals(peaks, fs)
+    nn = rr[valid]
+    if len(nn) < 3:
+        raise InsufficientBeatsError(f"有效心搏过少（{len(nn)} 个NN间期），无法计算心率")
+
+    # 每个NN间期对应的结束时刻（秒），用于频域插值和5分钟分段
+    beat_times = peaks[1:][valid] / fs
+    # 只有相邻的两个间期都有效时，它们的差值才有意义
+    diffs = np.diff(rr)[valid[:-1] & valid[1:]]
+
+    mean_nn = float(nn.mean())
+    sdnn = float(nn.std(ddof=1))
+    hrv = {
+        'MeanNN': mean_nn,
+        'SDNN': sdnn,
+    }
+    if len(diffs):
+        sdsd = float(diffs.std())
+        hrv.update({
+            'RMSSD': float(np.sqrt(np.mean(np.square(diffs)))),
+            'NN_50': int((np.abs(diffs) > 50).sum()),
+            'PNN_50': float(100 * (np.abs(diffs) > 50).mean()),
+            'NN_20': int((np.abs(diffs) > 20).sum()),
+            'PNN_20': float(100 * (np.abs(diffs) > 20).mean()),
+            'SD1': float(np.sqrt(0.5) * sdsd),
+            'SD2': float(np.sqrt(max(2 * sdnn ** 2 - 0.5 * sdsd ** 2, 0.0))),
+        })
+
+    # 三角指数：NN间期总数 / 直方图（1/128 秒分箱）最高柱的计数
+    bins = np.arange(nn.min(), nn.max() + 7.8125, 7.8125)
+    hrv['TriangularIndex'] = float(len(nn) / np.histogram(nn, bins=bins)[0].max()) if len(bins) > 1 else None
+
+    # SDANN / SDANNIndex 需要至少两个完整的5分钟片段
+    segment = ((beat_times - beat_times[0]) // 300).astype(np.int64)
+    if segment[-1] >= 2:
+        full = segment < segment[-1]
+        counts = np.bincount(segment[full])
+        sums = np.bincount(segment[full], weights=nn[full])
+        squares = np.bincount(segment[full], weights=np.square(nn[full]))
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - np.square(means), 0.0))
+        hrv['SDANN'] = float(means.std(ddof=1))
+        hrv['SDANNIndex'] = float(stds.mean())
+
+    hrv.update(_spectral_metrics(nn, beat_times))
+    if nonlinear:
+        hrv['SampEn'] = _sample_entropy(nn)
+        hrv['ApEn'] = _approximate_entropy(nn)
+        hrv['DFA'] = _dfa_alpha1(nn)
+
+    def rounded(metrics):
+        return {k: (round(v, 3) if isinstance(v, float) else v) for k, v in metrics.items() if v is not None}
+
+    return {
+        'Features': rounded({'HR': 60000.0 / mean_nn, 'RR': mean_nn}),
+        'HRVIndex': rounded(hrv),
+    }
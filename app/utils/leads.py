@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.signal import butter, sosfiltfilt
+
+# 标准12导联的通常排列顺序（PhysioNet 等数据集的 'val' 矩阵按此顺序存放各导联）
+STANDARD_12_LEADS = ('I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6')
+# 'pca': 各导联的第一主成分（方差最大的线性组合，QRS波群通常最突出）；'auto': 多导联时即 'pca'
+DERIVED_LEADS = ('auto', 'pca')
+# 主成分只用记录开头这么长（秒）的原始信号拟合，长记录不需要为此多读一遍
+PCA_FIT_SECONDS = 300
+# 拟合主成分前先做高通滤波：否则呼吸、体动引起的基线漂移（幅度常常比QRS大）会主导方差，
+# 第一主成分跟随漂移最大的导联而不是QRS波群
+PCA_HIGHPASS_HZ = 0.5
+
+
+class LeadSelectionError(ValueError):
+    """请求的导联不存在或无法识别。"""
+
+
+def parse_lead(value):
+    """
+    校验请求中的导联参数（在读取文件之前），返回导联序号（int）、导联名称或派生导联（str），
+    空值返回 None（使用配置项 ANALYSIS_LEAD）。
+    """
+    if value is None or value == '':
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    if value in STANDARD_12_LEADS or value in DERIVED_LEADS:
+        return value
+    raise LeadSelectionError(
+        f"无法识别的导联: {value}，可用导联序号、标准12导联名称（{', '.join(STANDARD_12_LEADS)}）或 {', '.join(DERIVED_LEADS)}"
+    )
+
+
+def as_lead_matrix(val) -> np.ndarray:
+    """
+    把 .mat 中的 'val' 整理为 (导联数, 样本数) 的float32矩阵。
+    1×N 和 N×1 都是单导联；二维时较短的一维是导联（通常只有几个到十几个导联，样本数则成千上万）。
+    """
+    matrix = np.asarray(val, dtype=np.float32)
+    if matrix.ndim != 2:
+        return matrix.reshape(1, -1)
+    rows, cols = matrix.shape
+    return matrix if rows <= cols else matrix.T
+
+
+def lead_names(n_leads: int):
+    """12导联记录返回标准导联名称，其他导联数没有约定的名称，返回 None。"""
+    return list(STANDARD_12_LEADS) if n_leads == len(STANDARD_12_LEADS) else None
+
+
+def lead_index(lead, n_leads: int) -> int:
+    """把导联序号或标准导联名称转换为行号。"""
+    if isinstance(lead, str):
+        names = lead_names(n_leads)
+        if names is None:
+            raise LeadSelectionError(f"该记录有 {n_leads} 个导联，没有标准12导联名称，请使用导联序号 0-{n_leads - 1}")
+        return names.index(lead)
+    if not 0 <= lead < n_leads:
+        raise LeadSelectionError(f"导联序号 {lead} 超出范围，该记录有 {n_leads} 个导联（0-{n_leads - 1}）")
+    return lead
+
+
+class LeadSelection:
+    """
+    用于上游分析的导联：各导联的线性组合权重（单个导联即 one-hot 权重）。
+
+    重采样、归一化之类的线性运算与导联组合可以交换顺序，因此同一组权重既可以作用在原始信号上
+    （信号质量检查），也可以作用在重采样后的多导联矩阵上（得到发送给HeartVoice的信号）。
+    """
+
+    def __init__(self, weights: np.ndarray, label):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.label = label
+        nonzero = np.flatnonzero(self.weights)
+        # 选中的是单个导联时直接取那一行（视图），不做矩阵乘法
+        self.row = int(nonzero[0]) if len(nonzero) == 1 and self.weights[nonzero[0]] == 1 else None
+
+    def apply(self, leads: np.ndarray) -> np.ndarray:
+        """把 (导联数, 样本数) 的矩阵组合为一维信号。"""
+        if self.row is not None:
+            return leads[self.row]
+        return self.weights @ leads
+
+    def describe(self) -> dict:
+        return {'analysis_lead': self.label, 'weights': [round(float(w), 4) for w in self.weights]}
+
+
+def _principal_component(sample: np.ndarray, fs: int) -> np.ndarray:
+    """
+    各导联的第一主成分（单位向量），符号取使投影的最大偏移为正，即R波朝上。
+    在高通滤波（PCA_HIGHPASS_HZ）后的副本上拟合；样本不足3秒时只去均值。
+    """
+    centred = sample.astype(np.float64) - sample.mean(axis=1, dtype=np.float64)[:, None]
+    if centred.shape[1] > 3 * fs:
+        centred = sosfiltfilt(butter(4, PCA_HIGHPASS_HZ, 'highpass', fs=fs, output='sos'), centred, axis=1)
+    _, vectors = np.linalg.eigh(centred @ centred.T)
+    component = vectors[:, -1]
+    projection = component @ centred
+    if projection.size and -projection.min() > projection.max():
+        component = -component
+    return component
+
+
+def select_lead(sample: np.ndarray, lead, fs: int) -> LeadSelection:
+    """
+    根据请求的导联确定组合权重。
+
+    Args:
+        sample (np.array): (导联数, 样本数) 的原始信号，至少包含记录开头的 PCA_FIT_SECONDS 秒（如果记录有这么长）。
+        lead: parse_lead 的结果（序号、名称、'auto' 或 'pca'）。
+        fs (int): sample 的采样率。
+    """
+    n_leads = sample.shape[0]
+    if lead == 'auto':
+        lead = 'pca' if n_leads > 1 else 0
+    if lead == 'pca':
+        if n_leads == 1:
+            return LeadSelection(np.ones(1), 0)
+        return LeadSelection(_principal_component(sample[:, :PCA_FIT_SECONDS * fs], fs), 'pca')
+
+    index = lead_index(lead, n_leads)
+    weights = np.zeros(n_leads)
+    weights[index] = 1
+    return LeadSelection(weights, lead)
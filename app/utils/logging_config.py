@@ -0,0 +1,132 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+
+from app.config import LOG_DEBUG_SAMPLE_RATE, LOG_FORMAT, LOG_LEVEL, LOG_MAX_FIELD_CHARS, LOG_QUEUE_SIZE
+from app.utils.metrics import metrics
+
+# 本项目所有模块都使用 logging.getLogger(__name__)，挂在这个名字下面
+APP_LOGGER = 'app'
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    'ecg_log_records_dropped_total', "Log records dropped because the log queue was full.")
+
+# LogRecord 自带的属性；其余属性都是调用方通过 extra={...} 附加的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def truncate(value, limit: int = LOG_MAX_FIELD_CHARS):
+    """把字段截断到 limit 个字符；非字符串的对象先序列化为JSON。短的数字、布尔值等原样返回。"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if not isinstance(value, str):
+        try:
+            text = json.dumps(value, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            text = repr(value)
+        # 较小的 dict/list 原样保留，JSON输出中仍是结构化字段
+        return value if len(text) <= limit else f"{text[:limit]}...(truncated {len(text) - limit} chars)"
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}...(truncated {len(value) - limit} chars)"
+
+
+def _extra_fields(record) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行JSON：时间、级别、logger、消息，以及 extra 中的结构化字段（均已截断）。"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': truncate(record.getMessage()),
+        }
+        for key, value in _extra_fields(record).items():
+            entry[key] = truncate(value)
+        if record.exc_info:
+            entry['exc'] = truncate(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """本地开发用的单行文本格式，结构化字段以 key=value 附在消息后面。"""
+
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s %(name)s: %(message)s', datefmt='%H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f"{key}={truncate(value)}" for key, value in _extra_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+class DebugSampler(logging.Filter):
+    """DEBUG 记录按 rate 的比例采样，其余级别全部放行。"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把记录放进有界队列，格式化和输出都在 QueueListener 的后台线程里完成。
+    队列满时直接丢弃并计数，调用方（请求线程）永远不会等待日志 I/O。
+    """
+
+    def prepare(self, record):
+        # 同一进程内的线程队列不需要 pickle：只固定消息文本（参数可能在之后被修改），
+        # 不像父类那样在调用线程里完成整条记录的格式化
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging():
+    """
+    为 'app' logger 安装异步日志管道（可重复调用，只生效一次）。
+    不修改 root logger，gunicorn / werkzeug 自己的访问日志不受影响。
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+        logger = logging.getLogger(APP_LOGGER)
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        # 进程退出前把队列中剩余的记录输出完
+        atexit.register(_listener.stop)
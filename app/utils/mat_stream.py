@@ -0,0 +1,154 @@
+import shutil
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+# MAT v5 数据元素类型（见 MATLAB "MAT-File Format" 文档）
+MI_MATRIX = 14
+MI_COMPRESSED = 15
+_MI_DTYPES = {
+    1: 'i1', 2: 'u1', 3: 'i2', 4: 'u2', 5: 'i4', 6: 'u4',
+    7: 'f4', 9: 'f8', 12: 'i8', 13: 'u8',
+}
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class UnsupportedMatFileError(ValueError):
+    """该 .mat 文件无法被流式读取（例如 v7.3/HDF5、复数或稀疏矩阵）。"""
+
+
+def spool_to_disk(file_stream):
+    """
+    把上传的文件流按块拷贝到一个匿名临时文件中，内存占用与文件大小无关。
+    返回的临时文件在关闭（或被回收）后自动删除。
+    """
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(file_stream, spool, _COPY_BUFFER_SIZE)
+    spool.flush()
+    spool.seek(0)
+    return spool
+
+
+def _read_tag(f, endian):
+    """读取一个数据元素的标签，返回 (类型, 字节数, 是否为小元素格式)。"""
+    raw = f.read(8)
+    if len(raw) < 8:
+        return None
+    mdtype, nbytes = struct.unpack(endian + 'II', raw)
+    # 小元素格式：字节数存放在高16位，数据紧跟在4字节标签之后（回退到数据起点）
+    if mdtype >> 16:
+        f.seek(-4, 1)
+        return mdtype & 0xFFFF, mdtype >> 16, True
+    return mdtype, nbytes, False
+
+
+def _skip_element(f, nbytes, small):
+    f.seek(4 if small else nbytes + (-nbytes % 8), 1)
+
+
+def _inflate_to_disk(f, nbytes):
+    """把一个 miCOMPRESSED 元素分块解压到新的临时文件中。"""
+    inflated = tempfile.TemporaryFile()
+    decompressor = zlib.decompressobj()
+    remaining = nbytes
+    while remaining > 0:
+        chunk = f.read(min(_COPY_BUFFER_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        inflated.write(decompressor.decompress(chunk))
+    inflated.write(decompressor.flush())
+    inflated.flush()
+    inflated.seek(0)
+    return inflated
+
+
+def _map_matrix(f, var_name, endian):
+    """
+    解析文件 f 当前位置处的 miMATRIX 元素。
+    如果变量名匹配，返回指向实部数据的只读 memmap（形状为 MATLAB 的列主序矩阵），否则返回 None。
+    """
+    mdtype, nbytes, _ = _read_tag(f, endian)
+    if mdtype != MI_MATRIX:
+        return None
+    end = f.tell() + nbytes
+
+    # 1. 数组标志
+    _read_tag(f, endian)
+    flags, _ = struct.unpack(endian + 'II', f.read(8))
+    is_complex = bool(flags & 0x0800)
+
+    # 2. 维度
+    _, dims_nbytes, small = _read_tag(f, endian)
+    dims_raw = f.read(dims_nbytes)
+    _skip_padding(f, dims_nbytes, small)
+    shape = struct.unpack(endian + 'i' * (dims_nbytes // 4), dims_raw)
+
+    # 3. 变量名
+    _, name_nbytes, small = _read_tag(f, endian)
+    name = f.read(name_nbytes).decode('ascii', errors='replace')
+    _skip_padding(f, name_nbytes, small)
+    if name != var_name:
+        f.seek(end)
+        return None
+    if is_complex or (flags & 0xFF) == 5:  # 5 = mxSPARSE_CLASS
+        raise UnsupportedMatFileError(f"变量 '{var_name}' 是复数或稀疏矩阵，无法流式读取")
+
+    # 4. 实部数据：直接映射，不读入内存
+    data_type, data_nbytes, _ = _read_tag(f, endian)
+    if data_type not in _MI_DTYPES:
+        raise UnsupportedMatFileError(f"变量 '{var_name}' 的数据类型 {data_type} 不受支持")
+    offset = f.tell()
+    dtype = np.dtype(endian + _MI_DTYPES[data_type])
+    if data_nbytes != dtype.itemsize * int(np.prod(shape)):
+        raise UnsupportedMatFileError(f"变量 '{var_name}' 的数据长度与维度不一致")
+    return np.memmap(f, dtype=dtype, mode='r', offset=offset, shape=shape, order='F')
+
+
+def _skip_padding(f, nbytes, small):
+    if small:
+        f.seek(4 - nbytes, 1)
+    else:
+        f.seek(-nbytes % 8, 1)
+
+
+def map_mat_variable(f, var_name='val'):
+    """
+    在已落盘的 MAT v5 文件中查找变量 var_name，并以 memmap 的方式返回其数据。
+
+    对于压缩的变量（MATLAB 默认的 v7 格式），会先分块解压到临时文件再映射，
+    因此无论记录多长，常驻内存都只有固定大小的缓冲区。
+
+    Raises:
+        UnsupportedMatFileError: 文件不是 MAT v5 格式、变量不存在或数据布局不受支持。
+    """
+    f.seek(0)
+    header = f.read(128)
+    if len(header) < 128 or header[:10] == b'MATLAB 7.3':
+        raise UnsupportedMatFileError("仅支持 MAT v5/v7 格式的文件")
+    endian = '<' if header[126:128] == b'IM' else '>'
+
+    while True:
+        start = f.tell()
+        tag = _read_tag(f, endian)
+        if tag is None:
+            raise UnsupportedMatFileError(f"文件中未找到变量 '{var_name}'")
+        mdtype, nbytes, small = tag
+
+        if mdtype == MI_COMPRESSED:
+            inflated = _inflate_to_disk(f, nbytes)
+            matrix = _map_matrix(inflated, var_name, endian)
+            if matrix is not None:
+                return matrix
+            inflated.close()
+            f.seek(start + 8 + nbytes)
+        elif mdtype == MI_MATRIX:
+            f.seek(start)
+            matrix = _map_matrix(f, var_name, endian)
+            if matrix is not None:
+                return matrix
+            f.seek(start + 8 + nbytes)
+        else:
+            _skip_element(f, nbytes, small)
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import ContextDecorator
+
+from app.config import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时直方图分桶（秒）：覆盖从毫秒级的本地计算到分钟级的报告生成
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器。"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _render_samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class _Timer(ContextDecorator):
+    """Histogram.time() 的返回值：既可以作为 with 语句的上下文管理器，也可以作为函数装饰器。"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def _recreate_cm(self):
+        # 作为装饰器时每次调用使用独立的计时器，多线程和递归调用互不干扰
+        return _Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    分桶直方图。每次 observe 只做一次二分查找和一次加锁累加，
+    分桶计数不累积存储，输出时才换算成 Prometheus 要求的累积形式。
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # 标签值 -> [各分桶计数（最后一个是 +Inf）, 总和, 次数]
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """计时上下文管理器/装饰器：`with h.time(stage='x'):` 或 `@h.time(stage='x')`。"""
+        return _Timer(self, labels)
+
+    def _render_samples(self):
+        with self.lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内的指标登记表，输出 Prometheus 文本格式（0.0.4）。
+
+    - counter / histogram 在调用处累加；
+    - register_collector 登记在抓取时才执行的回调，用于把各组件已有的 stats()
+      （队列长度、会话数、缓存命中等）转换为 gauge/counter，平时没有任何开销。
+
+    每个 gunicorn worker 有自己的登记表，/metrics 返回的是处理该请求的 worker 的数据；
+    保存在共享 sqlite 中的数据（如会话数）在各 worker 上一致。
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """
+        collect() 返回 [(名称, 类型('gauge'/'counter'), 说明, [(标签字典, 数值), ...]), ...]。
+        单个回调出错不影响其余指标的输出。
+        """
+        with self.lock:
+            self.collectors.append(collect)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logger.exception("指标采集回调 %s 出错: %s", getattr(collect, '__name__', collect), e)
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# 全局共享的指标登记表
+metrics = MetricsRegistry()
+
+# 各处理阶段的耗时；阶段名见各调用处的 stage_timer(...)
+STAGE_SECONDS = metrics.histogram(
+    'ecg_stage_duration_seconds', "Duration of each processing stage.", ['stage'])
+# 上游（HeartVoice / GLM）每次HTTP尝试的耗时与错误
+UPSTREAM_REQUEST_SECONDS = metrics.histogram(
+    'ecg_upstream_request_duration_seconds', "Duration of each upstream HTTP attempt.", ['service', 'outcome'])
+UPSTREAM_ERRORS = metrics.counter(
+    'ecg_upstream_errors_total', "Upstream failures by kind (connection, timeout, http status, business error).",
+    ['service', 'kind'])
+# GLM 速率控制器的等待时间与拒绝次数
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram(
+    'ecg_glm_rate_limit_wait_seconds', "Time spent waiting for a GLM rate-limit slot.", ['priority'])
+RATE_LIMIT_REJECTIONS = metrics.counter(
+    'ecg_glm_rate_limit_rejections_total', "GLM requests rejected because no slot was available in time.", ['priority'])
+# HTTP 接口
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    'ecg_http_request_duration_seconds',
+    "Time from request start until the response is returned (for SSE, until the stream starts).",
+    ['endpoint', 'method', 'status'])
+
+
+def stage_timer(stage: str) -> _Timer:
+    """给一个处理阶段计时：`with stage_timer('resample'):` 或 `@stage_timer('heartvoice')`。"""
+    return STAGE_SECONDS.time(stage=stage)
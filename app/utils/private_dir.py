@@ -0,0 +1,43 @@
+import os
+import stat
+import tempfile
+
+
+class InsecureDirectoryError(RuntimeError):
+    """数据目录不是当前用户独占的目录（属主不对、权限过宽或是符号链接）。"""
+
+
+def default_data_dir() -> str:
+    """默认的数据目录：系统临时目录下按用户区分的子目录。"""
+    suffix = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f'ecg-app-{suffix}')
+
+
+def ensure_private_dir(path: str) -> str:
+    """
+    创建（或校验）只有当前用户可以访问的目录（0700）。
+
+    会话库中保存的波形等数据会被反序列化、按文件名引用，如果目录可被其他用户写入，
+    就可能被替换成恶意内容，因此已存在的目录必须是当前用户拥有、且组和其他用户没有任何权限的真实目录，
+    否则直接报错而不是继续使用。
+
+    Returns:
+        str: 目录的绝对路径。
+
+    Raises:
+        InsecureDirectoryError: 目录已存在但不满足上述条件。
+    """
+    path = os.path.abspath(path)
+    try:
+        os.makedirs(path, mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise InsecureDirectoryError(f"{path} 不是目录（或是符号链接）")
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise InsecureDirectoryError(f"{path} 不属于当前用户")
+        if info.st_mode & 0o077:
+            raise InsecureDirectoryError(f"{path} 的权限过宽（{stat.filemode(info.st_mode)}），应为 0700")
+    return path
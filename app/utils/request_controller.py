@@ -1,47 +1,187 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
 import time
-from collections import deque
-from threading import Lock
+from collections import namedtuple
+from contextlib import contextmanager
+from threading import Lock, local
+
+logger = logging.getLogger(__name__)
+
+# 优先级：交互式请求（/agent）可以预订未来的令牌，后台任务（报告生成）只能使用当前空闲的令牌，
+# 可有可无的请求（常见问题预热）还要再给下一个后台任务留出一个令牌
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_IDLE = 2
+
+# reserve() 的结果：granted 为是否预订成功；wait_seconds 为成功时需要等待的时间，
+# 或失败时预计多久之后可以重试；api_key 为本次请求应使用的密钥
+Reservation = namedtuple('Reservation', ['granted', 'wait_seconds', 'api_key'])
+
+
+class RateLimitExceeded(Exception):
+    """在允许的等待时间内无法获得请求槽位。retry_after 为预计可以重试的秒数。"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"请求过于频繁，请在约 {retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
 
 class RequestController:
     """
-    一个简单的、线程安全的速率控制器。
-    使用滑动窗口算法来确保在指定时间窗口内请求不会超过最大次数。
+    一个跨进程共享的令牌桶速率控制器。
+
+    每个 API 密钥对应一个容量为 max_requests、每 per_seconds 秒补满的令牌桶。
+    配置了 db_path 时，桶的状态保存在 sqlite 文件中并在 IMMEDIATE 事务里更新，
+    所以同一台机器上的所有 gunicorn worker 共享同一个全局速率；否则只在本进程内生效。
+
+    - reserve() 立即返回“预订成功 + 需要等待的时间”或“拒绝 + 预计可重试时间”，不会阻塞；
+    - 交互式请求可以预订未来的令牌，并且总会为它保留 interactive_reserve 个令牌，
+      后台请求只能使用超出保留部分的、当前可用的令牌，从而让 /agent 排在报告生成前面；
+    - 空闲优先级的请求同样只能使用当前可用的令牌，并且要多留一个给后台请求；
+    - 多个 API 密钥时，总是选择最早有令牌可用的那个密钥；
+    - wait_for_slot() / wait_for_slot_async() 分别提供阻塞和 asyncio 友好的等待方式。
     """
-    def __init__(self, max_requests: int, per_seconds: int):
+
+    def __init__(self, max_requests: int, per_seconds: int, api_keys=None, db_path=None, interactive_reserve=1):
         """
         初始化速率控制器。
         Args:
-            max_requests (int): 在时间窗口内允许的最大请求数。
+            max_requests (int): 每个密钥在时间窗口内允许的最大请求数（即令牌桶容量）。
             per_seconds (int): 时间窗口的长度（秒）。
+            api_keys (list): 可轮换使用的 API 密钥列表。
+            db_path (str): 共享状态的 sqlite 文件路径；为 None 时只在本进程内限流。
+            interactive_reserve (int): 为交互式请求保留、后台请求不能使用的令牌数。
         """
         self.max_requests = max_requests
         self.per_seconds = per_seconds
-        self.requests = deque()  # 使用双端队列存储最近的请求时间戳
+        self.rate = max_requests / per_seconds  # 每秒补充的令牌数
+        self.api_keys = list(api_keys or [None])
+        self.db_path = db_path
+        self.interactive_reserve = min(interactive_reserve, max_requests - 1)
+        # 桶以密钥的哈希命名，数据库中不保存密钥本身
+        self.bucket_names = [hashlib.sha256(str(key).encode()).hexdigest()[:16] for key in self.api_keys]
         self.lock = Lock()       # 使用锁来保证线程安全
+        self.buckets = {}        # 仅本进程模式下使用：桶名 -> (令牌数, 更新时间)
+        self.local = local()
+        if db_path:
+            with self._transaction() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+                )
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
-    def wait_for_slot(self):
+    @contextmanager
+    def _bucket_states(self):
         """
-        等待直到有一个可用的请求槽位。
+        以互斥的方式读取并回写所有桶的状态。
+        产出一个 {桶名: (令牌数, 更新时间)} 字典，调用方就地修改后自动保存。
         """
-        while True:
+        if not self.db_path:
             with self.lock:
-                current_time = time.time()
-
-                # 1. 移除时间窗口之外的旧时间戳
-                while self.requests and current_time - self.requests[0] > self.per_seconds:
-                    self.requests.popleft()
-
-                # 2. 检查当前窗口内的请求数是否已满
-                if len(self.requests) < self.max_requests:
-                    # 未满，记录当前请求时间戳并立即返回
-                    self.requests.append(current_time)
-                    print(f"[{time.strftime('%H:%M:%S')}] Request approved. Current count: {len(self.requests)}/{self.max_requests}")
-                    return
-
-                # 3. 已满，计算需要等待的时间
-                # 等待时间 = 最早的那个请求过期所需的时间
-                earliest_request_time = self.requests[0]
-                time_to_wait = self.per_seconds - (current_time - earliest_request_time)
-
-            print(f"[{time.strftime('%H:%M:%S')}] Rate limit reached. Waiting for {time_to_wait:.2f} seconds...")
-            time.sleep(time_to_wait)
\ No newline at end of file
+                yield self.buckets
+            return
+        with self._transaction() as conn:
+            placeholders = ','.join('?' * len(self.bucket_names))
+            states = {name: (tokens, updated) for name, tokens, updated in conn.execute(
+                f"SELECT name, tokens, updated_at FROM rate_buckets WHERE name IN ({placeholders})", self.bucket_names
+            )}
+            yield states
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                [(name, tokens, updated) for name, (tokens, updated) in states.items()]
+            )
+
+    def reserve(self, priority: int = PRIORITY_INTERACTIVE, max_wait: float = 0.0) -> Reservation:
+        """
+        尝试预订一个请求槽位，不阻塞。
+
+        Args:
+            priority: PRIORITY_INTERACTIVE、PRIORITY_BACKGROUND 或 PRIORITY_IDLE。
+            max_wait (float): 交互式请求愿意等待的最长时间（秒），在此之内可以预订未来的令牌。
+                后台和空闲请求总是只接受立即可用的令牌。
+
+        Returns:
+            Reservation: 成功时调用方需先等待 wait_seconds 再发出请求。
+        """
+        needed = 1.0
+        if priority != PRIORITY_INTERACTIVE:
+            needed += self.interactive_reserve
+            max_wait = 0.0
+        if priority == PRIORITY_IDLE:
+            needed = min(needed + 1.0, float(self.max_requests))
+        now = time.time()
+        with self._bucket_states() as states:
+            best = None
+            for key, name in zip(self.api_keys, self.bucket_names):
+                tokens, updated = states.get(name, (float(self.max_requests), now))
+                tokens = min(float(self.max_requests), tokens + (now - updated) * self.rate)
+                wait = max(0.0, (needed - tokens) / self.rate)
+                if best is None or wait < best[0]:
+                    best = (wait, key, name, tokens)
+
+            wait, key, name, tokens = best
+            if wait > max_wait:
+                return Reservation(False, wait, None)
+            # 令牌数可以暂时为负，表示已经被预订的未来令牌
+            states[name] = (tokens - 1.0, now)
+            return Reservation(True, wait, key)
+
+    def wait_for_slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        等待直到有一个可用的请求槽位，返回应使用的 API 密钥。
+
+        Raises:
+            RateLimitExceeded: 在 timeout 秒内无法获得槽位。
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = float('inf') if deadline is None else max(0.0, deadline - time.time())
+            reservation = self.reserve(priority, max_wait=remaining)
+            if reservation.granted:
+                if reservation.wait_seconds > 0:
+                    logger.info("Rate limit reached, waiting %.2f seconds", reservation.wait_seconds)
+                    time.sleep(reservation.wait_seconds)
+                return reservation.api_key
+            if reservation.wait_seconds > remaining:
+                raise RateLimitExceeded(reservation.wait_seconds)
+            time.sleep(reservation.wait_seconds)
+
+    async def wait_for_slot_async(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        wait_for_slot 的 asyncio 版本：等待期间让出事件循环，不占用线程。
+
+        reserve() 在共享模式下要取得 sqlite 写锁（最长可能等待 10 秒的 busy timeout），
+        因此放到线程池中执行，不阻塞事件循环。
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = float('inf') if deadline is None else max(0.0, deadline - time.time())
+            reservation = await asyncio.to_thread(self.reserve, priority, remaining)
+            if reservation.granted:
+                if reservation.wait_seconds > 0:
+                    await asyncio.sleep(reservation.wait_seconds)
+                return reservation.api_key
+            if reservation.wait_seconds > remaining:
+                raise RateLimitExceeded(reservation.wait_seconds)
+            await asyncio.sleep(reservation.wait_seconds)
@@ -0,0 +1,300 @@
+import math
+from collections import deque
+
+import numpy as np
+
+# 质量指标的判定阈值：(指标, 比较方向, 拒绝阈值, 警告阈值)。'max' 表示数值越大越差，'min' 表示越小越差
+_THRESHOLDS = [
+    ('flatline_ratio', 'max', 0.5, 0.1),
+    ('clipping_ratio', 'max', 0.2, 0.02),
+    ('snr_db', 'min', -5.0, 3.0),
+    ('kurtosis', 'min', 3.5, 4.5),  # 只有信噪比也很低时才拒绝，见 _KURTOSIS_REJECT_MAX_SNR_DB
+    ('mains_ratio', 'max', 0.8, 0.3),
+    ('baseline_wander', 'max', None, 1.0),  # 基线漂移可以被滤波消除，只提示不拒绝
+]
+_MESSAGES = {
+    'flatline_ratio': "信号中有大段平直（导联脱落或未接触皮肤）",
+    'clipping_ratio': "信号幅度频繁达到量程上限（饱和/削顶）",
+    'snr_db': "信噪比过低，高频噪声掩盖了心电波形",
+    'kurtosis': "波形缺少尖锐的QRS波群（噪声，或室颤/室速等宽大畸形的节律）",
+    'mains_ratio': "信号主要是工频干扰（50/60Hz）",
+    'baseline_wander': "基线漂移明显（呼吸或体动）",
+}
+# 平直窗口：1秒窗口的峰峰值低于典型窗口峰峰值的这个比例
+_FLAT_FRACTION = 0.02
+# 信噪比的频带（Hz）：心电主要能量所在频带，以及视为噪声的高频带（不含工频及其附近）
+_SIGNAL_BAND = (1, 40)
+_NOISE_FROM_HZ = 40
+_MAINS_HZ = (50, 60)
+_SNR_FLOOR_DB = -30.0
+# 峰度低本身不足以拒绝记录：室颤、室速没有尖锐的QRS波群，峰度同样很低，却正是最需要分析的记录。
+# 只有信噪比也低于这个值（即 snr_db 的警告阈值）时才把低峰度当作噪声拒绝，否则只提示
+_KURTOSIS_REJECT_MAX_SNR_DB = 3.0
+# 窗口峰峰值的对数直方图：每个数量级 _PTP_BINS_PER_DECADE 个桶（相对精度约1%），覆盖 1e-6 到 1e9，
+# 更小的值（含0）计入第0个桶。内存固定，长时间的实时流每次刷新报告的开销也不随时长增长
+_PTP_LOG_MIN, _PTP_LOG_MAX = -6, 9
+_PTP_BINS_PER_DECADE = 200
+_PTP_BIN_COUNT = (_PTP_LOG_MAX - _PTP_LOG_MIN) * _PTP_BINS_PER_DECADE + 1
+# 滑动窗口质量累加器把窗口分成的块数：实际覆盖的时长在窗口长度和多一块之间
+_WINDOW_BLOCKS = 10
+
+
+class SignalQualityError(ValueError):
+    """信号质量太差，无法得到有意义的分析结果。report 是 SignalQualityAccumulator.report() 的结果。"""
+
+    def __init__(self, report: dict):
+        reasons = '；'.join(reason['message'] for reason in report['reasons'] if reason['severity'] == 'reject')
+        super().__init__(f"信号质量不合格：{reasons}")
+        self.report = report
+
+    def __reduce__(self):
+        # 批量分析在子进程中抛出，需要能跨进程 pickle
+        return type(self), (self.report,)
+
+
+class SignalQualityAccumulator:
+    """
+    单遍、分块地计算心电信号质量指标，可以直接挂在分块读取/重采样的循环上，内存只与块大小有关。
+    逐窗口的统计量也只保存固定大小的累加量（峰峰值直方图、窗口均值的 Welford 累加），
+    report() 的开销与已处理的时长无关。
+
+    信号按1秒切成窗口后全部是向量化的逐窗口运算：
+    - flatline_ratio: （去趋势后）峰峰值接近0的窗口比例；
+    - clipping_ratio: 在全局最大/最小值上停留至少3个样本的平台样本比例（ADC饱和）；
+    - baseline_wander: 窗口均值的标准差 / 典型窗口峰峰值；
+    - snr_db: 逐窗口线性去趋势、加汉宁窗后的平均功率谱中，心电频带功率相对高频噪声（按白噪声外推到全频带）的比值；
+    - kurtosis: 去趋势后的峰度，QRS波群使正常心电的峰度远大于高斯噪声的3。
+    """
+
+    def __init__(self, fs: int):
+        self.fs = int(fs)
+        self.carry = np.empty(0, dtype=np.float64)
+        self.count = 0
+        self.ptp_histogram = np.zeros(_PTP_BIN_COUNT, dtype=np.int64)
+        # 窗口均值的 (窗口数, 均值, 离差平方和)
+        self.window_stats = (0, 0.0, 0.0)
+        self.m2 = self.m4 = 0.0
+        self.spectrum = np.zeros(self.fs // 2 + 1)
+        self.taper = np.hanning(self.fs)
+        self.ramp = np.arange(self.fs) - (self.fs - 1) / 2
+        # (全局极值, 该极值上的平台样本数)
+        self.high = (-np.inf, 0)
+        self.low = (np.inf, 0)
+
+    def update(self, chunk):
+        """加入一段连续的原始信号。不足1秒的尾部留到下一块。"""
+        block = np.concatenate((self.carry, np.asarray(chunk, dtype=np.float64).ravel()))
+        usable = len(block) - len(block) % self.fs
+        self.carry = block[usable:]
+        if usable:
+            self._update_windows(block[:usable].reshape(-1, self.fs))
+
+    def _update_windows(self, windows):
+        self.count += windows.size
+        means = windows.mean(axis=1)
+        self.window_stats = self._merge_window_means(self.window_stats, means)
+
+        # 逐窗口线性去趋势：去掉窗口内的基线漂移，峰度和频谱只反映心电波形本身与噪声
+        slopes = windows @ self.ramp / (self.ramp @ self.ramp)
+        centred = windows - means[:, None] - slopes[:, None] * self.ramp
+        self.ptp_histogram += np.bincount(self._ptp_bins(np.ptp(centred, axis=1)), minlength=_PTP_BIN_COUNT)
+        squared = np.square(centred)
+        self.m2 += float(squared.sum())
+        self.m4 += float(np.square(squared).sum())
+        self.spectrum += np.square(np.abs(np.fft.rfft(centred * self.taper, axis=1))).sum(axis=0)
+
+        flat = windows.ravel()
+        self.high = self._merge_extreme(self.high, flat, flat.max(), np.greater)
+        self.low = self._merge_extreme(self.low, flat, flat.min(), np.less)
+
+    def merge(self, other: 'SignalQualityAccumulator'):
+        """并入另一段（同采样率、不重叠的）信号的统计量。other 中不足1秒的尾部不会并入。"""
+        self.count += other.count
+        self.ptp_histogram += other.ptp_histogram
+        self.window_stats = self._combine_stats(self.window_stats, other.window_stats)
+        self.m2 += other.m2
+        self.m4 += other.m4
+        self.spectrum += other.spectrum
+        self.high = self._pick_extreme(self.high, other.high, np.greater)
+        self.low = self._pick_extreme(self.low, other.low, np.less)
+
+    @classmethod
+    def _merge_window_means(cls, stats, means):
+        """把一批窗口均值并入 (数量, 均值, 离差平方和)。"""
+        batch_mean = float(means.mean())
+        return cls._combine_stats(stats, (len(means), batch_mean, float(np.square(means - batch_mean).sum())))
+
+    @staticmethod
+    def _combine_stats(a, b):
+        """合并两组 (数量, 均值, 离差平方和)（Chan 等人的并行 Welford 合并）。"""
+        (count_a, mean_a, m2_a), (count_b, mean_b, m2_b) = a, b
+        total = count_a + count_b
+        if total == 0:
+            return a
+        delta = mean_b - mean_a
+        return total, mean_a + delta * count_b / total, m2_a + m2_b + delta ** 2 * count_a * count_b / total
+
+    @staticmethod
+    def _ptp_bins(values):
+        """峰峰值所在的直方图桶：第 k 个桶（k >= 1）的下边界为 10 ** (_PTP_LOG_MIN + (k - 1) / _PTP_BINS_PER_DECADE)。"""
+        floor = 10.0 ** _PTP_LOG_MIN
+        logs = np.log10(np.maximum(values, floor)) - _PTP_LOG_MIN
+        bins = np.floor(logs * _PTP_BINS_PER_DECADE).astype(np.int64) + 1
+        return np.where(values < floor, 0, np.minimum(bins, _PTP_BIN_COUNT - 1))
+
+    @staticmethod
+    def _bin_value(index):
+        """桶内的代表值（几何中点）；第0个桶视为0。"""
+        return 0.0 if index == 0 else 10.0 ** (_PTP_LOG_MIN + (index - 0.5) / _PTP_BINS_PER_DECADE)
+
+    def _typical_ptp(self, cumulative):
+        """典型窗口峰峰值：峰峰值的第90百分位数（由直方图估计）。"""
+        rank = 0.9 * (cumulative[-1] - 1)
+        return self._bin_value(int(np.searchsorted(cumulative, rank, side='right')))
+
+    def _flat_ratio(self, cumulative, typical):
+        """峰峰值不超过 _FLAT_FRACTION * typical 的窗口比例（按桶计，阈值所在的桶不计入）。"""
+        below = int(self._ptp_bins(np.asarray([_FLAT_FRACTION * typical]))[0])
+        return float(cumulative[below - 1] / cumulative[-1]) if below else 0.0
+
+    @staticmethod
+    def _merge_extreme(current, flat, value, better):
+        """统计停留在极值上至少3个连续样本的平台样本数，并与已有的全局极值合并。"""
+        at = flat == value
+        runs = at[:-2] & at[1:-1] & at[2:]
+        plateau = np.zeros_like(at)
+        for shift in range(3):
+            plateau[shift:len(at) - 2 + shift] |= runs
+        return SignalQualityAccumulator._pick_extreme(current, (value, int(plateau.sum())), better)
+
+    @staticmethod
+    def _pick_extreme(current, candidate, better):
+        """合并两组 (极值, 平台样本数)：取更极端的一组，极值相同时平台样本数相加。"""
+        if better(candidate[0], current[0]):
+            return candidate
+        if candidate[0] == current[0]:
+            return current[0], current[1] + candidate[1]
+        return current
+
+    def _snr_db(self):
+        freqs = np.fft.rfftfreq(self.fs, d=1.0 / self.fs)
+        noise = freqs > _NOISE_FROM_HZ
+        for mains in _MAINS_HZ:
+            noise &= np.abs(freqs - mains) > 1
+        band = (freqs >= _SIGNAL_BAND[0]) & (freqs <= _SIGNAL_BAND[1])
+        if noise.sum() < 3 or not band.any():
+            return None  # 采样率太低，没有可用的噪声频带
+        noise_density = self.spectrum[noise].mean()
+        if noise_density <= 0:
+            return None
+        signal_power = self.spectrum[band].sum() - noise_density * band.sum()
+        noise_power = noise_density * (len(freqs) - 1)
+        return max(_SNR_FLOOR_DB, 10 * np.log10(max(signal_power, 1e-12) / noise_power))
+
+    def _mains_ratio(self):
+        """工频（50/60Hz 及其 ±1Hz）附近的功率占总功率的比例。"""
+        total = self.spectrum[1:].sum()
+        if total <= 0:
+            return None
+        freqs = np.fft.rfftfreq(self.fs, d=1.0 / self.fs)
+        mains = np.zeros(len(freqs), dtype=bool)
+        for hz in _MAINS_HZ:
+            mains |= np.abs(freqs - hz) <= 1
+        return self.spectrum[mains].sum() / total
+
+    def metrics(self) -> dict:
+        """各项质量指标（记录不足1秒时为空字典）。"""
+        windows, _, mean_m2 = self.window_stats
+        if not windows:
+            return {}
+        cumulative = np.cumsum(self.ptp_histogram)
+        typical = self._typical_ptp(cumulative)
+        clipped = 0 if self.high[0] == self.low[0] else self.high[1] + self.low[1]
+        metrics = {
+            'duration_s': self.count / self.fs,
+            'flatline_ratio': self._flat_ratio(cumulative, typical) if typical > 0 else 1.0,
+            'clipping_ratio': clipped / self.count,
+            'baseline_wander': float(np.sqrt(mean_m2 / windows) / typical) if typical > 0 else None,
+            'snr_db': self._snr_db(),
+            'kurtosis': self.m4 / self.count / (self.m2 / self.count) ** 2 if self.m2 > 0 else None,
+            'mains_ratio': self._mains_ratio(),
+        }
+        return {k: (round(float(v), 3) if v is not None else None) for k, v in metrics.items()}
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: {'status': 'ok' | 'warn' | 'reject', 'metrics': {...}, 'reasons': [...]}。
+            每个原因包含 code、severity（'reject' 或 'warn'）、value、threshold 和中文说明 message。
+        """
+        metrics = self.metrics()
+        if not metrics:
+            reason = {'code': 'too_short', 'severity': 'reject', 'value': self.count + len(self.carry),
+                      'threshold': self.fs, 'message': "记录不足1秒"}
+            return {'status': 'reject', 'metrics': metrics, 'reasons': [reason]}
+
+        reasons = []
+        for name, direction, reject, warn in _THRESHOLDS:
+            value = metrics.get(name)
+            if value is None:
+                continue
+            if name == 'kurtosis' and not (metrics.get('snr_db') is not None
+                                           and metrics['snr_db'] < _KURTOSIS_REJECT_MAX_SNR_DB):
+                reject = None
+            for severity, threshold in (('reject', reject), ('warn', warn)):
+                if threshold is not None and (value >= threshold if direction == 'max' else value < threshold):
+                    reasons.append({'code': name, 'severity': severity, 'value': value,
+                                    'threshold': threshold, 'message': _MESSAGES[name]})
+                    break
+        severities = {reason['severity'] for reason in reasons}
+        status = 'reject' if 'reject' in severities else ('warn' if reasons else 'ok')
+        return {'status': status, 'metrics': metrics, 'reasons': reasons}
+
+
+class WindowedQualityAccumulator:
+    """
+    只统计最近 window_seconds 秒信号的质量累加器，接口与 SignalQualityAccumulator 相同（update / report）。
+
+    信号按块（窗口的 1/_WINDOW_BLOCKS）分别累加，整块过期后丢弃，report() 时合并仍在窗口内的各块，
+    因此内存和每次报告的开销都是固定的，实际覆盖的时长在 window_seconds 和多一块之间。
+    """
+
+    def __init__(self, fs: int, window_seconds: float, block_count: int = _WINDOW_BLOCKS):
+        self.fs = int(fs)
+        self.window = int(math.ceil(window_seconds)) * self.fs
+        self.block_size = max(1, math.ceil(window_seconds / block_count)) * self.fs
+        self.blocks = deque()  # 已经写满的块，最早的在前
+        self.current = SignalQualityAccumulator(self.fs)
+        self.current_size = 0
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk).ravel()
+        while len(chunk):
+            take = min(len(chunk), self.block_size - self.current_size)
+            self.current.update(chunk[:take])
+            self.current_size += take
+            chunk = chunk[take:]
+            if self.current_size == self.block_size:
+                # 块大小是整秒，写满时不会留下未处理的尾部
+                self.blocks.append(self.current)
+                self.current = SignalQualityAccumulator(self.fs)
+                self.current_size = 0
+            # 去掉最早的一块后仍能覆盖整个窗口时丢弃它
+            while self.blocks and (len(self.blocks) - 1) * self.block_size + self.current_size >= self.window:
+                self.blocks.popleft()
+
+    def report(self) -> dict:
+        merged = SignalQualityAccumulator(self.fs)
+        for block in (*self.blocks, self.current):
+            merged.merge(block)
+        merged.carry = self.current.carry
+        return merged.report()
+
+
+def assess_signal_quality(signal, fs: int, chunk_seconds: int = 600) -> dict:
+    """对一整段信号（ndarray 或 memmap）分块计算质量报告，见 SignalQualityAccumulator.report。"""
+    accumulator = SignalQualityAccumulator(fs)
+    chunk = chunk_seconds * int(fs)
+    for start in range(0, len(signal), chunk):
+        accumulator.update(signal[start:start + chunk])
+    return accumulator.report()
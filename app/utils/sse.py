@@ -0,0 +1,37 @@
+import json
+import threading
+
+from flask import Response, stream_with_context
+
+
+def sse_event(event: str, data) -> str:
+    """把一个事件编码为 Server-Sent Events 格式的文本。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events) -> Response:
+    """把事件生成器包装为 text/event-stream 响应（禁用代理缓冲，保证逐条送达）。"""
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+class ConnectionLimiter:
+    """限制本进程中同时打开的事件流数量（同步部署中每条事件流占用一个请求线程）。"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
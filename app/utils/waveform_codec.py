@@ -0,0 +1,58 @@
+import base64
+
+import numpy as np
+
+# 支持的波形编码：'json' 为旧的浮点数列表，其余为小端二进制（可再经base64嵌入JSON）
+WAVEFORM_ENCODINGS = ('json', 'int16', 'float16', 'float32')
+WAVEFORM_DTYPES = {
+    'int16': np.dtype('<i2'),
+    'float16': np.dtype('<f2'),
+    'float32': np.dtype('<f4'),
+}
+
+
+def waveform_to_bytes(waveform, encoding):
+    """
+    把波形编码为小端二进制。
+
+    Args:
+        waveform (np.array): 一维浮点波形，或 (导联数, 样本数) 的多导联波形（按行主序输出）。
+        encoding (str): 'int16'、'float16' 或 'float32'。
+
+    Returns:
+        一个元组 (bytes, scale)：解码时用 `数组 * scale` 还原原始数值。
+        int16 会按最大绝对值线性量化到 [-32767, 32767]，浮点编码的 scale 恒为 1.0。
+    """
+    if encoding not in WAVEFORM_DTYPES:
+        raise ValueError(f"不支持的波形编码: {encoding}")
+    waveform = np.asarray(waveform, dtype=np.float32)
+    if encoding != 'int16':
+        return waveform.astype(WAVEFORM_DTYPES[encoding], copy=False).tobytes(), 1.0
+
+    peak = float(np.max(np.abs(waveform))) if waveform.size else 0.0
+    scale = peak / 32767 if peak > 0 else 1.0
+    quantized = np.rint(waveform / np.float32(scale)).astype(WAVEFORM_DTYPES['int16'])
+    return quantized.tobytes(), scale
+
+
+def encode_waveform(waveform, encoding='json'):
+    """
+    把波形编码为可以直接放进JSON响应的对象。
+
+    'json' 返回浮点数列表（兼容旧客户端）；其余编码返回
+    {"encoding", "dtype", "scale", "length", "data"}，其中 data 为base64字符串。
+    多导联波形的 length 为每个导联的样本数，另附 "shape": [导联数, 样本数]，各导联共用同一个 scale。
+    """
+    if encoding == 'json':
+        return np.asarray(waveform).tolist()
+    data, scale = waveform_to_bytes(waveform, encoding)
+    encoded = {
+        'encoding': 'base64',
+        'dtype': WAVEFORM_DTYPES[encoding].str,
+        'scale': scale,
+        'length': int(np.shape(waveform)[-1]),
+        'data': base64.b64encode(data).decode('ascii'),
+    }
+    if np.ndim(waveform) == 2:
+        encoded['shape'] = list(np.shape(waveform))
+    return encoded
@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+
+from app.utils.data_processor import merge_stats
+
+
+class WaveformPyramid:
+    """
+    多分辨率的 min/max 包络金字塔，用于前端按视窗缩放播放波形。
+
+    第0层直接引用完整的重采样信号（可以是磁盘上的 memmap，不做拷贝），
+    第k层把每 factor**k 个样本压缩为一对 (min, max)。查询时选择能在 max_points
+    之内覆盖视窗的最精细层级，因此无论记录多长，单次响应的大小都是固定的。
+    """
+
+    def __init__(self, signal, sample_rate, factor=4, min_buckets=64, chunk_size=1 << 18):
+        """
+        Args:
+            signal (np.array): 完整的一维重采样信号（未归一化）。
+            sample_rate (int): signal 的采样率。
+            factor (int): 相邻层级之间的抽取倍数。
+            min_buckets (int): 最粗层级的包络点数下限，达到后停止继续构建。
+            chunk_size (int): 构建第1层时每次读取的样本数，决定构建时的峰值内存。
+        """
+        self.signal = signal
+        self.sample_rate = sample_rate
+        self.factor = factor
+        self.levels = []  # [(每点样本数, mins, maxs), ...]，按从细到粗排列
+
+        chunk_size -= chunk_size % factor
+        mins, maxs = [], []
+        stats = (0, 0.0, 0.0)
+        for start in range(0, len(signal), chunk_size):
+            chunk = np.asarray(signal[start:start + chunk_size], dtype=np.float32)
+            edges = np.arange(0, len(chunk), factor)
+            mins.append(np.minimum.reduceat(chunk, edges))
+            maxs.append(np.maximum.reduceat(chunk, edges))
+            stats = merge_stats(stats, chunk)
+        count, mean, m2 = stats
+        self.mean = mean
+        self.std = math.sqrt(m2 / count) if count else 0.0
+        if not mins:
+            return
+
+        level_min, level_max = np.concatenate(mins), np.concatenate(maxs)
+        samples_per_point = factor
+        self.levels.append((samples_per_point, level_min, level_max))
+        while len(level_min) > min_buckets:
+            edges = np.arange(0, len(level_min), factor)
+            level_min = np.minimum.reduceat(level_min, edges)
+            level_max = np.maximum.reduceat(level_max, edges)
+            samples_per_point *= factor
+            self.levels.append((samples_per_point, level_min, level_max))
+
+    def state(self) -> dict:
+        """除完整信号之外的全部状态（均为 numpy 数组），用于不经 pickle 的持久化。"""
+        state = {
+            'sample_rate': np.asarray(self.sample_rate),
+            'factor': np.asarray(self.factor),
+            'mean': np.asarray(self.mean, dtype=np.float64),
+            'std': np.asarray(self.std, dtype=np.float64),
+            'samples_per_point': np.asarray([level[0] for level in self.levels], dtype=np.int64),
+        }
+        for index, (_, mins, maxs) in enumerate(self.levels):
+            state[f'min{index}'], state[f'max{index}'] = mins, maxs
+        return state
+
+    @classmethod
+    def from_state(cls, signal, state):
+        """由 state() 的结果和（通常是 memmap 的）完整信号恢复金字塔，不重新扫描信号。"""
+        pyramid = cls.__new__(cls)
+        pyramid.signal = signal
+        pyramid.sample_rate = state['sample_rate'].item()
+        pyramid.factor = int(state['factor'])
+        pyramid.mean = float(state['mean'])
+        pyramid.std = float(state['std'])
+        pyramid.levels = [(int(spp), state[f'min{index}'], state[f'max{index}'])
+                          for index, spp in enumerate(state['samples_per_point'])]
+        return pyramid
+
+    @property
+    def duration(self):
+        """信号总时长（秒）。"""
+        return len(self.signal) / self.sample_rate
+
+    def _normalize(self, values):
+        values = np.asarray(values, dtype=np.float32)
+        return (values - np.float32(self.mean)) / np.float32(self.std + 1e-8)
+
+    def query(self, start=0.0, end=None, max_points=2000):
+        """
+        返回 [start, end) 秒范围内、点数不超过 max_points（至少为2）的归一化波形。
+        视窗很大而 max_points 很小、连最粗的层级都放不下时，在最粗层级上再合并相邻的包络点。
+
+        Returns:
+            dict: 若原始样本数不超过 max_points，kind 为 'raw' 并给出 values；
+            否则 kind 为 'minmax'，给出每个包络点的 min / max 以及 samples_per_point。
+        """
+        n = len(self.signal)
+        end = self.duration if end is None else end
+        first = min(max(int(start * self.sample_rate), 0), n)
+        last = min(max(math.ceil(end * self.sample_rate), first), n)
+
+        result = {
+            'start': first / self.sample_rate,
+            'end': last / self.sample_rate,
+            'sample_rate': self.sample_rate,
+        }
+        if last - first <= max_points or not self.levels:
+            result.update(kind='raw', level=0, samples_per_point=1,
+                          values=self._normalize(self.signal[first:last]))
+            return result
+
+        for level, (samples_per_point, mins, maxs) in enumerate(self.levels, start=1):
+            lo, hi = first // samples_per_point, -(-last // samples_per_point)
+            if 2 * (hi - lo) <= max_points or level == len(self.levels):
+                break
+        mins, maxs = mins[lo:hi], maxs[lo:hi]
+        # 最粗的层级仍然超过 max_points（max_points 很小）时，在它的基础上临时再合并相邻的包络点
+        group = -(-len(mins) // max(max_points // 2, 1))
+        if group > 1:
+            edges = np.arange(0, len(mins), group)
+            mins, maxs = np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+            samples_per_point *= group
+        result.update(kind='minmax', level=level, samples_per_point=samples_per_point,
+                      min=self._normalize(mins), max=self._normalize(maxs))
+        return result
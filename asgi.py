@@ -0,0 +1,6 @@
+from app.asgi import create_asgi_app
+
+# 异步服务模式的入口（需要安装 httpx 和一个 ASGI 服务器），例如：
+#   uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+# 同步部署仍使用 run.py / gunicorn run:app
+app = create_asgi_app()
@@ -0,0 +1,145 @@
+"""
+异步服务模式基准：在本地桩上游（benchmarks.stub_upstreams，固定延迟）前面分别启动
+同步部署（gunicorn，1 个 worker、--threads 个线程）和异步部署（uvicorn asgi:app，1 个 worker），
+同时发起大量 /agent 对话和 /analyze 上传，比较总耗时、请求延迟，
+以及负载期间一个轻量接口（/agent/router-stats）的探测延迟——同步部署的线程全部在等上游时，它也要排队。
+
+--rpm 设得较低时，请求会在GLM速率控制器中排队等待（最多 GLM_INTERACTIVE_MAX_WAIT_S 秒，超过返回 429），
+可以看到同步部署中等待配额的请求同样占满线程，连探测请求也要排到配额释放之后；
+异步部署则只让超时的对话返回 429，其余接口照常响应。
+
+用法（在项目根目录运行，需要 gunicorn、uvicorn 和 httpx）:
+    python -m benchmarks.bench_async_serving
+    python -m benchmarks.bench_async_serving --conversations 300 --threads 8 --latency 1.0
+    python -m benchmarks.bench_async_serving --rpm 150 --conversations 100
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.fixtures import mat_bytes
+from benchmarks.stub_upstreams import free_port, start_stub, wait_for_port
+
+# 意图路由识别不了的闲聊问题，每次对话都需要两次GLM调用（工具决策 + 回答）
+_PROMPT = "最近总是睡不好，白天也没精神，有什么建议吗？"
+
+
+async def _timed(client, method, url, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - started
+
+
+async def _ready_session(client, base) -> str:
+    response = await client.post(f"{base}/analyze", files={'file': ('setup.mat', mat_bytes(60, seed=10_000))})
+    response.raise_for_status()
+    session_id = response.json()['session_id']
+    while (await client.get(f"{base}/session-status/{session_id}")).json()['status'] != 'ready':
+        await asyncio.sleep(0.1)
+    return session_id
+
+
+async def _load(base, conversations, uploads):
+    # 压测端自己也用 httpx：按每 20 个连接分给一个客户端，避免 httpcore 在一个大连接池上的遍历开销算到服务端头上
+    clients = [httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=20))
+               for _ in range((conversations + uploads) // 20 + 2)]
+    try:
+        session_id = await _ready_session(clients[0], base)
+        files = [mat_bytes(60, seed) for seed in range(uploads)]
+        probes, done = [], asyncio.Event()
+
+        async def probe():
+            while not done.is_set():
+                probes.append((await _timed(clients[0], 'GET', f"{base}/agent/router-stats"))[1])
+                await asyncio.sleep(0.2)
+
+        prober = asyncio.ensure_future(probe())
+        started = time.perf_counter()
+        agent = [_timed(clients[1 + i % (len(clients) - 1)], 'POST', f"{base}/agent",
+                        json={'session_id': session_id, 'prompt': _PROMPT})
+                 for i in range(conversations)]
+        analyze = [_timed(clients[1 + (conversations + i) % (len(clients) - 1)], 'POST', f"{base}/analyze",
+                          files={'file': (f'{i}.mat', data)})
+                   for i, data in enumerate(files)]
+        results = await asyncio.gather(*agent, *analyze)
+        wall = time.perf_counter() - started
+        done.set()
+        await prober
+    finally:
+        for client in clients:
+            await client.aclose()
+    return results[:conversations], results[conversations:], wall, probes
+
+
+def _summary(name, results):
+    if not results:
+        return
+    seconds = np.array([s for _, s in results])
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"  {name:<8} p50 {np.median(seconds):6.2f}s  p95 {np.percentile(seconds, 95):6.2f}s  "
+          f"max {seconds.max():6.2f}s  status {dict(sorted(statuses.items(), key=str))}")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench_async_')
+    stub, stub_url = start_stub(args.latency)
+    modes = [
+        (f"sync: gunicorn, 1 worker x {args.threads} threads",
+         ['gunicorn', '-w', '1', '--threads', str(args.threads), '--timeout', '600', '--backlog', '4096', 'run:app']),
+        ("async: uvicorn asgi:app, 1 worker",
+         ['uvicorn', 'asgi:app', '--log-level', 'warning', '--backlog', '4096']),
+    ]
+    print(f"stub upstream latency {args.latency}s, GLM limit {args.rpm}/min, "
+          f"{args.conversations} concurrent /agent conversations (2 GLM calls each) + {args.uploads} /analyze uploads")
+    try:
+        for index, (name, cmd) in enumerate(modes):
+            port = free_port()
+            env = dict(
+                os.environ,
+                HEARTVOICE_API_URL=f"{stub_url}/HeartVoice",
+                GLM_API_URL=f"{stub_url}/glm",
+                ZHIPU_API_TOKEN='bench',
+                GLM_RPM_LIMIT=str(args.rpm),
+                SESSION_DB_PATH=os.path.join(workdir, f'sessions{index}.db'),
+                RATE_LIMIT_DB_PATH=os.path.join(workdir, f'rate{index}.db'),
+                REPORT_QUEUE_SIZE='100000',
+                LOG_LEVEL='WARNING',
+            )
+            bind = ['--bind', f'127.0.0.1:{port}'] if cmd[0] == 'gunicorn' else ['--host', '127.0.0.1', '--port', str(port)]
+            server = subprocess.Popen(cmd + bind, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for_port(server, port)
+            try:
+                agent, analyze, wall, probes = asyncio.run(_load(f"http://127.0.0.1:{port}", args.conversations, args.uploads))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name}: {wall:.2f}s total")
+            _summary('/agent', agent)
+            _summary('/analyze', analyze)
+            print(f"  probe    p50 {np.median(probes) * 1000:7.1f}ms  max {max(probes) * 1000:7.1f}ms")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8, help="同步部署的线程数")
+    parser.add_argument('--latency', type=float, default=0.5, help="桩上游每次请求的延迟（秒）")
+    parser.add_argument('--rpm', type=int, default=100000, help="GLM速率上限（每分钟请求数）")
+    args = parser.parse_args()
+    run(args)
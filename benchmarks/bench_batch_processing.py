@@ -0,0 +1,64 @@
+"""
+批量分析吞吐量基准：对比在当前进程中逐个解码/重采样 .mat 文件，与 /analyze/batch 使用的进程池。
+
+只测量信号处理部分（不调用HeartVoice）。进程池的加速比上限是CPU核数，单核机器上
+两者接近，进程池还要额外付出启动子进程和传回结果的开销。上传文件与 /analyze/batch 一样先落盘，
+工作进程只接收文件路径。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_batch_processing
+    python -m benchmarks.bench_batch_processing --files 32 --minutes 10 --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.io import savemat
+
+from app.services.processing_pool import process_ecg_file
+from benchmarks.bench_ecg_features import synthetic_ecg
+
+
+def _make_files(count, minutes):
+    workdir = tempfile.mkdtemp(prefix='bench_batch_')
+    files = []
+    for seed in range(count):
+        signal, _ = synthetic_ecg(minutes * 60, 72, 0.05, seed=seed)
+        path = os.path.join(workdir, f'{seed}.mat')
+        savemat(path, {'val': signal.astype(np.int16)[None, :]})
+        files.append(path)
+    return files
+
+
+def run(count, minutes, workers_list):
+    files = _make_files(count, minutes)
+    print(f"{count} files x {minutes} min, {os.cpu_count()} CPU(s)")
+    print(f"{'mode':>12} {'seconds':>9} {'files/s':>9} {'speedup':>8}")
+
+    start = time.perf_counter()
+    for data in files:
+        process_ecg_file(data)
+    serial = time.perf_counter() - start
+    print(f"{'serial':>12} {serial:>9.2f} {count / serial:>9.1f} {1.0:>8.2f}")
+
+    for workers in workers_list:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            # 先让每个子进程完成导入，测量的是稳定状态下的吞吐量
+            list(pool.map(process_ecg_file, files[:workers]))
+            start = time.perf_counter()
+            list(pool.map(process_ecg_file, files))
+            elapsed = time.perf_counter() - start
+        print(f"{f'pool x{workers}':>12} {elapsed:>9.2f} {count / elapsed:>9.1f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--minutes', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    run(args.files, args.minutes, args.workers)
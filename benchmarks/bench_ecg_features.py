@@ -0,0 +1,134 @@
+"""
+本地心电特征引擎基准：在合成心电上检验R峰检测与HRV指标的准确度，并测量吞吐量。
+
+合成信号由已知的RR序列（含LF/HF调制和随机变异）逐拍叠加高斯形的 P-QRS-T 波形，
+再加入基线漂移、工频干扰和白噪声，以原始采样率生成后走与 /analyze 相同的重采样路径。
+任何一个场景的准确度超出容差时以非零状态退出，可以直接用作回归检查。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_ecg_features
+    python -m benchmarks.bench_ecg_features --throughput-minutes 1 10 60 1440
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.config import ORIGINAL_SAMPLING_RATE, TARGET_SAMPLING_RATE
+from app.utils.data_processor import _resample_signal
+from app.utils.ecg_features import compute_ecg_features, detect_r_peaks
+
+# (名称, 时长秒, 平均心率, 噪声标准差, 极性)
+SCENARIOS = [
+    ("clean 60bpm 5min", 300, 60, 0.02, 1),
+    ("noisy 75bpm 5min", 300, 75, 0.10, 1),
+    ("inverted lead 70bpm", 300, 70, 0.05, -1),
+    ("short 30s 80bpm", 30, 80, 0.05, 1),
+    ("brady 45bpm 5min", 300, 45, 0.05, 1),
+    ("tachy 150bpm 5min", 300, 150, 0.05, 1),
+    ("long 80bpm 20min", 1200, 80, 0.05, 1),
+]
+# 检测灵敏度/阳性预测值下限，以及各指标允许的误差
+MIN_DETECTION = 0.995
+TOLERANCES = {'HR': ('abs', 1.0), 'SDNN': ('rel', 0.10), 'RMSSD': ('rel', 0.15), 'PNN_50': ('abs', 5.0)}
+# P, Q, R, S, T 波：(相对R峰的时刻秒, 幅度, 宽度秒)
+_WAVES = [(-0.2, 0.15, 0.025), (-0.03, -0.15, 0.01), (0.0, 1.0, 0.012), (0.03, -0.25, 0.01), (0.3, 0.3, 0.06)]
+
+
+def synthetic_ecg(duration, bpm, noise, polarity=1, fs=ORIGINAL_SAMPLING_RATE, seed=0):
+    """返回 (信号, R峰时刻（秒）)。"""
+    rng = np.random.default_rng(seed)
+    mean_rr = 60.0 / bpm
+    rr, t = [], 0.0
+    while t < duration:
+        # 0.1Hz 的LF调制 + 0.25Hz 的呼吸性HF调制 + 随机变异，幅度随心率缩放
+        interval = mean_rr * (1 + 0.04 * np.sin(2 * np.pi * 0.1 * t) + 0.03 * np.sin(2 * np.pi * 0.25 * t)
+                              + 0.015 * rng.standard_normal())
+        rr.append(interval)
+        t += interval
+    r_times = np.cumsum(rr) - rr[0] + 0.5
+    r_times = r_times[r_times < duration - 0.5]
+
+    time_axis = np.arange(int(duration * fs)) / fs
+    signal = np.zeros_like(time_axis)
+    for offset, amplitude, width in _WAVES:
+        # 每个波只在其中心附近 ±5 个宽度内计算，避免 O(样本数 × 心搏数)
+        half = int(5 * width * fs) + 1
+        centres = np.round((r_times + offset) * fs).astype(np.int64)
+        index = centres[:, None] + np.arange(-half, half + 1)
+        valid = (index >= 0) & (index < len(signal))
+        shape = amplitude * np.exp(-0.5 * np.square((index / fs - (r_times + offset)[:, None]) / width))
+        np.add.at(signal, index[valid], shape[valid])
+
+    signal *= polarity
+    signal += 0.2 * np.sin(2 * np.pi * 0.3 * time_axis) + 0.05 * np.sin(2 * np.pi * 50 * time_axis)
+    signal += noise * rng.standard_normal(len(signal))
+    return (signal * 1000).astype(np.float32), r_times
+
+
+def _reference_metrics(r_times):
+    rr = np.diff(r_times) * 1000
+    diffs = np.diff(rr)
+    return {
+        'HR': 60000 / rr.mean(),
+        'SDNN': rr.std(ddof=1),
+        'RMSSD': np.sqrt(np.mean(np.square(diffs))),
+        'PNN_50': 100 * np.mean(np.abs(diffs) > 50),
+    }
+
+
+def _detection_scores(found_times, r_times, tolerance=0.05):
+    """灵敏度与阳性预测值：检测到的峰与真实R峰在 ±tolerance 秒内一一匹配。"""
+    index = np.clip(np.searchsorted(r_times, found_times), 1, len(r_times) - 1)
+    nearest = np.minimum(np.abs(found_times - r_times[index - 1]), np.abs(found_times - r_times[index]))
+    matched = nearest <= tolerance
+    return min(matched.sum(), len(r_times)) / len(r_times), matched.mean() if len(found_times) else 0.0
+
+
+def run_accuracy():
+    ok = True
+    print(f"{'scenario':<22} {'sens':>6} {'ppv':>6} " + ' '.join(f"{k + ' ref/est':>20}" for k in TOLERANCES))
+    for seed, (name, duration, bpm, noise, polarity) in enumerate(SCENARIOS):
+        raw, r_times = synthetic_ecg(duration, bpm, noise, polarity, seed=seed)
+        signal = _resample_signal(raw)
+        sensitivity, ppv = _detection_scores(detect_r_peaks(signal) / TARGET_SAMPLING_RATE, r_times)
+        estimate = compute_ecg_features(signal)
+        estimate = {**estimate['Features'], **estimate['HRVIndex']}
+        reference = _reference_metrics(r_times)
+
+        cells, passed = [], sensitivity >= MIN_DETECTION and ppv >= MIN_DETECTION
+        for key, (kind, limit) in TOLERANCES.items():
+            error = abs(estimate[key] - reference[key])
+            if kind == 'rel':
+                error /= reference[key]
+            passed &= error <= limit
+            cells.append(f"{reference[key]:>9.2f}/{estimate[key]:<9.2f}")
+        ok &= passed
+        print(f"{name:<22} {sensitivity:>6.3f} {ppv:>6.3f} " + ' '.join(f"{c:>20}" for c in cells)
+              + ("" if passed else "  <-- FAIL"))
+    return ok
+
+
+def run_throughput(minutes_list, repeat):
+    print()
+    print(f"{'duration':>10} {'samples@100Hz':>14} {'features (ms)':>14} {'realtime factor':>16}")
+    for minutes in minutes_list:
+        raw, _ = synthetic_ecg(minutes * 60, 72, 0.05, seed=99)
+        signal = _resample_signal(raw)
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compute_ecg_features(signal)
+            best = min(best, time.perf_counter() - start)
+        print(f"{minutes:>8}min {len(signal):>14} {best * 1000:>14.1f} {minutes * 60 / best:>15.0f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--throughput-minutes', type=int, nargs='+', default=[1, 5, 30, 120])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    accurate = run_accuracy()
+    run_throughput(args.throughput_minutes, args.repeat)
+    sys.exit(0 if accurate else 1)
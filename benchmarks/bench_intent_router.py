@@ -0,0 +1,85 @@
+"""
+本地意图路由基准：在一组带标注的典型问题上统计命中率、误判数与单次路由耗时。
+
+每条样例标注了期望的指标键列表或工具名；期望为 None 的问题应回退到GLM（解释类问题、重置、闲聊等）。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_intent_router
+    python -m benchmarks.bench_intent_router --min-confidence 0.6 --repeat 200
+"""
+import argparse
+import time
+
+from app.config import INTENT_ROUTER_MIN_CONFIDENCE
+from app.toolkit.intent_router import IntentRouter
+
+SAMPLES = [
+    ("我的心率是多少？", ['HR']),
+    ("心率", ['HR']),
+    ("查一下我的脉搏", ['HR']),
+    ("What's my heart rate?", ['HR']),
+    ("show me my rmssd", ['RMSSD']),
+    ("我的HR和SDNN", ['HR', 'SDNN']),
+    ("心率变异性怎么样", ['HRV']),
+    ("帮我查一下压力值和疲劳", ['Pressure', 'Fatigue']),
+    ("LF/HF是多少", ['LF/HF']),
+    ("我的QTc", ['QTc']),
+    ("校正的QT间期", ['QTc']),
+    ("QRS宽度", ['QRS_duration']),
+    ("PR间期多少", ['PR_interval']),
+    ("我的情绪和活力值", ['Emotion', 'Vitality']),
+    ("pnn50和sdnn", ['PNN_50', 'SDNN']),
+    ("ST段形态", ['ST_form']),
+    ("我的心率正常吗？", None),
+    ("为什么我的压力这么高", None),
+    ("心率偏快需要去医院吗", None),
+    ("给我一份完整报告", 'tool_get_full_analysis_report'),
+    ("give me my full report", 'tool_get_full_analysis_report'),
+    ("心率报告", None),
+    ("重置会话", None),
+    ("心脏稳定吗", None),
+    ("最近睡眠不好怎么办", None),
+    ("hello", None),
+]
+
+
+def run(min_confidence, repeat):
+    router = IntentRouter(min_confidence=min_confidence)
+    router.route("预热")  # 首次调用会编译索引，不计入耗时
+
+    routed = correct = wrong = missed = 0
+    print(f"{'prompt':<24} {'expected':<22} {'routed':<22}")
+    for prompt, expected in SAMPLES:
+        intent = router.route(prompt)
+        result = intent and intent[1]
+        if result is not None:
+            routed += 1
+        if result == expected:
+            correct += 1
+        elif result is None:
+            missed += 1   # 本可以本地回答却回退到了GLM：只损失延迟
+        else:
+            wrong += 1    # 本地给出了错误的回答：需要避免
+        print(f"{prompt:<24} {str(expected):<22} {str(result):<22}")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for prompt, _ in SAMPLES:
+            router.route(prompt)
+    per_query_us = (time.perf_counter() - start) / (repeat * len(SAMPLES)) * 1e6
+
+    answerable = sum(1 for _, expected in SAMPLES if expected)
+    print()
+    print(f"samples: {len(SAMPLES)}  answerable locally: {answerable}")
+    print(f"routed locally: {routed}  correct: {correct}/{len(SAMPLES)}  wrong answers: {wrong}  missed: {missed}")
+    print(f"hit rate: {routed / len(SAMPLES):.1%}  (of answerable: {(routed - wrong) / answerable:.1%})")
+    print(f"routing latency: {per_query_us:.1f} us/query "
+          f"(each hit saves one rate-limited GLM request, >= 20 s of quota at 3 RPM)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-confidence', type=float, default=INTENT_ROUTER_MIN_CONFIDENCE)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+    run(args.min_confidence, args.repeat)
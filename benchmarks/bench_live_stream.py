@@ -0,0 +1,55 @@
+"""
+实时流基准：模拟设备每 --chunk-seconds 秒上传一段样本，测量每次追加（增量重采样 + 增量R峰检测 +
+滚动指标）的耗时随流的时长如何变化，并与“每来一段就把全部信号重新处理一遍”对比。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_live_stream
+    python -m benchmarks.bench_live_stream --minutes 120 --chunk-seconds 0.5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.config import ORIGINAL_SAMPLING_RATE
+from app.services.live_stream import LiveStream
+from app.utils.data_processor import _resample_signal
+from app.utils.ecg_features import compute_ecg_features
+from benchmarks.bench_ecg_features import synthetic_ecg
+
+
+def run(minutes, chunk_seconds, checkpoints):
+    raw, r_times = synthetic_ecg(minutes * 60, 72, 0.05, seed=3)
+    chunk = int(chunk_seconds * ORIGINAL_SAMPLING_RATE)
+    stream = LiveStream('bench', ORIGINAL_SAMPLING_RATE)
+    timings = []
+    for start in range(0, len(raw), chunk):
+        began = time.perf_counter()
+        snapshot = stream.append(raw[start:start + chunk])
+        timings.append(time.perf_counter() - began)
+    timings = np.array(timings)
+
+    print(f"{minutes} min stream, {chunk_seconds}s chunks, {len(timings)} appends")
+    print(f"{'elapsed':>9} {'append p50 (ms)':>16} {'append max (ms)':>16} {'full reprocess (ms)':>20}")
+    per_minute = int(60 / chunk_seconds)
+    for minute in checkpoints:
+        if minute > minutes:
+            continue
+        window = timings[max(0, (minute - 1) * per_minute):minute * per_minute]
+        began = time.perf_counter()
+        compute_ecg_features(_resample_signal(raw[:minute * 60 * ORIGINAL_SAMPLING_RATE]))
+        full = time.perf_counter() - began
+        print(f"{minute:>7}min {np.median(window) * 1000:>16.2f} {window.max() * 1000:>16.2f} {full * 1000:>20.1f}")
+
+    metrics = snapshot['metrics']
+    print(f"beats detected {snapshot['beats_detected']} / {len(r_times)} true, "
+          f"rolling HR {metrics['heart_rate']} bpm, SDNN {metrics['HRVIndex']['SDNN']} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=int, default=30)
+    parser.add_argument('--chunk-seconds', type=float, default=1.0)
+    parser.add_argument('--checkpoints', type=int, nargs='+', default=[1, 5, 15, 30, 60, 120])
+    args = parser.parse_args()
+    run(args.minutes, args.chunk_seconds, args.checkpoints)
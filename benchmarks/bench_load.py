@@ -0,0 +1,439 @@
+"""
+端到端负载基准：用 create_app 在当前进程中启动应用（werkzeug 多线程服务器），上游换成本地桩服务
+（benchmarks.stub_upstreams），以多个并发场景驱动 /analyze、/session-status 和 /agent，
+报告每个场景的 p50/p95/p99 延迟、吞吐量、状态码分布和峰值RSS。
+
+每次运行的结果连同 git 提交、机器信息和主要配置写入 benchmarks/results/<时间>_<提交>.json，
+并与同一目录中上一次的结果对比（或用 --compare 指定基线文件）。想长期追踪的基线可以提交到仓库。
+
+场景（--list 查看说明）：
+    analyze_short      并发上传 30 秒片段
+    analyze_long       上传 1 小时和 4 小时的记录
+    analyze_to_ready   上传后轮询 /session-status，直到AI报告生成
+    session_status     并发轮询已就绪会话的状态
+    agent_local        /agent 问题由意图路由在本地回答（不调用GLM，重复的问题命中回答缓存）
+    agent_glm          /agent 问题需要两次GLM调用（每个请求的问题都不同，不命中回答缓存）
+    agent_repeat       同一个需要GLM的问题反复提问，除第一次外命中回答缓存
+    upstream_errors    上游按 20% 的比例返回 503，分析和对话各一半
+    upstream_rate_limited  上游每分钟只放行 30 个请求（429 + Retry-After）
+    analyze_24h        上传一份 24 小时的记录（走流式读取，默认不运行）
+
+峰值RSS按场景采样本进程的常驻内存（含压测端自身，约几十MB的固定开销），只在 Linux 上可用；
+其他平台退化为整个进程生命周期内的峰值。常驻内存在场景结束后不一定回落，
+要单独比较某个场景的内存时，用 --scenarios 只运行它。
+
+用法（在项目根目录运行，桩服务需要 uvicorn）:
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --scenarios analyze_short agent_glm --requests 128 --concurrency 32
+    python -m benchmarks.bench_load --latency 0.5 --compare benchmarks/results/20261017-101500_b998690.json
+    ANALYSIS_MODE=async python -m benchmarks.bench_load --label async-analysis
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from benchmarks.stub_upstreams import free_port, start_stub
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# 意图路由能在本地回答的问题，和需要GLM（工具决策 + 回答）的问题
+_LOCAL_PROMPT = "我的心率是多少？"
+_GLM_PROMPT = "最近总是睡不好，白天也没精神，有什么建议吗？"
+
+# 结果中记录的配置项，便于解释不同运行之间的差异
+_RECORDED_CONFIG = ('ANALYSIS_MODE', 'RESAMPLE_METHOD', 'INGEST_MODE', 'SIGNAL_QUALITY_MODE', 'UPSTREAM_POOL_SIZE',
+                    'REPORT_WORKER_COUNT', 'INTENT_ROUTER_ENABLED', 'GLM_RPM_LIMIT')
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class PeakRss:
+    """在后台线程中采样常驻内存，记录 with 块内的峰值（MB）。"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, _rss_mb())
+
+    def __enter__(self):
+        self.peak_mb = _rss_mb()
+        if self.peak_mb is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.peak_mb is None:
+            # 没有 /proc：ru_maxrss 在 Linux 上以KB、在 macOS 上以字节为单位
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_mb = maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _rss_mb())
+
+
+class LoadContext:
+    """场景共用的工具：每个线程一个 requests.Session，以及修改桩服务配置、准备就绪会话的方法。"""
+
+    def __init__(self, base_url: str, stub_url: str, args):
+        self.base_url = base_url
+        self.stub_url = stub_url
+        self.args = args
+        self._local = threading.local()
+
+    def http(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def configure_stub(self, **config):
+        requests.post(f"{self.stub_url}/_config", json=config, timeout=5).raise_for_status()
+
+    def upload(self, name: str, data: bytes) -> requests.Response:
+        return self.http().post(f"{self.base_url}/analyze", files={'file': (name, data)}, timeout=600)
+
+    def wait_until_settled(self, session_id: str, timeout: float = 300) -> str:
+        """轮询 /session-status 直到报告生成结束，返回最终状态（ready / error / timeout）。"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self.http().get(f"{self.base_url}/session-status/{session_id}", timeout=30).json()['status']
+            if status != 'generating_report':
+                return status
+            time.sleep(self.args.poll_interval)
+        return 'timeout'
+
+    def ready_session(self, seed: int) -> str:
+        from benchmarks.fixtures import mat_bytes
+
+        response = self.upload(f'setup{seed}.mat', mat_bytes(30, seed))
+        response.raise_for_status()
+        session_id = response.json()['session_id']
+        if self.wait_until_settled(session_id) != 'ready':
+            raise RuntimeError(f"准备会话 {session_id} 失败")
+        return session_id
+
+    def agent(self, session_id: str, prompt: str):
+        response = self.http().post(f"{self.base_url}/agent", json={'session_id': session_id, 'prompt': prompt},
+                                    timeout=600)
+        return response.status_code
+
+
+# 每个场景完成准备工作（生成文件、建立会话、调整桩服务）后返回 (task, 请求数, 并发数)，
+# task(i) 发出第 i 个请求并返回状态码；只有 task 的执行计入耗时与内存峰值。
+# 各场景用不同的种子区间，避免命中前面场景留下的分析缓存。
+# benchmarks.fixtures 会导入 app.config，因此在设置好环境变量之后、在场景函数内部导入。
+
+def _upload_task(ctx, files):
+    def task(i):
+        return ctx.upload(f'{i}.mat', files[i]).status_code
+    return task
+
+
+def scenario_analyze_short(ctx, args):
+    from benchmarks.fixtures import mat_bytes
+
+    files = [mat_bytes(30, seed=1000 + i) for i in range(args.requests)]
+    return _upload_task(ctx, files), len(files), args.concurrency
+
+
+def scenario_analyze_long(ctx, args):
+    from benchmarks.fixtures import fixture_path
+
+    paths = [fixture_path(name, seed) for name in ('record_1h', 'record_4h') for seed in (1, 2)]
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append(f.read())
+    return _upload_task(ctx, files), len(files), min(args.concurrency, 2)
+
+
+def scenario_analyze_24h(ctx, args):
+    from benchmarks.fixtures import fixture_path
+
+    with open(fixture_path('record_24h', 1), 'rb') as f:
+        files = [f.read()]
+    return _upload_task(ctx, files), 1, 1
+
+
+def scenario_analyze_to_ready(ctx, args):
+    from benchmarks.fixtures import mat_bytes
+
+    files = [mat_bytes(30, seed=2000 + i) for i in range(args.requests)]
+
+    def task(i):
+        response = ctx.upload(f'{i}.mat', files[i])
+        if response.status_code != 200:
+            return response.status_code
+        status = ctx.wait_until_settled(response.json()['session_id'])
+        return response.status_code if status == 'ready' else f'report_{status}'
+    return task, len(files), args.concurrency
+
+
+def scenario_session_status(ctx, args):
+    session_ids = [ctx.ready_session(3000 + i) for i in range(8)]
+
+    def task(i):
+        return ctx.http().get(f"{ctx.base_url}/session-status/{session_ids[i % len(session_ids)]}", timeout=30).status_code
+    return task, args.requests * 10, args.concurrency
+
+
+def scenario_agent_local(ctx, args):
+    session_id = ctx.ready_session(4000)
+    return (lambda i: ctx.agent(session_id, _LOCAL_PROMPT)), args.requests * 4, args.concurrency
+
+
+def _glm_prompt(i: int) -> str:
+    """每个请求一个不同的问题，避免命中回答缓存。"""
+    return f"{_GLM_PROMPT}（第{i}次）"
+
+
+def scenario_agent_glm(ctx, args):
+    session_id = ctx.ready_session(4001)
+    return (lambda i: ctx.agent(session_id, _glm_prompt(i))), args.requests, args.concurrency
+
+
+def scenario_agent_repeat(ctx, args):
+    session_id = ctx.ready_session(4002)
+    return (lambda i: ctx.agent(session_id, _GLM_PROMPT)), args.requests * 4, args.concurrency
+
+
+def scenario_upstream_errors(ctx, args):
+    from benchmarks.fixtures import mat_bytes
+
+    session_id = ctx.ready_session(5000)
+    files = [mat_bytes(30, seed=5001 + i) for i in range(args.requests)]
+    ctx.configure_stub(error_rate=0.2)
+
+    def task(i):
+        if i % 2:
+            return ctx.agent(session_id, _glm_prompt(i))
+        return ctx.upload(f'{i}.mat', files[i]).status_code
+    return task, args.requests, args.concurrency
+
+
+def scenario_upstream_rate_limited(ctx, args):
+    session_id = ctx.ready_session(6000)
+    ctx.configure_stub(rpm=30)
+    return (lambda i: ctx.agent(session_id, _glm_prompt(i))), args.requests, args.concurrency
+
+
+SCENARIOS = {
+    'analyze_short': (scenario_analyze_short, "并发上传 30 秒片段"),
+    'analyze_long': (scenario_analyze_long, "上传 1 小时和 4 小时的记录（各两份，并发 2）"),
+    'analyze_to_ready': (scenario_analyze_to_ready, "上传后轮询 /session-status，直到AI报告生成"),
+    'session_status': (scenario_session_status, "并发轮询已就绪会话的状态"),
+    'agent_local': (scenario_agent_local, "/agent 问题由意图路由在本地回答"),
+    'agent_glm': (scenario_agent_glm, "/agent 问题需要两次GLM调用"),
+    'agent_repeat': (scenario_agent_repeat, "同一个需要GLM的问题反复提问（回答缓存）"),
+    'upstream_errors': (scenario_upstream_errors, "上游按 20% 的比例返回 503，分析和对话各一半"),
+    'upstream_rate_limited': (scenario_upstream_rate_limited, "GLM上游每分钟只放行 30 个请求"),
+    'analyze_24h': (scenario_analyze_24h, "上传一份 24 小时的记录（走流式读取）"),
+}
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != 'analyze_24h']
+
+
+def _run_task(task, count, concurrency):
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            status = task(i)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(count)))
+    return results, time.perf_counter() - started
+
+
+def _summarize(results, wall, concurrency, peak_rss_mb) -> dict:
+    millis = np.array([seconds for _, seconds in results]) * 1000
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(results) / wall, 2),
+        'p50_ms': round(float(np.percentile(millis, 50)), 1),
+        'p95_ms': round(float(np.percentile(millis, 95)), 1),
+        'p99_ms': round(float(np.percentile(millis, 99)), 1),
+        'max_ms': round(float(millis.max()), 1),
+        'statuses': dict(sorted(statuses.items())),
+        'peak_rss_mb': None if peak_rss_mb is None else round(peak_rss_mb, 1),
+    }
+
+
+def _print_summary(name, summary):
+    rss = '-' if summary['peak_rss_mb'] is None else f"{summary['peak_rss_mb']:.0f}"
+    print(f"{name:<22} {summary['requests']:>5} {summary['concurrency']:>4} {summary['throughput_rps']:>8.1f} "
+          f"{summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {rss:>7}  {summary['statuses']}",
+          flush=True)
+
+
+def _git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def _start_app(port):
+    """用 create_app 创建应用，在后台线程中以 werkzeug 多线程服务器运行。"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    # werkzeug 会为每个请求打印一行访问日志
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _previous_result(exclude):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(baseline_path, current):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    meta = baseline['meta']
+    print(f"\n与 {os.path.basename(baseline_path)}（{meta['commit']}{' dirty' if meta['dirty'] else ''}, "
+          f"{meta['timestamp']}）对比，正数表示变慢/变大：")
+    print(f"{'scenario':<22} {'req/s':>16} {'p50':>16} {'p95':>16} {'p99':>16} {'rss MB':>16}")
+
+    def delta(key, old, new, inverse=False):
+        if old.get(key) is None or new.get(key) is None or not old[key]:
+            return f"{'-':>16}"
+        change = (new[key] - old[key]) / old[key] * 100
+        return f"{new[key]:>8.1f} {(-change if inverse else change):>+6.0f}%"
+
+    for name, new in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            continue
+        print(f"{name:<22} {delta('throughput_rps', old, new, inverse=True)} {delta('p50_ms', old, new)} "
+              f"{delta('p95_ms', old, new)} {delta('p99_ms', old, new)} {delta('peak_rss_mb', old, new)}")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench_load_')
+    stub, stub_url = start_stub(args.latency)
+    port = free_port()
+
+    # app.config 在导入时读取环境变量，必须在导入 app 之前设置好
+    os.environ.update({
+        'HEARTVOICE_API_URL': f"{stub_url}/HeartVoice",
+        'GLM_API_URL': f"{stub_url}/glm",
+        'ZHIPU_API_TOKEN': 'bench',
+        'SESSION_DB_PATH': os.path.join(workdir, 'sessions.sqlite3'),
+        'RATE_LIMIT_DB_PATH': os.path.join(workdir, 'rate_limit.sqlite3'),
+    })
+    os.environ.setdefault('GLM_RPM_LIMIT', '100000')
+    os.environ.setdefault('REPORT_QUEUE_SIZE', '100000')
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+    try:
+        server = _start_app(port)
+        from app import config
+
+        commit, dirty = _git_revision()
+        result = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'label': args.label,
+                'commit': commit,
+                'dirty': dirty,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'args': {key: value for key, value in vars(args).items() if key not in ('compare', 'no_save')},
+                'config': {key: getattr(config, key) for key in _RECORDED_CONFIG},
+            },
+            'scenarios': {},
+        }
+        print(f"commit {commit}{' (dirty)' if dirty else ''}, {os.cpu_count()} CPU(s), "
+              f"stub latency {args.latency}s, poll interval {args.poll_interval}s")
+        print(f"{'scenario':<22} {'reqs':>5} {'conc':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'rss MB':>7}  statuses")
+
+        ctx = LoadContext(f"http://127.0.0.1:{port}", stub_url, args)
+        for name in args.scenarios:
+            ctx.configure_stub(latency=args.latency, error_rate=0.0, rpm=None)
+            task, count, concurrency = SCENARIOS[name][0](ctx, args)
+            with PeakRss() as rss:
+                results, wall = _run_task(task, count, concurrency)
+            result['scenarios'][name] = _summarize(results, wall, concurrency, rss.peak_mb)
+            _print_summary(name, result['scenarios'][name])
+        server.shutdown()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    path = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        suffix = f"_{args.label}" if args.label else ''
+        path = os.path.join(RESULTS_DIR, f"{stamp}_{commit}{suffix}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {os.path.relpath(path)}")
+
+    baseline = args.compare or _previous_result(exclude=path)
+    if baseline:
+        compare(baseline, result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument('--requests', type=int, default=64, help="每个场景的基本请求数（轮询类场景按倍数放大）")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.2, help="桩上游每次请求的延迟（秒）")
+    parser.add_argument('--poll-interval', type=float, default=0.2, help="等待报告时轮询 /session-status 的间隔（秒）")
+    parser.add_argument('--label', default='', help="附加在结果文件名和元数据中的标签，如 async-analysis")
+    parser.add_argument('--compare', help="作为基线的结果文件，默认取 results 目录中上一次的结果")
+    parser.add_argument('--no-save', action='store_true', help="不保存本次结果")
+    parser.add_argument('--list', action='store_true', help="列出场景后退出")
+    args = parser.parse_args()
+    if args.list:
+        for name, (_, description) in SCENARIOS.items():
+            print(f"{name:<22} {description}{'' if name in DEFAULT_SCENARIOS else '（默认不运行）'}")
+    else:
+        run(args)
@@ -0,0 +1,91 @@
+"""
+日志管道基准：对比同步输出（调用线程里格式化并写入）和异步队列管道在调用线程中的耗时。
+输出目标模拟为每次写入耗时 --sink-ms 毫秒的慢速 stdout（例如被日志采集器背压的管道），
+日志内容是带完整知识库系统提示的 GLM 请求体。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_logging
+    python -m benchmarks.bench_logging --calls 2000 --sink-ms 2
+"""
+import argparse
+import io
+import logging
+import pprint
+import queue
+import time
+
+import numpy as np
+
+from app.toolkit.prompt_compiler import AGENT_TOOLS_SCHEMA, agent_planning_messages, report_messages
+from app.utils.logging_config import JsonFormatter, NonBlockingQueueHandler
+
+
+class SlowSink(io.StringIO):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return len(text)
+
+
+def _payload():
+    analysis = {'Features': {f'F{i}': i * 1.5 for i in range(40)}, 'HRVIndex': {f'H{i}': i for i in range(40)}}
+    messages = report_messages(analysis) + agent_planning_messages("我的心率怎么样？")
+    return {'model': 'glm', 'messages': messages, 'tools': AGENT_TOOLS_SCHEMA}
+
+
+def _measure(log, calls):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        log()
+        timings.append(time.perf_counter() - started)
+    return np.array(timings) * 1e6
+
+
+def run(calls, sink_ms):
+    payload = _payload()
+    sink = SlowSink(sink_ms / 1000)
+    print(f"{calls} calls, payload {len(str(payload))} chars, sink {sink_ms} ms/write")
+    print(f"{'pipeline':<28} {'p50 (us)':>10} {'p99 (us)':>10} {'max (us)':>10}")
+
+    def report(name, timings):
+        print(f"{name:<28} {np.median(timings):>10.1f} {np.percentile(timings, 99):>10.1f} {timings.max():>10.1f}")
+
+    # 原来的做法：print + pprint 请求体
+    def old():
+        sink.write("GLM prompt ...\n")
+        sink.write(pprint.pformat(payload))
+    report("print + pprint (old)", _measure(old, calls))
+
+    sync_logger = logging.getLogger('bench.sync')
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter())
+    sync_logger.addHandler(handler)
+    report("sync JSON handler", _measure(lambda: sync_logger.info("GLM payload", extra={'payload': payload}), calls))
+
+    # 只测调用线程中的开销：队列不消费，用足够大的队列避免丢弃
+    async_logger = logging.getLogger('bench.async')
+    async_logger.propagate = False
+    async_logger.setLevel(logging.INFO)
+    async_logger.addHandler(NonBlockingQueueHandler(queue.Queue(maxsize=calls * 2)))
+    report("queue handler (new)", _measure(lambda: async_logger.info("GLM payload", extra={'payload': payload}), calls))
+
+    # 队列已满时直接丢弃，同样不阻塞
+    full_logger = logging.getLogger('bench.full')
+    full_logger.propagate = False
+    full_logger.setLevel(logging.INFO)
+    full_logger.addHandler(NonBlockingQueueHandler(queue.Queue(maxsize=1)))
+    report("queue handler, queue full", _measure(lambda: full_logger.info("GLM payload", extra={'payload': payload}), calls))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--sink-ms', type=float, default=1.0)
+    args = parser.parse_args()
+    run(args.calls, args.sink_ms)
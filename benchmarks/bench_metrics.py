@@ -0,0 +1,70 @@
+"""
+指标埋点开销基准：测量 Counter.inc、Histogram.observe、stage_timer（上下文管理器/装饰器）
+每次调用的耗时，以及 /metrics 输出的渲染耗时。埋点在请求路径上，每次应在微秒级。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_metrics
+    python -m benchmarks.bench_metrics --calls 500000
+"""
+import argparse
+import threading
+import time
+
+from app.utils.metrics import MetricsRegistry, stage_timer
+
+
+def _per_call(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def run(calls, threads):
+    registry = MetricsRegistry()
+    counter = registry.counter('bench_total', "bench", ['kind'])
+    histogram = registry.histogram('bench_seconds', "bench", ['stage'])
+
+    @stage_timer('bench_decorated')
+    def decorated():
+        pass
+
+    def timed():
+        with stage_timer('bench_with'):
+            pass
+
+    baseline = _per_call(lambda: None, calls)
+    cases = [
+        ("Counter.inc", lambda: counter.inc(kind='a')),
+        ("Histogram.observe", lambda: histogram.observe(0.0123, stage='a')),
+        ("with stage_timer(...)", timed),
+        ("@stage_timer(...)", decorated),
+    ]
+    print(f"{calls} calls each, empty-call baseline {baseline * 1e6:.3f} us subtracted")
+    for name, fn in cases:
+        print(f"{name:<24} {(_per_call(fn, calls) - baseline) * 1e6:>8.3f} us/call")
+
+    # 多线程同时 observe 同一个序列时的锁竞争
+    per_thread = calls // threads
+    workers = [threading.Thread(target=lambda: [histogram.observe(0.01, stage='b') for _ in range(per_thread)])
+               for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(f"{'observe, ' + str(threads) + ' threads':<24} {(time.perf_counter() - started) / (per_thread * threads) * 1e6:>8.3f} us/call")
+
+    for i in range(50):
+        histogram.observe(0.01, stage=f"s{i}")
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"render {len(text.splitlines())} lines: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+    run(args.calls, args.threads)
@@ -0,0 +1,42 @@
+"""
+重采样引擎微基准：对比多相滤波（polyphase）与旧的FFT路径在不同记录长度下的耗时。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_resample
+    python -m benchmarks.bench_resample --repeat 5 --lengths 9000 9001 1080000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.config import ORIGINAL_SAMPLING_RATE
+from app.utils.data_processor import _resample_signal
+
+# 默认长度覆盖：30秒、FFT不友好的质数长度、10分钟、1小时（采样率300Hz）
+DEFAULT_LENGTHS = [9000, 9001, 180000, 180007, 1080000, 1080013]
+
+
+def _time_once(signal, method):
+    start = time.perf_counter()
+    _resample_signal(signal, method=method)
+    return time.perf_counter() - start
+
+
+def run(lengths, repeat):
+    rng = np.random.default_rng(0)
+    print(f"{'samples':>10} {'duration':>9} {'fft (ms)':>10} {'poly (ms)':>10} {'speedup':>8}")
+    for n in lengths:
+        signal = rng.standard_normal(n).astype(np.float32)
+        fft_ms = min(_time_once(signal, 'fft') for _ in range(repeat)) * 1000
+        poly_ms = min(_time_once(signal, 'polyphase') for _ in range(repeat)) * 1000
+        duration = f"{n / ORIGINAL_SAMPLING_RATE:.0f}s"
+        print(f"{n:>10} {duration:>9} {fft_ms:>10.2f} {poly_ms:>10.2f} {fft_ms / poly_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=int, nargs='+', default=DEFAULT_LENGTHS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.lengths, args.repeat)
@@ -0,0 +1,71 @@
+"""
+信号质量预检基准：在合成的正常/异常记录上检验判定结果，并测量耗时。
+
+正常记录复用本地特征引擎基准的合成心电场景，异常记录覆盖全平直、导联半程脱落、纯噪声、
+工频干扰、强噪声心电、削顶和基线漂移；另有室颤、室速两种没有尖锐QRS波群的节律，
+它们峰度很低但信噪比正常，不能被拒绝。任何一条记录的判定与预期不符时以非零状态退出。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_signal_quality
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.config import ORIGINAL_SAMPLING_RATE
+from app.utils.signal_quality import assess_signal_quality
+from benchmarks.bench_ecg_features import SCENARIOS, synthetic_ecg
+
+FS = ORIGINAL_SAMPLING_RATE
+
+
+def _abnormal_cases():
+    """(名称, 信号, 允许的判定结果)。"""
+    rng = np.random.default_rng(0)
+    n = FS * 60
+    t = np.arange(n) / FS
+    ecg, _ = synthetic_ecg(60, 72, 0.05)
+    # 室颤：4~6Hz 频率和幅度都在漂移的不规则波；室速：180bpm 的宽大正弦样波群
+    vf_phase = 2 * np.pi * np.cumsum(5 + 0.8 * np.sin(2 * np.pi * 0.3 * t)) / FS
+    vf = 400 * (1 + 0.4 * np.sin(2 * np.pi * 0.15 * t)) * np.sin(vf_phase) + rng.normal(0, 10, n)
+    vt_phase = 2 * np.pi * 3 * t
+    vt = 800 * (np.sin(vt_phase) + 0.3 * np.sin(2 * vt_phase + 0.5)) + rng.normal(0, 10, n)
+    return [
+        ("flatline", np.full(n, 5.0), {'reject'}),
+        ("lead-off half way", np.concatenate([ecg[:n // 2], np.full(n - n // 2, ecg[n // 2])]), {'reject'}),
+        ("white noise", rng.normal(0, 300, n), {'reject'}),
+        ("mains only", 300 * np.sin(2 * np.pi * 50 * t), {'reject'}),
+        ("ecg + heavy noise", ecg + rng.normal(0, 400, n), {'reject'}),
+        ("ecg + moderate noise", ecg + rng.normal(0, 200, n), {'warn'}),
+        ("saturated ecg", np.clip(ecg * 4, -1500, 1500), {'warn', 'reject'}),
+        ("baseline wander", ecg + 3000 * np.sin(2 * np.pi * 0.2 * t), {'warn'}),
+        ("ventricular fibrillation", vf, {'ok', 'warn'}),
+        ("ventricular tachycardia", vt, {'ok', 'warn'}),
+    ]
+
+
+def run():
+    ok = True
+    print(f"{'record':<24} {'status':>7} {'flat':>6} {'clip':>6} {'wander':>7} {'snr dB':>7} {'kurt':>6} {'mains':>6} {'ms':>6}")
+    cases = [(name, synthetic_ecg(duration, bpm, noise, polarity, seed=seed)[0], {'ok', 'warn'})
+             for seed, (name, duration, bpm, noise, polarity) in enumerate(SCENARIOS)]
+    for name, signal, expected in cases + _abnormal_cases():
+        signal = np.asarray(signal, dtype=np.float32).astype(np.int16)
+        start = time.perf_counter()
+        report = assess_signal_quality(signal, FS)
+        elapsed = (time.perf_counter() - start) * 1000
+        m = report['metrics']
+        passed = report['status'] in expected
+        ok &= passed
+
+        def cell(key, width):
+            return f"{m[key]:>{width}.2f}" if m.get(key) is not None else f"{'-':>{width}}"
+        print(f"{name:<24} {report['status']:>7} {cell('flatline_ratio', 6)} {cell('clipping_ratio', 6)} "
+              f"{cell('baseline_wander', 7)} {cell('snr_db', 7)} {cell('kurtosis', 6)} {cell('mains_ratio', 6)} {elapsed:>6.1f}"
+              + ("" if passed else f"  <-- expected {'/'.join(sorted(expected))}"))
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
@@ -0,0 +1,61 @@
+"""
+播放波形编码基准：对比 /analyze 中各种波形编码的序列化耗时与负载大小。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_waveform_encoding
+    python -m benchmarks.bench_waveform_encoding --repeat 20
+"""
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+
+from app.config import PLAYBACK_DURATION_S, TARGET_SAMPLING_RATE
+from app.utils.waveform_codec import WAVEFORM_ENCODINGS, encode_waveform, waveform_to_bytes
+
+
+def _synthetic_waveform():
+    """生成一段与真实播放波形同尺寸的归一化信号。"""
+    n = TARGET_SAMPLING_RATE * PLAYBACK_DURATION_S
+    t = np.arange(n, dtype=np.float32) / TARGET_SAMPLING_RATE
+    rng = np.random.default_rng(0)
+    waveform = np.sin(2 * np.pi * 1.2 * t) ** 15 * 4 + rng.standard_normal(n).astype(np.float32) * 0.1
+    return ((waveform - waveform.mean()) / waveform.std()).astype(np.float32)
+
+
+def _best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def run(repeat):
+    waveform = _synthetic_waveform()
+    print(f"waveform: {len(waveform)} samples")
+    print(f"{'encoding':<18} {'serialize (ms)':>15} {'payload (KB)':>13} {'max abs error':>14}")
+
+    for encoding in WAVEFORM_ENCODINGS:
+        ms, body = _best_of(lambda: json.dumps({'waveform': encode_waveform(waveform, encoding)}), repeat)
+        decoded = json.loads(body)['waveform']
+        if encoding == 'json':
+            restored = np.asarray(decoded, dtype=np.float32)
+        else:
+            restored = np.frombuffer(base64.b64decode(decoded['data']), dtype=decoded['dtype']) * decoded['scale']
+        error = float(np.max(np.abs(restored - waveform)))
+        print(f"{'json/' + encoding:<18} {ms:>15.2f} {len(body) / 1024:>13.1f} {error:>14.2e}")
+
+    for encoding in WAVEFORM_ENCODINGS[1:]:
+        ms, (data, _) = _best_of(lambda: waveform_to_bytes(waveform, encoding), repeat)
+        print(f"{'raw/' + encoding:<18} {ms:>15.2f} {len(data) / 1024:>13.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    run(args.repeat)
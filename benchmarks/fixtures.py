@@ -0,0 +1,72 @@
+"""
+基准用的合成 .mat 心电文件（'val' 变量，int16，ORIGINAL_SAMPLING_RATE），从几十秒的片段到多小时的记录。
+
+较长的记录按小时分段生成后拼接（每段换一个随机种子），避免一次性为几万次心搏分配索引数组。
+生成过的文件缓存在 FIXTURE_DIR 中，重复运行基准时直接读取。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.fixtures              # 生成全部夹具并列出大小
+    python -m benchmarks.fixtures clip_30s record_4h
+"""
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+from scipy.io import savemat
+
+from app.config import ORIGINAL_SAMPLING_RATE
+from benchmarks.bench_ecg_features import synthetic_ecg
+
+FIXTURE_DIR = os.environ.get('BENCH_FIXTURE_DIR', os.path.join(tempfile.gettempdir(), 'ecg_bench_fixtures'))
+
+# 名称 -> 时长（秒）。record_24h 超过 STREAMING_INGEST_THRESHOLD_MB，会走流式读取
+FIXTURES = {
+    'clip_30s': 30,
+    'record_10min': 600,
+    'record_1h': 3600,
+    'record_4h': 4 * 3600,
+    'record_24h': 24 * 3600,
+}
+
+_SEGMENT_SECONDS = 3600
+
+
+def synthetic_signal(seconds: float, seed: int = 0) -> np.ndarray:
+    """返回 int16 的合成心电信号，心率随种子在 55~95 bpm 之间变化。"""
+    segments = []
+    remaining, index = seconds, 0
+    while remaining > 0:
+        duration = min(remaining, _SEGMENT_SECONDS)
+        segment_seed = seed * 1000 + index
+        signal, _ = synthetic_ecg(duration, 55 + segment_seed % 40, 0.05, seed=segment_seed)
+        segments.append(signal.astype(np.int16))
+        remaining -= duration
+        index += 1
+    return np.concatenate(segments)
+
+
+def mat_bytes(seconds: float, seed: int = 0) -> bytes:
+    """在内存中生成一个 .mat 文件；不同的种子得到不同的信号（不会命中分析缓存）。"""
+    buffer = io.BytesIO()
+    savemat(buffer, {'val': synthetic_signal(seconds, seed)[None, :]})
+    return buffer.getvalue()
+
+
+def fixture_path(name: str, seed: int = 0) -> str:
+    """返回 FIXTURES 中某个夹具的文件路径，不存在时先生成。"""
+    path = os.path.join(FIXTURE_DIR, f"{name}_{ORIGINAL_SAMPLING_RATE}hz_seed{seed}.mat")
+    if not os.path.exists(path):
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        # 先写临时文件再改名，并发运行的基准不会读到写了一半的文件
+        partial = f"{path}.{os.getpid()}.partial"
+        savemat(partial, {'val': synthetic_signal(FIXTURES[name], seed)[None, :]}, appendmat=False)
+        os.replace(partial, path)
+    return path
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or FIXTURES:
+        path = fixture_path(name)
+        print(f"{name:<14} {FIXTURES[name] / 3600:6.2f} h  {os.path.getsize(path) / 1e6:8.1f} MB  {path}")
@@ -0,0 +1,101 @@
+"""
+速率控制器压力测试：多个进程、多个线程同时争抢同一个 sqlite 令牌桶，
+验证任意时间窗口内的全局放行次数都不超过令牌桶允许的上限，并检查优先级与多密钥行为。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.stress_rate_limiter
+    python -m benchmarks.stress_rate_limiter --processes 8 --threads 4 --duration 6
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from app.utils.request_controller import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RequestController
+)
+
+
+def _worker(db_path, args, priority, results, start_barrier):
+    limiter = RequestController(args.limit, args.window, api_keys=args.keys, db_path=db_path)
+    grants = []
+    # 等所有进程都完成导入后再同时开始，避免启动耗时影响测试时长
+    start_barrier.wait()
+    stop_at = time.time() + args.duration
+
+    def hammer():
+        while time.time() < stop_at:
+            reservation = limiter.reserve(priority, max_wait=0.0)
+            if reservation.granted:
+                grants.append((time.time(), priority, reservation.api_key))
+            else:
+                time.sleep(min(reservation.wait_seconds, 0.01))
+
+    threads = [threading.Thread(target=hammer) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(grants)
+
+
+def _max_in_window(timestamps, window):
+    """任意长度为 window 的区间内的最大放行次数（双指针）。"""
+    best, left = 0, 0
+    for right, t in enumerate(timestamps):
+        while t - timestamps[left] > window:
+            left += 1
+        best = max(best, right - left + 1)
+    return best
+
+
+def run(args):
+    db_path = os.path.join(tempfile.mkdtemp(), 'rate_limit.sqlite3')
+    RequestController(args.limit, args.window, api_keys=args.keys, db_path=db_path)  # 建表
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_barrier = ctx.Barrier(args.processes)
+    procs = []
+    for i in range(args.processes):
+        priority = PRIORITY_BACKGROUND if i % 2 else PRIORITY_INTERACTIVE
+        procs.append(ctx.Process(target=_worker, args=(db_path, args, priority, results, start_barrier)))
+    for p in procs:
+        p.start()
+    grants = sorted(g for _ in procs for g in results.get())
+    for p in procs:
+        p.join()
+
+    rate = args.limit / args.window
+    failures = 0
+    print(f"{args.processes} processes x {args.threads} threads, {len(args.keys)} key(s), "
+          f"limit {args.limit}/{args.window}s per key, {len(grants)} grants")
+    for key in args.keys:
+        times = [t for t, _, k in grants if k == key]
+        for window in (args.window, args.window * 2, args.duration):
+            allowed = args.limit + rate * window
+            observed = _max_in_window(times, window)
+            ok = observed <= allowed + 1e-9
+            failures += not ok
+            print(f"  key={key} window={window:>5.2f}s max grants={observed:>4} allowed={allowed:>6.1f} {'OK' if ok else 'FAIL'}")
+
+    by_priority = {p: sum(1 for _, q, _ in grants if q == p) for p in (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)}
+    print(f"  grants by priority: interactive={by_priority[PRIORITY_INTERACTIVE]} background={by_priority[PRIORITY_BACKGROUND]}")
+    if failures:
+        raise SystemExit(f"{failures} window check(s) exceeded the configured rate")
+    print("global rate respected")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=4.0)
+    parser.add_argument('--keys', nargs='+', default=['key-a', 'key-b'])
+    run(parser.parse_args())
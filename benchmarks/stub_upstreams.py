@@ -0,0 +1,156 @@
+"""
+本地的 HeartVoice / GLM 桩服务（ASGI，需要 uvicorn），用可配置的延迟、错误率和速率上限模拟上游，供基准使用。
+
+- POST /HeartVoice: 等待 latency 秒后返回分析结果，心率随请求体变化（不同的信号得到不同的报告，不会全部命中报告缓存）；
+- POST /glm: 普通请求等待 latency 秒后返回一段回答（finish_reason=stop，不调用工具）；
+  stream=true 时先等待 latency 秒，再以SSE逐段返回几个文本增量；
+- error_rate: 按此比例返回 503（上游客户端会退避重试）；
+- rpm: 每个接口在滑动的 60 秒窗口内最多放行的请求数，超出返回 429 和 Retry-After；
+- POST /_config: 运行时修改上面三项，如 {"latency": 1.0, "error_rate": 0.1, "rpm": 30}；
+  GET /_stats 返回各接口的请求数与注入的错误数。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.stub_upstreams --port 9100 --latency 0.5
+    python -m benchmarks.stub_upstreams --port 9100 --latency 0.5 --error-rate 0.05 --rpm 120
+然后设置 HEARTVOICE_API_URL=http://127.0.0.1:9100/HeartVoice、GLM_API_URL=http://127.0.0.1:9100/glm。
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from collections import deque
+
+HEARTVOICE_DATA = {
+    'Features': {'HR': 72, 'RR': 833},
+    'HRVIndex': {'SDNN': 50, 'RMSSD': 40},
+    'HealthIndex': {'Pressure': 30, 'HRV': 60, 'Emotion': 70, 'Fatigue': 20, 'Vitality': 80},
+}
+_STREAM_DELTAS = ['心率', '与心率变异性', '均在正常范围。']
+_PATHS = ('/HeartVoice', '/glm')
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, data, status=200, headers=()):
+    body = json.dumps(data, ensure_ascii=False).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                            *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_stub_app(latency: float, error_rate: float = 0.0, rpm: int = None, seed: int = 0):
+    config = {'latency': latency, 'error_rate': error_rate, 'rpm': rpm}
+    rng = random.Random(seed)
+    windows = {path: deque() for path in _PATHS}
+    stats = {path: {'requests': 0, 'errors': 0, 'rate_limited': 0} for path in _PATHS}
+
+    def _retry_after(path):
+        """按滑动窗口放行；超出上限时返回需要等待的秒数。"""
+        if not config['rpm']:
+            return None
+        now = time.monotonic()
+        window = windows[path]
+        while window and window[0] <= now - 60:
+            window.popleft()
+        if len(window) >= config['rpm']:
+            return window[0] + 60 - now
+        window.append(now)
+        return None
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        path = scope['path']
+        body = await _read_body(receive)
+        request = json.loads(body or b'{}')
+        if path == '/_config':
+            config.update({key: request[key] for key in config if key in request})
+            return await _send_json(send, config)
+        if path == '/_stats':
+            return await _send_json(send, stats)
+        if path not in _PATHS:
+            return await _send_json(send, {'error': 'not found'}, 404)
+
+        stats[path]['requests'] += 1
+        wait = _retry_after(path)
+        if wait is not None:
+            stats[path]['rate_limited'] += 1
+            return await _send_json(send, {'error': 'rate limited'}, 429, [(b'retry-after', str(max(1, round(wait))).encode())])
+        await asyncio.sleep(config['latency'])
+        if rng.random() < config['error_rate']:
+            stats[path]['errors'] += 1
+            return await _send_json(send, {'error': 'injected failure'}, 503)
+
+        if path == '/HeartVoice':
+            heart_rate = 55 + zlib.crc32(body) % 50
+            data = {**HEARTVOICE_DATA, 'Features': {'HR': heart_rate, 'RR': round(60000 / heart_rate)}}
+            await _send_json(send, {'code': 200, 'msg': 'ok', 'data': data})
+        elif request.get('stream'):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/event-stream')]})
+            for delta in _STREAM_DELTAS:
+                chunk = {'choices': [{'delta': {'content': delta}}]}
+                await send({'type': 'http.response.body', 'body': f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode(),
+                            'more_body': True})
+                await asyncio.sleep(0.01)
+            await send({'type': 'http.response.body', 'body': b'data: [DONE]\n\n'})
+        else:
+            await _send_json(send, {'choices': [{'finish_reason': 'stop', 'message': {'content': ''.join(_STREAM_DELTAS)}}]})
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(process, port: int, timeout: float = 30):
+    """等待子进程开始在端口上监听；进程提前退出或超时时抛出 RuntimeError。"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程启动失败: {' '.join(process.args)}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"服务进程在 {timeout} 秒内没有开始监听: {' '.join(process.args)}")
+
+
+def start_stub(latency: float, error_rate: float = 0.0, rpm: int = None):
+    """在子进程中启动桩服务，返回 (进程, 基础URL)；调用方负责 terminate()。"""
+    port = free_port()
+    cmd = [sys.executable, '-m', 'benchmarks.stub_upstreams', '--port', str(port),
+           '--latency', str(latency), '--error-rate', str(error_rate)]
+    if rpm:
+        cmd += ['--rpm', str(rpm)]
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return wait_for_port(process, port), f"http://127.0.0.1:{port}"
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rpm', type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(args.latency, args.error_rate, args.rpm), host='127.0.0.1', port=args.port,
+                log_level='warning', backlog=4096)
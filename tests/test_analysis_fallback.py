@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pytest
+from scipy.io import savemat
+
+from app import create_app
+from app.api import analysis_routes
+from app.services.heartvoice import HeartVoiceError
+from benchmarks.bench_ecg_features import synthetic_ecg
+from benchmarks.fixtures import mat_bytes
+
+
+def _mat(bpm: int) -> bytes:
+    """心率为 bpm 的 60 秒合成记录。"""
+    buffer = io.BytesIO()
+    signal, _ = synthetic_ecg(60, bpm, 0.05)
+    savemat(buffer, {'val': signal.astype(np.int16)[None, :]})
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """HeartVoice 不可达时的测试客户端。"""
+    def unreachable(*args, **kwargs):
+        raise HeartVoiceError("上游不可用")
+    monkeypatch.setattr(analysis_routes, 'analyze_with_heartvoice', unreachable)
+    return create_app().test_client()
+
+
+@pytest.mark.parametrize('bpm', [220, 25])
+def test_unanalysable_record_without_upstream_is_503(client, bpm):
+    response = client.post('/analyze', data={'file': (io.BytesIO(_mat(bpm)), 'a.mat')})
+    assert response.status_code == 503
+    assert "HeartVoice" in response.get_json()['error']
+
+
+def test_batch_reports_unanalysable_record_per_file(client):
+    response = client.post('/analyze/batch', data={'files': [(io.BytesIO(_mat(220)), 'fast.mat'),
+                                                             (io.BytesIO(mat_bytes(60, seed=3)), 'normal.mat')]})
+    assert response.status_code == 207
+    fast, normal = response.get_json()['results']
+    assert "HeartVoice" in fast['error']
+    assert normal['analysis_source'] == 'local'
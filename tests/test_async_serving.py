@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('uvicorn')
+
+from benchmarks.bench_async_serving import _ready_session
+from benchmarks.fixtures import mat_bytes
+from benchmarks.stub_upstreams import _STREAM_DELTAS, free_port, start_stub, wait_for_port
+
+# 桩上游每次请求的固定延迟（秒）；意图路由识别不了的闲聊问题每次对话需要两次GLM调用
+_LATENCY = 0.3
+_CHAT_PROMPT = "最近总是睡不好，白天也没精神，有什么建议吗？"
+_METRIC_PROMPT = "我的心率是多少？"
+_STREAM_PROMPT = "最近总是熬夜，作息该怎么调整？"
+
+
+def _start_server(cmd, workdir, name, stub_url):
+    port = free_port()
+    env = dict(
+        os.environ,
+        HEARTVOICE_API_URL=f"{stub_url}/HeartVoice",
+        GLM_API_URL=f"{stub_url}/glm",
+        ZHIPU_API_TOKEN='test',
+        GLM_RPM_LIMIT='100000',
+        ECG_DATA_DIR=os.path.join(workdir, name),
+        SESSION_DB_PATH='',
+        RATE_LIMIT_DB_PATH='',
+        LOG_LEVEL='WARNING',
+    )
+    bind = ['--bind', f'127.0.0.1:{port}'] if cmd[0] == 'gunicorn' else ['--host', '127.0.0.1', '--port', str(port)]
+    server = subprocess.Popen(cmd + bind, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(server, port)
+    return server, f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture(scope='module')
+def servers(tmp_path_factory):
+    """桩上游前面的同步部署（gunicorn，1 个 worker、4 个线程）与异步部署（uvicorn asgi:app）。"""
+    if shutil.which('gunicorn') is None:
+        pytest.skip("需要 gunicorn")
+    workdir = str(tmp_path_factory.mktemp('serving'))
+    stub, stub_url = start_stub(_LATENCY)
+    processes = [stub]
+    try:
+        sync, sync_url = _start_server(['gunicorn', '-w', '1', '--threads', '4', '--timeout', '120', 'run:app'],
+                                       workdir, 'sync', stub_url)
+        processes.append(sync)
+        asgi, asgi_url = _start_server(['uvicorn', 'asgi:app', '--log-level', 'warning'], workdir, 'async', stub_url)
+        processes.append(asgi)
+        yield {'sync': sync_url, 'async': asgi_url}
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def _without_ids(body: dict) -> dict:
+    return {key: value for key, value in body.items() if key != 'session_id'}
+
+
+async def _exchange(base):
+    """在一个部署上依次完成上传、两种 /agent 对话和一次 /agent/stream，返回各响应的状态码与正文。"""
+    async with httpx.AsyncClient(timeout=60) as client:
+        upload = await client.post(f"{base}/analyze", files={'file': ('a.mat', mat_bytes(60, seed=1))})
+        session_id = await _ready_session(client, base)
+        replies = []
+        for prompt in (_METRIC_PROMPT, _CHAT_PROMPT):
+            response = await client.post(f"{base}/agent", json={'session_id': session_id, 'prompt': prompt})
+            replies.append((response.status_code, response.headers['content-type'], response.json()))
+        response = await client.post(f"{base}/agent/stream", json={'session_id': session_id, 'prompt': _STREAM_PROMPT})
+        events = [line for line in response.text.splitlines() if line.startswith('event:')]
+        # 桩上游的流式响应不带 charset、内容是未转义的中文，逐段文本必须原样到达
+        text = ''.join(json.loads(line[len('data:'):])['text'] for line, event in
+                       zip(response.text.splitlines()[1:], response.text.splitlines()) if event == 'event: delta')
+        missing = await client.post(f"{base}/agent", json={'session_id': 'missing', 'prompt': _CHAT_PROMPT})
+    return {
+        'upload': (upload.status_code, upload.headers['content-type'], _without_ids(upload.json())),
+        'agent': replies,
+        'stream': (response.status_code, response.headers['content-type'], events),
+        'stream_text': text,
+        'missing': (missing.status_code, missing.json()),
+    }
+
+
+def test_async_mode_matches_sync_responses(servers):
+    sync = asyncio.run(_exchange(servers['sync']))
+    asgi = asyncio.run(_exchange(servers['async']))
+    assert sync['upload'][0] == 200
+    assert json.dumps(asgi['upload'], sort_keys=True) == json.dumps(sync['upload'], sort_keys=True)
+    assert asgi['agent'] == sync['agent']
+    assert asgi['stream'] == sync['stream']
+    assert sync['stream_text'] == asgi['stream_text'] == ''.join(_STREAM_DELTAS)
+    assert asgi['missing'] == sync['missing']
+
+
+async def _conversations(base, count):
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=count + 5)) as client:
+        session_id = await _ready_session(client, base)
+        started = time.perf_counter()
+        # 每个问题都不同，不会命中回答缓存
+        responses = await asyncio.gather(*[
+            client.post(f"{base}/agent", json={'session_id': session_id, 'prompt': f"{_CHAT_PROMPT}（第{i}次）"})
+            for i in range(count)
+        ])
+        return [r.status_code for r in responses], time.perf_counter() - started
+
+
+def test_async_mode_serves_conversations_concurrently(servers):
+    count = 40
+    statuses, wall = asyncio.run(_conversations(servers['async'], count))
+    assert statuses == [200] * count
+    # 每次对话两次GLM调用；依次处理需要 count * 2 * _LATENCY 秒，并发时应接近一次对话的耗时
+    assert wall < count * 2 * _LATENCY / 4
+    sync_statuses, sync_wall = asyncio.run(_conversations(servers['sync'], count))
+    assert sync_statuses == [200] * count
+    # 同步部署受线程数（4）限制
+    assert wall < sync_wall / 2
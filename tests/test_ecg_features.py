@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_ecg_features import (
+    MIN_DETECTION,
+    SCENARIOS,
+    TOLERANCES,
+    _detection_scores,
+    _reference_metrics,
+    synthetic_ecg
+)
+from app.config import TARGET_SAMPLING_RATE
+from app.utils.data_processor import _resample_signal
+from app.utils.ecg_features import InsufficientBeatsError, compute_ecg_features, detect_r_peaks
+
+
+@pytest.fixture(params=list(enumerate(SCENARIOS)), ids=[scenario[0] for scenario in SCENARIOS])
+def scenario(request):
+    """与 /analyze 相同的重采样路径处理后的合成心电，以及真实的R峰时刻。"""
+    seed, (_, duration, bpm, noise, polarity) = request.param
+    raw, r_times = synthetic_ecg(duration, bpm, noise, polarity, seed=seed)
+    return _resample_signal(raw), r_times
+
+
+def test_r_peak_sensitivity_and_ppv(scenario):
+    signal, r_times = scenario
+    sensitivity, ppv = _detection_scores(detect_r_peaks(signal) / TARGET_SAMPLING_RATE, r_times)
+    assert sensitivity >= MIN_DETECTION
+    assert ppv >= MIN_DETECTION
+
+
+def test_hr_and_hrv_within_tolerance(scenario):
+    signal, r_times = scenario
+    estimate = compute_ecg_features(signal)
+    estimate = {**estimate['Features'], **estimate['HRVIndex']}
+    reference = _reference_metrics(r_times)
+    for key, (kind, limit) in TOLERANCES.items():
+        error = abs(estimate[key] - reference[key])
+        if kind == 'rel':
+            error /= reference[key]
+        assert error <= limit, (key, reference[key], estimate[key])
+
+
+def test_too_few_beats_is_rejected():
+    with pytest.raises(InsufficientBeatsError):
+        compute_ecg_features(np.zeros(5 * TARGET_SAMPLING_RATE, dtype=np.float32))
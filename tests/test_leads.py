@@ -0,0 +1,34 @@
+import numpy as np
+
+from benchmarks.fixtures import synthetic_signal
+from app.utils.leads import select_lead
+
+_FS = 300
+
+
+def _three_leads_with_wander(seconds=60):
+    """三个导联投影同一个心电向量（0.6 : 0.8 : 1.0）；第一个导联叠加了比QRS大数倍的呼吸基线漂移。"""
+    ecg = synthetic_signal(seconds, seed=3).astype(np.float64)
+    ecg -= ecg.mean()
+    t = np.arange(len(ecg)) / _FS
+    wander = 5 * np.ptp(ecg) * np.sin(2 * np.pi * 0.25 * t)
+    return np.stack([0.6 * ecg + wander, 0.8 * ecg, 1.0 * ecg]).astype(np.float32), ecg
+
+
+def test_auto_lead_follows_qrs_not_baseline_wander():
+    leads, ecg = _three_leads_with_wander()
+    selection = select_lead(leads, 'auto', _FS)
+    assert selection.label == 'pca'
+
+    expected = np.array([0.6, 0.8, 1.0]) / np.linalg.norm([0.6, 0.8, 1.0])
+    # 权重与心电向量同向（R波朝上），而不是落在漂移最大的第一个导联上
+    assert float(selection.weights @ expected) > 0.95
+    assert np.argmax(np.abs(selection.weights)) != 0
+
+
+def test_single_lead_and_explicit_lead_are_passthrough():
+    leads, _ = _three_leads_with_wander(10)
+    assert select_lead(leads[:1], 'auto', _FS).row == 0
+    selection = select_lead(leads, 2, _FS)
+    assert selection.row == 2
+    assert np.array_equal(selection.apply(leads), leads[2])
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+from benchmarks.stress_rate_limiter import _max_in_window, _worker
+from app.utils.request_controller import PRIORITY_INTERACTIVE, RequestController
+
+
+def _run_workers(db_path, processes, threads, limit, window, duration, keys):
+    """多个进程、每个进程多个线程同时争抢同一个 sqlite 令牌桶，返回按时间排序的全部放行记录。"""
+    args = argparse.Namespace(limit=limit, window=window, duration=duration, threads=threads, keys=keys)
+    RequestController(limit, window, api_keys=keys, db_path=db_path)  # 建表
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_barrier = ctx.Barrier(processes)
+    procs = [ctx.Process(target=_worker, args=(db_path, args, PRIORITY_INTERACTIVE, results, start_barrier))
+             for _ in range(processes)]
+    for p in procs:
+        p.start()
+    grants = sorted(g for _ in procs for g in results.get(timeout=60))
+    for p in procs:
+        p.join()
+    return grants
+
+
+def test_grants_never_exceed_limit_within_window_across_processes(tmp_path):
+    # 窗口远长于测试时长：整个测试期间补充的令牌不足一个，全局放行次数必须恰好是桶容量
+    grants = _run_workers(str(tmp_path / 'rate.sqlite3'), processes=4, threads=3,
+                          limit=5, window=60.0, duration=1.5, keys=['key-a'])
+    assert len(grants) == 5
+
+
+def test_sliding_window_rate_respected_across_processes(tmp_path):
+    limit, window, duration = 5, 1.0, 3.0
+    keys = ['key-a', 'key-b']
+    grants = _run_workers(str(tmp_path / 'rate.sqlite3'), processes=4, threads=3,
+                          limit=limit, window=window, duration=duration, keys=keys)
+    for key in keys:
+        times = [t for t, _, k in grants if k == key]
+        assert times, key
+        for span in (window / 2, window, duration):
+            # 令牌桶的上限：初始的满桶加上这段时间内补充的令牌
+            assert _max_in_window(times, span) <= limit + limit / window * span + 1e-9, (key, span)
+
+
+def test_wait_for_slot_async_does_not_block_event_loop(tmp_path):
+    db_path = str(tmp_path / 'rate.sqlite3')
+    limiter = RequestController(5, 60, db_path=db_path)
+
+    # 另一个连接持有写锁 0.5 秒，reserve() 在此期间阻塞在 sqlite 的 busy timeout 上
+    blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.5, blocker.execute, args=("COMMIT",)).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        started = time.monotonic()
+        api_key = await limiter.wait_for_slot_async(PRIORITY_INTERACTIVE, timeout=5)
+        elapsed = time.monotonic() - started
+        task.cancel()
+        return api_key, elapsed, ticks
+
+    api_key, elapsed, ticks = asyncio.run(main())
+    blocker.close()
+    assert api_key is None
+    assert elapsed >= 0.4
+    # 事件循环在等待写锁期间仍在运行：0.5 秒内 10 毫秒一次的计时器应跳动多次
+    assert ticks >= 20
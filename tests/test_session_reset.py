@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.services.report_scheduler import report_scheduler
+from app.state import SESSIONS
+
+
+@pytest.fixture
+def busy_workers():
+    """让报告调度器的全部工作线程都在执行任务，之后提交的任务只能排队。"""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def block(session_id):
+        started.release()
+        release.wait(10)
+
+    blockers = [f"blocker-{i}" for i in range(report_scheduler.worker_count)]
+    for session_id in blockers:
+        report_scheduler.submit(session_id, block)
+    for _ in blockers:
+        assert started.acquire(timeout=5)
+    yield release
+    release.set()
+
+
+def test_delete_cancels_queued_report(busy_workers):
+    ran = threading.Event()
+    SESSIONS.create('queued', {'status': 'generating_report', 'full_analysis': {}})
+    report_scheduler.submit('queued', lambda session_id: ran.set())
+    assert report_scheduler.position('queued')['position'] >= 1
+
+    client = create_app().test_client()
+    # 报告还在排队，/agent 拒绝问答，但会话仍然可以删除
+    assert client.post('/agent', json={'session_id': 'queued', 'prompt': '重置会话'}).status_code == 422
+    response = client.delete('/session/queued')
+    assert response.status_code == 200
+    assert response.get_json() == {'deleted': True, 'report_cancelled': True}
+    assert report_scheduler.position('queued') is None
+    assert 'queued' not in SESSIONS
+    assert client.delete('/session/queued').status_code == 404
+
+    # 工作线程空闲下来之后，被撤销的任务也不会执行
+    busy_workers.set()
+    deadline = time.time() + 5
+    while report_scheduler.stats()['running'] and time.time() < deadline:
+        time.sleep(0.05)
+    assert report_scheduler.stats()['running'] == 0
+    assert not ran.is_set()
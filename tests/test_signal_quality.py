@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.config import ORIGINAL_SAMPLING_RATE
+from app.services import live_stream
+from app.utils.signal_quality import SignalQualityAccumulator, WindowedQualityAccumulator, assess_signal_quality
+from benchmarks.bench_ecg_features import synthetic_ecg
+
+FS = ORIGINAL_SAMPLING_RATE
+
+
+def _ecg(seconds):
+    signal, _ = synthetic_ecg(seconds, 70, 0.05)
+    return signal.astype(np.int16)
+
+
+def _feed(accumulator, signal, chunk=1234):
+    for start in range(0, len(signal), chunk):
+        accumulator.update(signal[start:start + chunk])
+    return accumulator.report()
+
+
+def test_merged_blocks_match_single_pass():
+    signal = _ecg(300)
+    single = assess_signal_quality(signal, FS)
+    windowed = _feed(WindowedQualityAccumulator(FS, 600), signal)
+    assert windowed == single
+
+
+def test_window_forgets_problems_older_than_the_window():
+    signal = np.concatenate([np.full(600 * FS, 5.0), _ecg(600)])
+    assert _feed(SignalQualityAccumulator(FS), signal)['status'] == 'reject'
+    report = _feed(WindowedQualityAccumulator(FS, 600), signal)
+    assert report['status'] == 'ok'
+    assert 600 <= report['metrics']['duration_s'] < 660
+
+
+def test_live_stream_quality_covers_only_the_buffer(monkeypatch):
+    monkeypatch.setattr(live_stream, 'LIVE_STREAM_BUFFER_SECONDS', 120)
+    monkeypatch.setattr(live_stream, 'SIGNAL_QUALITY_MODE', 'reject')
+    stream = live_stream.LiveStream('test', FS)
+    stream.append(np.full(300 * FS, 5.0))
+    assert stream.snapshot()['signal_quality']['status'] == 'reject'
+    stream.append(_ecg(150))
+    assert stream.snapshot()['signal_quality']['status'] == 'ok'
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from app.utils.waveform_pyramid import WaveformPyramid
+
+
+@pytest.fixture(scope='module')
+def pyramid():
+    signal = np.random.default_rng(0).normal(size=100 * 3600).astype(np.float32)
+    return WaveformPyramid(signal, 100, factor=4)
+
+
+@pytest.mark.parametrize('max_points', [2, 3, 5, 64, 129, 2000])
+@pytest.mark.parametrize('window', [(0, None), (100, 200)])
+def test_query_never_exceeds_max_points(pyramid, max_points, window):
+    result = pyramid.query(*window, max_points=max_points)
+    points = len(result['values']) if result['kind'] == 'raw' else 2 * len(result['min'])
+    assert 0 < points <= max_points
+
+
+def test_coarsest_envelope_still_covers_the_signal(pyramid):
+    result = pyramid.query(max_points=2)
+    normalized = pyramid._normalize(pyramid.signal)
+    assert result['min'][0] == pytest.approx(normalized.min())
+    assert result['max'][0] == pytest.approx(normalized.max())